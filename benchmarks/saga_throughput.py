@@ -0,0 +1,340 @@
+import argparse
+import json
+import os
+import sys
+from contextlib import redirect_stdout
+from random import Random
+from threading import Event, Lock, Semaphore, Thread
+from time import perf_counter
+import psycopg2
+from initialize_messaging import initialize_messaging
+from messaging.in_process import InProcessTransport
+from messaging.publisher import Publisher
+from messaging.publisher_pool import PublisherPool
+from messaging.subscriber import run_subscription
+from orchestrated_saga.command_queues import (
+    initialize_command_queues,
+    initialize_response_queues,
+)
+from orchestrated_saga.connection_pool import ConnectionPool
+from orchestrated_saga.outbox_relay import OutboxRelay
+from orchestrated_saga.payload_stats import PayloadStats
+from orchestrated_saga.saga import Saga
+from orchestrated_saga.saga_dao import SagaDao
+from orchestrated_saga.saga_manager import SagaManager
+from orders_orchestrated import (
+    CreateOrderSaga,
+    create_command_response_handler,
+    get_command_response_saga_id,
+)
+from benchmarks.stand_ins import CountingConnection, InMemorySagaDao, RoundTripCounter
+
+PARTICIPANT_QUEUES = {
+    "payments_create_order_saga_commands": {"create_payment", "cancel_payment"},
+    "bookings_create_order_saga_commands": {"create_booking", "cancel_booking"},
+}
+
+
+def percentile(values: list[float], p: float):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, round(p / 100 * len(values)) - 1))]
+
+
+# Replies to saga commands like the payments and bookings services do,
+# failing create_booking for the orders listed in failing_orders.
+def create_participant_handler(
+    publisher: Publisher, commands: set[str], failing_orders: set[str]
+):
+    def participant_handler(command: dict, _key: str):
+        if command["name"] not in commands:
+            return
+
+        ok = not (
+            command["name"] == "create_booking"
+            and command["payload"]["id"] in failing_orders
+        )
+        publisher.publish(
+            command["reply_to"],
+            {
+                "saga_id": command["saga_id"],
+                "name": command["name"],
+                "ok": ok,
+                "member": command.get("member"),
+            },
+        )
+
+    return participant_handler
+
+
+def observe_saves(saga_dao: any, on_saved):
+    for name in ("create", "update"):
+
+        def observed(saga: Saga, method=getattr(saga_dao, name)):
+            result = method(saga)
+            on_saved(saga)
+            return result
+
+        setattr(saga_dao, name, observed)
+
+
+def run_benchmark(
+    sagas: int,
+    concurrency: int,
+    failure_rate: float,
+    seed: int,
+    workers: int,
+    unit_of_work: bool,
+    outbox: bool,
+    confirm: bool,
+    dsn: str | None,
+    timeout: float,
+    publishers: int = 1,
+):
+    random = Random(seed)
+    order_ids = [f"order-{seed}-{i}" for i in range(sagas)]
+    failing_orders = {id for id in order_ids if random.random() < failure_rate}
+
+    transport = InProcessTransport()
+    connection = transport.connect()
+    channel = connection.channel()
+    initialize_messaging(channel)
+    initialize_command_queues(channel, CreateOrderSaga)
+    response_queues = initialize_response_queues(channel, CreateOrderSaga)
+    connection.close()
+
+    ev_stopping = Event()
+    if publishers > 1:
+        publisher = PublisherPool(
+            ev_stopping,
+            size=publishers,
+            affinity="routing_key",
+            confirm=confirm,
+            transport=transport,
+        )
+    else:
+        publisher = Publisher(ev_stopping, confirm=confirm, transport=transport)
+    publisher.start()
+    participant_publisher = Publisher(ev_stopping, transport=transport)
+    participant_publisher.start()
+
+    saga_classes = {"CreateOrderSaga": CreateOrderSaga}
+    pool = None
+    if dsn:
+        round_trips = RoundTripCounter()
+        pool = ConnectionPool(
+            lambda: CountingConnection(psycopg2.connect(dsn), round_trips),
+            max_size=workers + 4,
+        )
+        saga_dao = SagaDao(pool, saga_classes)
+    else:
+        saga_dao = InMemorySagaDao(saga_classes)
+        round_trips = saga_dao.round_trips
+
+    lock = Lock()
+    started_at: dict[str, float] = {}
+    latencies: list[float] = []
+    statuses: dict[str, int] = {}
+    in_flight = Semaphore(concurrency)
+    ev_done = Event()
+
+    def on_saved(saga: Saga):
+        if saga.get_status() not in ("done", "failed"):
+            return
+
+        with lock:
+            order_id = saga.get_data()["id"]
+            if order_id not in started_at:
+                return
+            latencies.append(perf_counter() - started_at.pop(order_id))
+            statuses[saga.get_status()] = statuses.get(saga.get_status(), 0) + 1
+            if len(latencies) == sagas:
+                ev_done.set()
+        in_flight.release()
+
+    observe_saves(saga_dao, on_saved)
+
+    outbox_relay = None
+    if outbox:
+        outbox_relay = OutboxRelay(saga_dao, publisher, ev_stopping, poll_interval=0.01)
+        outbox_relay.start()
+
+    payload_stats = PayloadStats()
+    saga_manager = SagaManager(
+        saga_dao,
+        publisher,
+        unit_of_work=unit_of_work,
+        outbox_relay=outbox_relay,
+        payload_stats=payload_stats,
+    )
+
+    # One orchestrator consumes all the response shards with the workers
+    # split between them.
+    threads = [
+        Thread(
+            target=run_subscription,
+            args=[
+                queue_name,
+                create_command_response_handler(saga_manager),
+                ev_stopping,
+            ],
+            kwargs=dict(
+                workers=max(1, workers // len(response_queues)),
+                shard_key=get_command_response_saga_id,
+                prefetch_count=100,
+                ack_batch_size=20,
+                ack_batch_interval=0.01,
+                transport=transport,
+            ),
+        )
+        for queue_name in response_queues
+    ]
+    for queue_name, commands in PARTICIPANT_QUEUES.items():
+        threads.append(
+            Thread(
+                target=run_subscription,
+                args=[
+                    queue_name,
+                    create_participant_handler(
+                        participant_publisher, commands, failing_orders
+                    ),
+                    ev_stopping,
+                ],
+                kwargs=dict(transport=transport),
+            )
+        )
+    for thread in threads:
+        thread.start()
+
+    published_before = transport.broker.published
+    round_trips_before = round_trips.count
+    started = perf_counter()
+
+    for order_id in order_ids:
+        in_flight.acquire()
+        with lock:
+            started_at[order_id] = perf_counter()
+        saga_manager.start_saga(CreateOrderSaga, {"id": order_id, "color": "RESET"})
+
+    completed = ev_done.wait(timeout)
+    duration = perf_counter() - started
+    published = transport.broker.published - published_before
+    publisher_stats = publisher.stats()
+    round_trip_count = round_trips.count - round_trips_before
+
+    ev_stopping.set()
+    for thread in [*threads, publisher, participant_publisher]:
+        thread.join(5)
+    if outbox_relay:
+        outbox_relay.join(5)
+    if pool:
+        pool.close()
+
+    return {
+        "completed": completed,
+        "sagas": len(latencies),
+        "statuses": statuses,
+        "duration_s": duration,
+        "sagas_per_sec": len(latencies) / duration,
+        "latency_ms": {
+            "p50": percentile(latencies, 50) * 1000,
+            "p95": percentile(latencies, 95) * 1000,
+            "p99": percentile(latencies, 99) * 1000,
+            "max": max(latencies) * 1000,
+        }
+        if latencies
+        else None,
+        "db_round_trips_per_saga": round_trip_count / max(1, len(latencies)),
+        "messages_per_saga": published / max(1, len(latencies)),
+        "publish_queue": {
+            "max_depth": publisher_stats["max_queue_depth"],
+            "mean_flush_size": publisher_stats["flushed_messages"]
+            / max(1, publisher_stats["flushes"]),
+            "enqueue_wait_s": publisher_stats["enqueue_wait_s"],
+        },
+        "command_payload_bytes": {
+            name: stats["total_bytes"] / stats["count"]
+            for name, stats in payload_stats.stats().items()
+        },
+    }
+
+
+SCENARIOS = {"success": 0.0, "compensation": 1.0}
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description="End-to-end CreateOrderSaga throughput and latency benchmark"
+    )
+    arg_parser.add_argument("--sagas", type=int, default=1000)
+    arg_parser.add_argument("--concurrency", type=int, default=100)
+    arg_parser.add_argument(
+        "--scenario", choices=[*SCENARIOS, "mixed"], default="success"
+    )
+    arg_parser.add_argument(
+        "--failure-rate",
+        type=float,
+        default=0.1,
+        help="share of compensated sagas in the mixed scenario",
+    )
+    arg_parser.add_argument("--seed", type=int, default=1)
+    arg_parser.add_argument("--workers", type=int, default=4)
+    arg_parser.add_argument("--no-unit-of-work", action="store_true")
+    arg_parser.add_argument("--outbox", action="store_true")
+    arg_parser.add_argument("--confirm", action="store_true")
+    arg_parser.add_argument(
+        "--publishers", type=int, default=1, help="size of the orders publisher pool"
+    )
+    arg_parser.add_argument(
+        "--dsn", help="run against Postgres instead of the in-memory SagaDao"
+    )
+    arg_parser.add_argument("--timeout", type=float, default=120)
+    arg_parser.add_argument("--output", help="write the JSON result to a file")
+    args = arg_parser.parse_args()
+
+    config = {
+        "sagas": args.sagas,
+        "concurrency": args.concurrency,
+        "scenario": args.scenario,
+        "failure_rate": SCENARIOS.get(args.scenario, args.failure_rate),
+        "seed": args.seed,
+        "workers": args.workers,
+        "unit_of_work": not args.no_unit_of_work,
+        "outbox": args.outbox,
+        "confirm": args.confirm,
+        "publishers": args.publishers,
+        "database": "postgres" if args.dsn else "in-memory",
+        "transport": "in-process",
+    }
+
+    # The saga steps of the orders app print every order.
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        result = run_benchmark(
+            sagas=args.sagas,
+            concurrency=args.concurrency,
+            failure_rate=config["failure_rate"],
+            seed=args.seed,
+            workers=args.workers,
+            unit_of_work=config["unit_of_work"],
+            outbox=args.outbox,
+            confirm=args.confirm,
+            publishers=args.publishers,
+            dsn=args.dsn,
+            timeout=args.timeout,
+        )
+
+    output = json.dumps({"config": config, "result": result}, indent=2)
+
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(output + "\n")
+
+    print(output)
+
+    if not result["completed"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
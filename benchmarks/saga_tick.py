@@ -0,0 +1,80 @@
+import argparse
+import json
+from timeit import Timer
+from orchestrated_saga.saga import Saga, SagaAttributes
+from orchestrated_saga.step_builder import StepBuilder
+
+
+def noop(saga: Saga):
+    pass
+
+
+# Sequential saga: local, participant, participant, local.
+class BenchmarkSaga(Saga):
+    command_key = "benchmark_saga"
+    step_defs = [
+        StepBuilder().withAction(noop).withCompensation(noop).build(),
+        StepBuilder().withCommand(noop).withCompensation(noop).build(),
+        StepBuilder().withCommand(noop).build(),
+        StepBuilder().withAction(noop).build(),
+    ]
+    name = "BenchmarkSaga"
+
+
+# Ticks of a saga that completes all the steps.
+def run_success():
+    saga = BenchmarkSaga(SagaAttributes(data={}, current_step=0, status="pending"))
+    saga.tick()
+    saga.tick()
+    saga.tick_command_response(True)
+    saga.tick()
+    saga.tick_command_response(True)
+    saga.tick()
+    saga.tick()
+    return 7
+
+
+# Ticks of a saga whose second participant fails.
+def run_compensation():
+    saga = BenchmarkSaga(SagaAttributes(data={}, current_step=0, status="pending"))
+    saga.tick()
+    saga.tick()
+    saga.tick_command_response(True)
+    saga.tick()
+    saga.tick_command_response(False)
+    saga.tick()
+    saga.tick_command_response(True)
+    saga.tick()
+    saga.tick()
+    return 9
+
+
+def measure(scenario, runs: int, repeat: int):
+    ticks = scenario()
+    best = min(Timer(scenario).repeat(repeat=repeat, number=runs))
+    return {
+        "ticks_per_saga": ticks,
+        "ns_per_saga": best / runs * 1e9,
+        "ns_per_tick": best / runs / ticks * 1e9,
+    }
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Saga.tick() microbenchmark")
+    arg_parser.add_argument("--runs", type=int, default=100000)
+    arg_parser.add_argument("--repeat", type=int, default=5)
+    args = arg_parser.parse_args()
+
+    print(
+        json.dumps(
+            {
+                "success": measure(run_success, args.runs, args.repeat),
+                "compensation": measure(run_compensation, args.runs, args.repeat),
+            },
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
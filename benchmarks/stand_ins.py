@@ -0,0 +1,180 @@
+import json
+from contextlib import contextmanager
+from threading import Lock, local
+from uuid import uuid4
+from orchestrated_saga.saga import Saga, SagaAttributes
+
+
+# Wraps a psycopg2 connection and counts the statements and commits
+# sent to the server.
+class CountingConnection:
+    def __init__(self, connection: any, counter: "RoundTripCounter"):
+        self.connection = connection
+        self.counter = counter
+
+    def __getattr__(self, name: str):
+        return getattr(self.connection, name)
+
+    def cursor(self, *args, **kwargs):
+        return CountingCursor(self.connection.cursor(*args, **kwargs), self.counter)
+
+    def commit(self):
+        self.counter.add()
+        self.connection.commit()
+
+    def rollback(self):
+        self.counter.add()
+        self.connection.rollback()
+
+
+class CountingCursor:
+    def __init__(self, cursor: any, counter: "RoundTripCounter"):
+        self.cursor = cursor
+        self.counter = counter
+
+    def __getattr__(self, name: str):
+        return getattr(self.cursor, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return self.cursor.__exit__(*args)
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+    def execute(self, *args, **kwargs):
+        self.counter.add()
+        return self.cursor.execute(*args, **kwargs)
+
+
+class RoundTripCounter:
+    def __init__(self):
+        self.lock = Lock()
+        self.count = 0
+
+    def add(self):
+        with self.lock:
+            self.count += 1
+
+
+# Stand-in for SagaDao that keeps sagas and the outbox in memory. Every
+# statement and commit SagaDao would send counts as one round trip, and
+# saga data goes through json like it does in the database.
+class InMemorySagaDao:
+    def __init__(self, saga_classes: dict[str, type[Saga]]):
+        self.saga_classes = saga_classes
+        self.lock = Lock()
+        self.transaction_state = local()
+        self.sagas: dict[str, tuple[str, str, int, str, str, str | None, bool]] = {}
+        self.outbox: dict[int, tuple[str, str]] = {}
+        self.outbox_id = 0
+        self.round_trips = RoundTripCounter()
+
+    def generate_id(self):
+        return uuid4().hex
+
+    def in_transaction(self):
+        return getattr(self.transaction_state, "depth", 0) > 0
+
+    @contextmanager
+    def transaction(self):
+        depth = getattr(self.transaction_state, "depth", 0)
+        self.transaction_state.depth = depth + 1
+        try:
+            yield
+        finally:
+            self.transaction_state.depth = depth
+            if depth == 0:
+                self.round_trips.add()
+
+    def save(self, saga: Saga):
+        if not saga.get_id():
+            return self.create(saga)
+        return self.update(saga)
+
+    def create(self, saga: Saga):
+        if not saga.get_id():
+            saga.set_id(self.generate_id())
+        return self.write(saga)
+
+    def update(self, saga: Saga):
+        if not saga.get_dirty_attributes():
+            return saga
+        return self.write(saga)
+
+    def write(self, saga: Saga):
+        with self.transaction():
+            self.round_trips.add()
+            with self.lock:
+                self.sagas[saga.get_id()] = (
+                    saga.name,
+                    json.dumps(saga.get_data()),
+                    saga.get_current_step(),
+                    saga.get_status(),
+                    json.dumps(saga.get_step_results()),
+                    saga.get_awaited_command(),
+                    saga.get_awaited_compensation(),
+                )
+        saga.mark_clean()
+        return saga
+
+    # Sagas are not cached, they are always current.
+    def check_version(self, saga: Saga):
+        pass
+
+    def get_one_by_id(self, id: str):
+        with self.transaction():
+            self.round_trips.add()
+            with self.lock:
+                record = self.sagas.get(id)
+
+        if record == None:
+            return None
+
+        (
+            name,
+            data,
+            current_step,
+            status,
+            step_results,
+            awaited_command,
+            awaited_compensation,
+        ) = record
+        return self.saga_classes.get(name, Saga)(
+            SagaAttributes(
+                id=id,
+                data=json.loads(data),
+                current_step=current_step,
+                status=status,
+                step_results=json.loads(step_results),
+                awaited_command=awaited_command,
+                awaited_compensation=awaited_compensation,
+            )
+        )
+
+    def add_outbox_messages(self, messages: list[tuple[str, dict]]):
+        with self.transaction():
+            self.round_trips.add()
+            with self.lock:
+                for key, payload in messages:
+                    self.outbox_id += 1
+                    self.outbox[self.outbox_id] = (key, json.dumps(payload))
+
+    def get_outbox_messages(self, limit: int):
+        with self.transaction():
+            self.round_trips.add()
+            with self.lock:
+                ids = sorted(self.outbox)[:limit]
+                return [
+                    (id, self.outbox[id][0], json.loads(self.outbox[id][1]))
+                    for id in ids
+                ]
+
+    def delete_outbox_messages(self, ids: list[int]):
+        with self.transaction():
+            self.round_trips.add()
+            with self.lock:
+                for id in ids:
+                    self.outbox.pop(id, None)
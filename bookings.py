@@ -1,5 +1,4 @@
 import argparse
-import json
 import signal
 from threading import Event
 from colorama import init as init_colorama
@@ -35,9 +34,8 @@ def print_booking(booking: Booking):
 def create_payment_created_handler(
     publisher: Publisher, bookings: dict[str, Booking], ev_should_fail: Event
 ):
-    def payment_created_handler(body: bytes, _):
+    def payment_created_handler(payment: dict, _):
         # create booking
-        payment = json.loads(body)
         booking = Booking(
             generate_id(),
             payment["order_id"],
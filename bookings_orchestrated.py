@@ -1,13 +1,13 @@
 import argparse
-import json
 import signal
 from threading import Event
 from colorama import init as init_colorama
 from pika.adapters.blocking_connection import BlockingConnection
 from pika.connection import ConnectionParameters
 from initialize_messaging import initialize_messaging
-from messaging import Publisher, create_subscription_thread
+from messaging import MessageDeduplicator, Publisher, create_subscription_thread
 from orchestrated_saga.command import Command
+from orchestrated_saga.command_queues import initialize_command_queue
 from orchestrated_saga.command_response import CommandResponse
 from utils import colored, generate_id
 
@@ -37,7 +37,9 @@ def handle_create_booking_command(
     publisher: Publisher,
     bookings: dict[str, Booking],
 ):
-    response = CommandResponse(command.name, command.saga_id, False)
+    response = CommandResponse(
+        command.name, command.saga_id, False, member=command.member
+    )
     booking: Booking | None = None
 
     if not should_fail:
@@ -48,8 +50,13 @@ def handle_create_booking_command(
         response.ok = True
 
     publisher.publish(
-        "create_order_saga.command_response",
-        {"saga_id": response.saga_id, "name": response.name, "ok": response.ok},
+        command.reply_to,
+        {
+            "saga_id": response.saga_id,
+            "name": response.name,
+            "ok": response.ok,
+            "member": response.member,
+        },
     )
 
     if booking:
@@ -63,14 +70,43 @@ def handle_create_booking_command(
     )
 
 
+def handle_cancel_booking_command(
+    command: Command,
+    should_fail: bool,
+    publisher: Publisher,
+    bookings: dict[str, Booking],
+):
+    booking = next(x for x in bookings.values() if x.order_id == command.payload["id"])
+    booking.status = "canceled"
+    response = CommandResponse(
+        command.name,
+        command.saga_id,
+        False if should_fail else True,
+        member=command.member,
+    )
+    publisher.publish(
+        command.reply_to,
+        {
+            "saga_id": response.saga_id,
+            "name": response.name,
+            "ok": response.ok,
+            "member": response.member,
+        },
+    )
+    print_booking(booking)
+
+
 def create_create_order_saga_handler(
     publisher: Publisher, bookings: dict[str, Booking], ev_should_fail: Event
 ):
-    def create_order_saga_handler(body: bytes, _key: str):
+    def create_order_saga_handler(command_body: dict, _key: str):
         should_fail = ev_should_fail.is_set()
-        command_body = json.loads(body)
         command = Command(
-            command_body["name"], command_body["saga_id"], command_body["payload"]
+            command_body["name"],
+            command_body["saga_id"],
+            command_body["payload"],
+            reply_to=command_body["reply_to"],
+            member=command_body.get("member"),
         )
 
         if command.name == "create_booking":
@@ -81,6 +117,9 @@ def create_create_order_saga_handler(
                 bookings,
             )
 
+        if command.name == "cancel_booking":
+            handle_cancel_booking_command(command, should_fail, publisher, bookings)
+
     return create_order_saga_handler
 
 
@@ -101,6 +140,7 @@ def main():
     connection = BlockingConnection(ConnectionParameters(host="localhost"))
     channel = connection.channel()
     initialize_messaging(channel)
+    queue_name = initialize_command_queue(channel, "create_order_saga", "bookings")
     channel.close()
     connection.close()
 
@@ -115,9 +155,10 @@ def main():
     )
 
     create_order_saga_handler_thread = create_subscription_thread(
-        queue_name="bookings_create_order_saga_commands",
+        queue_name=queue_name,
         callback=create_order_saga_handler,
         ev_stopping=ev_stopping,
+        deduplicator=MessageDeduplicator(),
     )
 
     def exit_signal_handler(signum, frame):
@@ -130,4 +171,5 @@ def main():
     publisher.join()
 
 
-main()
+if __name__ == "__main__":
+    main()
@@ -13,15 +13,3 @@ def initialize_messaging(channel: Channel):
     initialize_queue("payments-order-created", "bookings.order-created", channel)
 
     initialize_queue("bookings-payment-created", "bookings.payment-created", channel)
-
-    initialize_queue(
-        "payments_create_order_saga_commands", "create_order_saga.command", channel
-    )
-    initialize_queue(
-        "bookings_create_order_saga_commands", "create_order_saga.command", channel
-    )
-    initialize_queue(
-        "create_order_saga_command_responses",
-        "create_order_saga.command_response",
-        channel,
-    )
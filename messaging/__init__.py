@@ -1,3 +1,7 @@
+from messaging.dedup import MessageDeduplicator
 from messaging.publisher import Publisher
+from messaging.publisher_pool import PublisherPool
 from messaging.subscriber import create_subscription_thread
 from messaging.utils import create_default_exchange, initialize_queue
+from messaging.transport import RabbitMQTransport, Transport
+from messaging.in_process import InProcessBroker, InProcessTransport
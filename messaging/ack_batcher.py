@@ -0,0 +1,55 @@
+from time import monotonic
+
+
+# Acknowledges deliveries of one channel with multiple=True once
+# batch_size messages are done or the oldest unacked one has waited for
+# batch_interval seconds. Deliveries may complete out of order (worker
+# mode), so only the highest contiguous completed delivery tag is acked.
+# Rejected deliveries count as completed but are never the tag of a
+# multiple ack, the broker no longer knows them.
+class AckBatcher:
+    def __init__(self, channel, batch_size: int = 1, batch_interval: float = 0):
+        self.channel = channel
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.completed: set[int] = set()
+        self.watermark = 0
+        self.last_acked = 0
+        self.pending_since: float | None = None
+        self.rejected: set[int] = set()
+
+    def ack(self, delivery_tag: int):
+        self.completed.add(delivery_tag)
+
+        while self.watermark + 1 in self.completed:
+            self.watermark += 1
+            self.completed.remove(self.watermark)
+
+        if self.watermark - self.last_acked >= self.batch_size:
+            self.flush()
+        elif self.pending_since is None and self.watermark > self.last_acked:
+            self.pending_since = monotonic()
+
+    def reject(self, delivery_tag: int, requeue: bool = True):
+        self.channel.basic_nack(delivery_tag, requeue=requeue)
+        self.rejected.add(delivery_tag)
+        self.ack(delivery_tag)
+
+    def flush_if_due(self):
+        if (
+            self.pending_since is not None
+            and monotonic() - self.pending_since >= self.batch_interval
+        ):
+            self.flush()
+
+    def flush(self):
+        if self.watermark > self.last_acked:
+            delivery_tag = self.watermark
+            while delivery_tag in self.rejected:
+                delivery_tag -= 1
+            if delivery_tag > self.last_acked:
+                self.channel.basic_ack(delivery_tag, multiple=True)
+            self.last_acked = self.watermark
+            if self.rejected:
+                self.rejected = {t for t in self.rejected if t > self.watermark}
+        self.pending_since = None
@@ -0,0 +1,45 @@
+import asyncio
+from pika.adapters.asyncio_connection import AsyncioConnection
+from pika.connection import ConnectionParameters
+from pika.exceptions import AMQPConnectionError
+
+
+async def connect_async(parameters: ConnectionParameters | None = None):
+    loop = asyncio.get_running_loop()
+    opened = loop.create_future()
+
+    def on_open(connection: AsyncioConnection):
+        opened.set_result(connection)
+
+    def on_open_error(connection: AsyncioConnection, error):
+        if not opened.done():
+            opened.set_exception(AMQPConnectionError(error))
+
+    AsyncioConnection(
+        parameters
+        or ConnectionParameters(
+            host="localhost", heartbeat=10, blocked_connection_timeout=10
+        ),
+        on_open_callback=on_open,
+        on_open_error_callback=on_open_error,
+        custom_ioloop=loop,
+    )
+
+    return await opened
+
+
+async def open_channel(connection: AsyncioConnection):
+    opened = asyncio.get_running_loop().create_future()
+    connection.channel(on_open_callback=opened.set_result)
+    return await opened
+
+
+def wait_closed(connection: AsyncioConnection):
+    closed = asyncio.get_running_loop().create_future()
+
+    def on_close(connection: AsyncioConnection, reason):
+        if not closed.done():
+            closed.set_result(reason)
+
+    connection.add_on_close_callback(on_close)
+    return closed
@@ -0,0 +1,115 @@
+import asyncio
+from collections import OrderedDict
+from uuid import uuid4
+from pika.spec import Basic
+from messaging.async_connection import connect_async, open_channel
+from messaging.codec import DEFAULT_CODEC, MessageCodec, get_message_properties
+from messaging.publisher import Message, PublishNackedError
+from messaging.utils import DEFAULT_EXCHANGE
+
+
+# asyncio counterpart of Publisher. Publishing happens on the event loop,
+# there is no I/O thread. In confirm mode publish() waits for the broker
+# confirmation, at most max_in_flight messages are unconfirmed.
+class AsyncPublisher:
+    def __init__(
+        self,
+        confirm: bool = False,
+        max_in_flight: int = 1000,
+        codec: MessageCodec = DEFAULT_CODEC,
+        exchange: str = DEFAULT_EXCHANGE,
+    ) -> None:
+        self.confirm = confirm
+        self.codec = codec
+        self.exchange = exchange
+        self.window = asyncio.Semaphore(max_in_flight) if confirm else None
+        self.delivery_tag = 0
+        self.unconfirmed: OrderedDict[int, asyncio.Future] = OrderedDict()
+        self.connection = None
+        self.channel = None
+        self.error: ConnectionError | None = None
+
+    async def connect(self):
+        self.connection = await connect_async()
+        self.connection.add_on_close_callback(self._on_connection_closed)
+        self.channel = await open_channel(self.connection)
+
+        if self.confirm:
+            selected = asyncio.get_running_loop().create_future()
+            self.channel.confirm_delivery(
+                ack_nack_callback=self._on_delivery_confirmation,
+                callback=selected.set_result,
+            )
+            await selected
+
+    async def close(self):
+        self._fail(ConnectionError("publisher stopped"))
+
+        if self.connection and self.connection.is_open:
+            self.connection.close()
+
+    async def publish(self, key: str, payload: dict, message_id: str | None = None):
+        if not self.confirm:
+            self._check_open()
+            self._publish(key, payload, message_id)
+            return
+
+        async with self.window:
+            # The connection may have closed while waiting for the window.
+            self._check_open()
+            self._publish(key, payload, message_id)
+            self.delivery_tag += 1
+            future = asyncio.get_running_loop().create_future()
+            self.unconfirmed[self.delivery_tag] = future
+            await future
+
+    async def publish_many(self, messages: list[Message]):
+        await asyncio.gather(*(self.publish(*message) for message in messages))
+
+    # Like Publisher, messages published without a message id get a new one.
+    def _publish(self, key: str, payload: dict, message_id: str | None = None):
+        self.channel.basic_publish(
+            exchange=self.exchange,
+            body=self.codec.encode(payload),
+            routing_key=key,
+            properties=get_message_properties(self.codec, message_id or uuid4().hex),
+        )
+
+    def _check_open(self):
+        if self.error is not None:
+            raise self.error
+
+    # Unconfirmed messages are lost with the connection, their futures
+    # fail and later publishes are rejected.
+    def _fail(self, error: ConnectionError):
+        if self.error is None:
+            self.error = error
+
+        for future in self.unconfirmed.values():
+            if not future.done():
+                future.set_exception(error)
+        self.unconfirmed.clear()
+
+    def _on_connection_closed(self, _connection, reason):
+        self._fail(ConnectionError(f"connection closed: {reason}"))
+
+    def _on_delivery_confirmation(self, method_frame):
+        method = method_frame.method
+        futures: list[asyncio.Future] = []
+
+        if method.multiple:
+            while self.unconfirmed:
+                delivery_tag = next(iter(self.unconfirmed))
+                if delivery_tag > method.delivery_tag:
+                    break
+                futures.append(self.unconfirmed.pop(delivery_tag))
+        elif method.delivery_tag in self.unconfirmed:
+            futures.append(self.unconfirmed.pop(method.delivery_tag))
+
+        for future in futures:
+            if future.done():
+                continue
+            if isinstance(method, Basic.Ack):
+                future.set_result(True)
+            else:
+                future.set_exception(PublishNackedError("message was nacked"))
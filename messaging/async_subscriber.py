@@ -0,0 +1,81 @@
+import asyncio
+from typing import Awaitable, Callable
+from pika.exceptions import AMQPConnectionError
+from messaging.async_connection import connect_async, open_channel, wait_closed
+from messaging.codec import decode_message
+
+
+async def process_message_async(
+    callback: Callable[[any, str], Awaitable[None]], method, payload: any
+):
+    try:
+        await callback(payload, method.routing_key)
+    except Exception as e:
+        print("failed to process a message with delivery tag %d" % (method.delivery_tag))
+        print("exception:", e)
+
+
+# asyncio counterpart of run_subscription. Every delivery is processed in
+# its own task, prefetch_count bounds how many of them run at once.
+async def run_async_subscription(
+    queue_name: str,
+    callback: Callable[[any, str], Awaitable[None]],
+    ev_stopping: asyncio.Event,
+    prefetch_count: int = 100,
+):
+    while not ev_stopping.is_set():
+        try:
+            connection = await connect_async()
+            closed = wait_closed(connection)
+            channel = await open_channel(connection)
+
+            qos_ok = asyncio.get_running_loop().create_future()
+            channel.basic_qos(prefetch_count=prefetch_count, callback=qos_ok.set_result)
+            await qos_ok
+
+            tasks: set[asyncio.Task] = set()
+
+            async def handle(method, properties, body: bytes):
+                try:
+                    payload = decode_message(properties, body)
+                except Exception as e:
+                    print(
+                        "failed to decode a message with delivery tag %d"
+                        % (method.delivery_tag)
+                    )
+                    print("exception:", e)
+                    # See run_subscription.
+                    if channel.is_open:
+                        channel.basic_nack(
+                            method.delivery_tag, requeue=not method.redelivered
+                        )
+                    return
+
+                await process_message_async(callback, method, payload)
+                # @TODO: don't ack messages that failed to process.
+                if channel.is_open:
+                    channel.basic_ack(method.delivery_tag)
+
+            def on_message(_channel, method, properties, body: bytes):
+                task = asyncio.create_task(handle(method, properties, body))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+
+            channel.basic_consume(queue_name, on_message)
+
+            stopping = asyncio.create_task(ev_stopping.wait())
+            await asyncio.wait([stopping, closed], return_when=asyncio.FIRST_COMPLETED)
+            stopping.cancel()
+
+            if tasks:
+                await asyncio.gather(*tasks)
+
+            if not closed.done():
+                connection.close()
+                await closed
+                return
+
+            print("disconnected from RabbitMQ, trying to reconnect...")
+        except AMQPConnectionError:
+            print("disconnected from RabbitMQ, trying to reconnect...")
+            await asyncio.sleep(1)
@@ -0,0 +1,72 @@
+import json
+from pika.spec import BasicProperties
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+# Encodes message payloads. The codec's content type is sent with every
+# message and subscribers decode each message with the codec of its
+# content type, so publishers can switch codecs one service at a time.
+class MessageCodec:
+    content_type: str
+
+    def encode(self, payload: any) -> bytes:
+        raise NotImplementedError()
+
+    def decode(self, body: bytes) -> any:
+        raise NotImplementedError()
+
+
+class JsonMessageCodec(MessageCodec):
+    content_type = "application/json"
+
+    def encode(self, payload: any) -> bytes:
+        return json.dumps(payload, separators=(",", ":")).encode()
+
+    def decode(self, body: bytes) -> any:
+        return json.loads(body)
+
+
+# Requires the optional msgpack package.
+class MsgpackMessageCodec(MessageCodec):
+    content_type = "application/x-msgpack"
+
+    def __init__(self):
+        if msgpack is None:
+            raise ImportError("MsgpackMessageCodec requires the msgpack package")
+
+    def encode(self, payload: any) -> bytes:
+        return msgpack.packb(payload)
+
+    def decode(self, body: bytes) -> any:
+        return msgpack.unpackb(body)
+
+
+DEFAULT_CODEC = JsonMessageCodec()
+
+message_codecs: dict[str | None, MessageCodec] = {
+    # Messages published before content types were sent are JSON.
+    None: DEFAULT_CODEC,
+    JsonMessageCodec.content_type: DEFAULT_CODEC,
+}
+
+
+def get_message_codec(content_type: str | None) -> MessageCodec:
+    if content_type not in message_codecs:
+        if content_type == MsgpackMessageCodec.content_type:
+            message_codecs[content_type] = MsgpackMessageCodec()
+        else:
+            raise ValueError(f"unsupported content type {content_type}")
+    return message_codecs[content_type]
+
+
+def get_message_properties(codec: MessageCodec, message_id: str | None = None):
+    return BasicProperties(content_type=codec.content_type, message_id=message_id)
+
+
+def decode_message(properties: BasicProperties | None, body: bytes):
+    content_type = properties.content_type if properties else None
+    return get_message_codec(content_type).decode(body)
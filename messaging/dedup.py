@@ -0,0 +1,43 @@
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+
+
+# Remembers the ids of the messages processed in the last ttl seconds,
+# at most max_size of them, so that redeliveries can be dropped. Ids
+# are kept in the order they were added, which is also the order they
+# expire in, so expired ids are dropped from the front.
+class MessageDeduplicator:
+    def __init__(self, max_size: int = 100000, ttl: float = 600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.lock = Lock()
+        self.entries: OrderedDict[str, float] = OrderedDict()
+        self.duplicates = 0
+
+    def is_duplicate(self, message_id: str):
+        with self.lock:
+            expires_at = self.entries.get(message_id)
+            if expires_at is None:
+                return False
+            if expires_at < monotonic():
+                del self.entries[message_id]
+                return False
+            self.duplicates += 1
+            return True
+
+    def add(self, message_id: str):
+        now = monotonic()
+
+        with self.lock:
+            self.entries[message_id] = now + self.ttl
+            self.entries.move_to_end(message_id)
+
+            while self.entries:
+                expires_at = next(iter(self.entries.values()))
+                if len(self.entries) <= self.max_size and expires_at >= now:
+                    break
+                self.entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self.entries)
@@ -0,0 +1,351 @@
+from collections import OrderedDict, deque
+from threading import Condition, Lock
+from time import monotonic
+from pika.exceptions import (
+    AMQPConnectionError,
+    ConnectionClosedByBroker,
+    ConnectionWrongStateError,
+)
+from pika.frame import Method
+from pika.spec import Basic, BasicProperties, ExchangeType, Queue
+from messaging.transport import Transport
+from messaging.utils import DEFAULT_EXCHANGE
+
+
+def topic_matches(pattern: list[str], words: list[str]) -> bool:
+    if not pattern:
+        return not words
+
+    if pattern[0] == "#":
+        return any(topic_matches(pattern[1:], words[i:]) for i in range(len(words) + 1))
+
+    if not words or (pattern[0] != "*" and pattern[0] != words[0]):
+        return False
+
+    return topic_matches(pattern[1:], words[1:])
+
+
+class InProcessMessage:
+    def __init__(
+        self, exchange: str, routing_key: str, body: bytes, properties: BasicProperties
+    ):
+        self.exchange = exchange
+        self.routing_key = routing_key
+        self.body = body
+        self.properties = properties
+        self.redelivered = False
+
+
+class InProcessQueue:
+    def __init__(self, name: str, durable: bool):
+        self.name = name
+        self.durable = durable
+        self.messages: deque[InProcessMessage] = deque()
+        self.consumers: set["InProcessConnection"] = set()
+
+
+# In-memory message broker with topic exchanges, queues, acks and
+# redelivery of unacked messages when a channel closes. Lets all the
+# services run in one process without RabbitMQ (load tests, benchmarks).
+class InProcessBroker:
+    def __init__(self):
+        self.lock = Lock()
+        self.exchanges: dict[str, str] = {}
+        self.queues: dict[str, InProcessQueue] = {}
+        self.bindings: dict[str, list[tuple[list[str], str]]] = {}
+        self.routes: dict[tuple[str, str], list[InProcessQueue]] = {}
+        self.connections: set["InProcessConnection"] = set()
+        self.published = 0
+
+    def declare_exchange(self, exchange: str, exchange_type: str):
+        if exchange_type != ExchangeType.topic.value:
+            raise ValueError("only topic exchanges are supported")
+
+        with self.lock:
+            self.exchanges.setdefault(exchange, exchange_type)
+            self.bindings.setdefault(exchange, [])
+
+    def declare_queue(self, queue_name: str, durable: bool):
+        with self.lock:
+            if queue_name not in self.queues:
+                self.queues[queue_name] = InProcessQueue(queue_name, durable)
+            return self.queues[queue_name]
+
+    def bind_queue(self, exchange: str, queue_name: str, routing_key: str):
+        with self.lock:
+            binding = (routing_key.split("."), queue_name)
+            if binding not in self.bindings[exchange]:
+                self.bindings[exchange].append(binding)
+            self.routes.clear()
+
+    def publish(
+        self, exchange: str, routing_key: str, body: bytes, properties: BasicProperties
+    ):
+        with self.lock:
+            self.published += 1
+            for queue in self.__route(exchange, routing_key):
+                queue.messages.append(
+                    InProcessMessage(exchange, routing_key, body, properties)
+                )
+                for connection in queue.consumers:
+                    connection.condition.notify_all()
+
+    def message_count(self, queue_name: str):
+        with self.lock:
+            return len(self.queues[queue_name].messages)
+
+    # Simulates a broker restart: connections are dropped, their unacked
+    # messages requeued, and only durable queues survive. Clients get
+    # ConnectionClosedByBroker from their next call, like with pika.
+    def restart(self):
+        for connection in list(self.connections):
+            connection.close(ConnectionClosedByBroker(320, "broker restarted"))
+
+        with self.lock:
+            self.queues = {
+                name: queue for name, queue in self.queues.items() if queue.durable
+            }
+            for exchange, bindings in self.bindings.items():
+                self.bindings[exchange] = [
+                    binding for binding in bindings if binding[1] in self.queues
+                ]
+            self.routes.clear()
+
+    def _requeue(self, queue: InProcessQueue, messages: list[InProcessMessage]):
+        for message in reversed(messages):
+            message.redelivered = True
+            queue.messages.appendleft(message)
+
+        for connection in queue.consumers:
+            connection.condition.notify_all()
+
+    def __route(self, exchange: str, routing_key: str):
+        route = (exchange, routing_key)
+
+        if route not in self.routes:
+            words = routing_key.split(".")
+            queue_names = {
+                queue_name
+                for pattern, queue_name in self.bindings.get(exchange, [])
+                if topic_matches(pattern, words)
+            }
+            self.routes[route] = [self.queues[name] for name in sorted(queue_names)]
+
+        return self.routes[route]
+
+
+class InProcessChannel:
+    def __init__(self, connection: "InProcessConnection"):
+        self.connection = connection
+        self.broker = connection.broker
+        self.is_open = True
+        self.delivery_tag = 0
+        self.unacked: OrderedDict[int, tuple[InProcessQueue, InProcessMessage]] = (
+            OrderedDict()
+        )
+        self.prefetch_count = 0
+        self.confirm_callback = None
+        self.publish_tag = 0
+
+    def exchange_declare(
+        self, exchange: str, exchange_type=ExchangeType.topic, **kwargs
+    ):
+        self.broker.declare_exchange(exchange, ExchangeType(exchange_type).value)
+
+    def queue_declare(self, queue: str, durable: bool = False, **kwargs):
+        self.broker.declare_queue(queue, durable)
+        return Method(1, Queue.DeclareOk(queue=queue))
+
+    def queue_bind(self, queue: str, exchange: str, routing_key: str, **kwargs):
+        self.broker.bind_queue(exchange, queue, routing_key)
+
+    def basic_qos(self, prefetch_size: int = 0, prefetch_count: int = 0, **kwargs):
+        self.prefetch_count = prefetch_count
+
+    def confirm_delivery(self, callback):
+        self.confirm_callback = callback
+
+    def basic_publish(
+        self,
+        exchange: str,
+        routing_key: str,
+        body: bytes | str,
+        properties: BasicProperties | None = None,
+        mandatory: bool = False,
+    ):
+        if not self.is_open:
+            raise ConnectionWrongStateError("channel is closed")
+
+        if isinstance(body, str):
+            body = body.encode()
+
+        self.broker.publish(
+            exchange, routing_key, body, properties or BasicProperties()
+        )
+
+        if self.confirm_callback:
+            self.publish_tag += 1
+            method_frame = Method(1, Basic.Ack(delivery_tag=self.publish_tag))
+            callback = self.confirm_callback
+            self.connection.add_callback_threadsafe(lambda: callback(method_frame))
+
+    def consume(self, queue: str, inactivity_timeout: float | None = None):
+        consumed_queue = self.broker.queues[queue]
+
+        with self.broker.lock:
+            consumed_queue.consumers.add(self.connection)
+
+        try:
+            while self.is_open:
+                self.connection.process_data_events(time_limit=0)
+                delivery = self.__next_delivery(consumed_queue, inactivity_timeout)
+
+                if delivery or not self.connection.callbacks:
+                    yield delivery or (None, None, None)
+
+            if self.connection.error is not None:
+                raise self.connection.error
+        finally:
+            with self.broker.lock:
+                consumed_queue.consumers.discard(self.connection)
+
+    def basic_ack(self, delivery_tag: int = 0, multiple: bool = False):
+        with self.broker.lock:
+            self.__pop_unacked(delivery_tag, multiple)
+            self.connection.condition.notify_all()
+
+    def basic_nack(
+        self, delivery_tag: int = 0, multiple: bool = False, requeue: bool = True
+    ):
+        with self.broker.lock:
+            unacked = self.__pop_unacked(delivery_tag, multiple)
+            if requeue:
+                self.__requeue(unacked)
+            self.connection.condition.notify_all()
+
+    def basic_reject(self, delivery_tag: int = 0, requeue: bool = True):
+        self.basic_nack(delivery_tag, requeue=requeue)
+
+    def close(self):
+        with self.broker.lock:
+            if not self.is_open:
+                return
+            self.is_open = False
+            unacked = list(self.unacked.values())
+            self.unacked.clear()
+            self.__requeue(unacked)
+
+    def __next_delivery(self, queue: InProcessQueue, timeout: float | None):
+        deadline = None if timeout is None else monotonic() + timeout
+
+        with self.broker.lock:
+            while self.is_open:
+                can_deliver = (
+                    not self.prefetch_count or len(self.unacked) < self.prefetch_count
+                )
+
+                if can_deliver and queue.messages:
+                    message = queue.messages.popleft()
+                    self.delivery_tag += 1
+                    self.unacked[self.delivery_tag] = (queue, message)
+                    return (
+                        Basic.Deliver(
+                            consumer_tag="in-process",
+                            delivery_tag=self.delivery_tag,
+                            redelivered=message.redelivered,
+                            exchange=message.exchange,
+                            routing_key=message.routing_key,
+                        ),
+                        message.properties,
+                        message.body,
+                    )
+
+                if self.connection.callbacks:
+                    return None
+
+                remaining = None if deadline is None else deadline - monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+
+                self.connection.condition.wait(remaining)
+
+        return None
+
+    def __requeue(self, unacked: list[tuple[InProcessQueue, InProcessMessage]]):
+        messages: dict[str, tuple[InProcessQueue, list[InProcessMessage]]] = {}
+        for queue, message in unacked:
+            messages.setdefault(queue.name, (queue, []))[1].append(message)
+
+        for queue, queue_messages in messages.values():
+            self.broker._requeue(queue, queue_messages)
+
+    def __pop_unacked(self, delivery_tag: int, multiple: bool):
+        if not multiple:
+            return [self.unacked.pop(delivery_tag)] if delivery_tag in self.unacked else []
+
+        unacked = []
+        while self.unacked and next(iter(self.unacked)) <= delivery_tag:
+            unacked.append(self.unacked.popitem(last=False)[1])
+        return unacked
+
+
+class InProcessConnection:
+    def __init__(self, broker: InProcessBroker):
+        self.broker = broker
+        self.condition = Condition(broker.lock)
+        self.callbacks: deque = deque()
+        self.channels: list[InProcessChannel] = []
+        self.is_open = True
+        self.error: AMQPConnectionError | None = None
+
+        with broker.lock:
+            broker.connections.add(self)
+
+    def channel(self):
+        channel = InProcessChannel(self)
+        self.channels.append(channel)
+        return channel
+
+    def add_callback_threadsafe(self, callback):
+        with self.condition:
+            if not self.is_open:
+                raise ConnectionWrongStateError("connection is closed")
+            self.callbacks.append(callback)
+            self.condition.notify_all()
+
+    def process_data_events(self, time_limit: float | None = 0):
+        with self.condition:
+            if self.error is not None:
+                raise self.error
+            if not self.callbacks and time_limit != 0:
+                self.condition.wait(time_limit)
+            callbacks = list(self.callbacks)
+            self.callbacks.clear()
+
+        for callback in callbacks:
+            callback()
+
+    def close(self, error: AMQPConnectionError | None = None):
+        for channel in self.channels:
+            channel.close()
+
+        with self.condition:
+            self.is_open = False
+            self.error = self.error or error
+            self.callbacks.clear()
+            self.broker.connections.discard(self)
+            self.condition.notify_all()
+
+
+class InProcessTransport(Transport):
+    def __init__(
+        self, broker: InProcessBroker | None = None, exchange: str = DEFAULT_EXCHANGE
+    ):
+        self.broker = broker or InProcessBroker()
+        self.exchange = exchange
+
+    def connect(self):
+        return InProcessConnection(self.broker)
+
+    def enable_confirms(self, channel: InProcessChannel, callback):
+        channel.confirm_delivery(callback)
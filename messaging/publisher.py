@@ -1,31 +1,339 @@
-import json
-from threading import Event, Thread
-from pika.adapters.blocking_connection import BlockingConnection
-from pika.connection import ConnectionParameters
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from threading import Condition, Event, Lock, Thread
+from time import monotonic
+from typing import TypedDict
+from uuid import uuid4
+from pika.spec import Basic
+from messaging.codec import DEFAULT_CODEC, MessageCodec, get_message_properties
+from messaging.transport import RabbitMQTransport, Transport
+
+
+class PublishNackedError(Exception):
+    pass
+
+
+class PublishQueueFullError(Exception):
+    pass
+
+
+# What publish() does when the publish queue is full.
+OVERFLOW_BLOCK = "block"
+OVERFLOW_TIMEOUT = "timeout"
+OVERFLOW_DROP = "drop"
+
+
+# (routing key, payload) or (routing key, payload, message id). Messages
+# without a message id get a new one.
+Message = tuple[str, dict] | tuple[str, dict, str | None]
+
+
+class PublisherStats(TypedDict):
+    queue_depth: int
+    max_queue_depth: int
+    flushes: int
+    flushed_messages: int
+    max_flush_size: int
+    enqueue_waits: int
+    enqueue_wait_s: float
+    max_enqueue_wait_s: float
+    dropped: int
+
+
+# Combines several futures into one that resolves when all of them
+# resolved, or fails with the first failure.
+def gather_futures(futures: list[Future]) -> Future:
+    result = Future()
+    remaining = [len(futures)]
+    lock = Lock()
+
+    def on_done(future: Future):
+        with lock:
+            remaining[0] -= 1
+            if result.done():
+                return
+            if future.exception():
+                result.set_exception(future.exception())
+            elif remaining[0] == 0:
+                result.set_result(len(futures))
+
+    if not futures:
+        result.set_result(0)
+
+    for future in futures:
+        future.add_done_callback(on_done)
+
+    return result
+
 
 class Publisher(Thread):
-    def __init__(self, ev_stopping: Event) -> None:
+    # Messages wait in a publish queue of at most max_queued messages that
+    # the I/O thread drains in batches of up to batch_size messages per
+    # wakeup. When the queue is full publish() blocks (overflow="block"),
+    # blocks for at most enqueue_timeout seconds (overflow="timeout") or
+    # fails right away (overflow="drop"). Messages that are not queued
+    # get a future failed with PublishQueueFullError.
+    # In confirm mode the broker acknowledges every message asynchronously
+    # and a publish future resolves only after that. At most max_in_flight
+    # messages are unconfirmed, the others wait in the queue.
+    def __init__(
+        self,
+        ev_stopping: Event,
+        confirm: bool = False,
+        max_in_flight: int = 1000,
+        transport: Transport | None = None,
+        codec: MessageCodec = DEFAULT_CODEC,
+        max_queued: int = 10000,
+        batch_size: int = 500,
+        overflow: str = OVERFLOW_BLOCK,
+        enqueue_timeout: float = 5,
+    ) -> None:
         Thread.__init__(self, daemon=True)
+        if overflow not in (OVERFLOW_BLOCK, OVERFLOW_TIMEOUT, OVERFLOW_DROP):
+            raise ValueError(f"unknown overflow policy {overflow}")
         self.ev_stopping = ev_stopping
-        self.connection = BlockingConnection(ConnectionParameters(host="localhost", heartbeat=10, blocked_connection_timeout=10))
+        self.transport = transport or RabbitMQTransport()
+        self.connection = self.transport.connect()
         self.channel = self.connection.channel()
+        self.confirm = confirm
+        self.max_in_flight = max_in_flight
+        self.delivery_tag = 0
+        self.unconfirmed: OrderedDict[int, Future] = OrderedDict()
+        self.codec = codec
+
+        self.max_queued = max_queued
+        self.batch_size = batch_size
+        self.overflow = overflow
+        self.enqueue_timeout = enqueue_timeout
+        self.queue: deque[tuple[str, dict, str | None, Future]] = deque()
+        # Reentrant, so that a drain run by add_callback_threadsafe
+        # in the calling thread does not deadlock.
+        self.queue_not_full = Condition()
+        self.drain_scheduled = False
+        self.stopped = False
 
+        self.max_queue_depth = 0
+        self.flushes = 0
+        self.flushed_messages = 0
+        self.max_flush_size = 0
+        self.enqueue_waits = 0
+        self.enqueue_wait_s = 0.0
+        self.max_enqueue_wait_s = 0.0
+        self.dropped = 0
+
+        if confirm:
+            self.transport.enable_confirms(
+                self.channel, self._on_delivery_confirmation
+            )
+
+    # Whatever stops the I/O loop, the messages that were not published or
+    # confirmed fail and later publishes fail right away.
     def run(self):
-        while True:
-            self.connection.process_data_events(time_limit=1)
+        try:
+            while True:
+                self.connection.process_data_events(time_limit=1)
 
-            if (self.ev_stopping.is_set()):
-                break
+                if (self.ev_stopping.is_set()):
+                    break
+        finally:
+            with self.queue_not_full:
+                self.stopped = True
+            self._fail_queued(ConnectionError("publisher stopped"))
+            self._fail_unconfirmed(ConnectionError("publisher stopped"))
 
-        if self.connection.is_open:
-            self.connection.close()
+            if self.connection.is_open:
+                self.connection.close()
 
-    def _publish(self, key: str, payload: dict):
+    def is_stopped(self):
+        return self.stopped or (self.ident is not None and not self.is_alive())
+
+    def in_flight(self):
+        return len(self.unconfirmed)
+
+    def queue_depth(self):
+        with self.queue_not_full:
+            return len(self.queue)
+
+    def stats(self) -> PublisherStats:
+        with self.queue_not_full:
+            return PublisherStats(
+                queue_depth=len(self.queue),
+                max_queue_depth=self.max_queue_depth,
+                flushes=self.flushes,
+                flushed_messages=self.flushed_messages,
+                max_flush_size=self.max_flush_size,
+                enqueue_waits=self.enqueue_waits,
+                enqueue_wait_s=self.enqueue_wait_s,
+                max_enqueue_wait_s=self.max_enqueue_wait_s,
+                dropped=self.dropped,
+            )
+
+    # Subscribers use message ids to drop redelivered messages. A message
+    # published again, e.g. by the outbox relay after a crash, has to
+    # keep its id, messages published without one get a new id.
+    def _publish(self, key: str, payload: dict, message_id: str | None = None):
         self.channel.basic_publish(
-            exchange="mini-booking",
-            body=json.dumps(payload),
+            exchange=self.transport.exchange,
+            body=self.codec.encode(payload),
             routing_key=key,
+            properties=get_message_properties(self.codec, message_id or uuid4().hex),
         )
 
-    def publish(self, key: str, payload: dict):
-        self.connection.add_callback_threadsafe(lambda: self._publish(key, payload))
+    def _publish_batch(self, batch: list[tuple[str, dict, str | None, Future]]):
+        for key, payload, message_id, future in batch:
+            try:
+                self._publish(key, payload, message_id)
+            except Exception as e:
+                future.set_exception(e)
+                continue
+
+            if self.confirm:
+                self.delivery_tag += 1
+                self.unconfirmed[self.delivery_tag] = future
+            else:
+                future.set_result(True)
+
+    # Runs on the I/O thread.
+    def _drain(self):
+        with self.queue_not_full:
+            room = self.batch_size
+            if self.confirm:
+                room = min(room, self.max_in_flight - len(self.unconfirmed))
+            batch = [self.queue.popleft() for _ in range(min(room, len(self.queue)))]
+            # Give the I/O loop a turn between batches. A full confirm
+            # window is drained again on confirmation.
+            self.drain_scheduled = bool(self.queue) and room == len(batch) > 0
+            if batch:
+                self.flushes += 1
+                self.flushed_messages += len(batch)
+                self.max_flush_size = max(self.max_flush_size, len(batch))
+                self.queue_not_full.notify_all()
+
+        self._publish_batch(batch)
+
+        if self.drain_scheduled:
+            self.connection.add_callback_threadsafe(self._drain)
+
+    def _schedule_drain(self):
+        if not self.drain_scheduled and self.queue:
+            self.drain_scheduled = True
+            self.connection.add_callback_threadsafe(self._drain)
+
+    def _on_delivery_confirmation(self, method_frame):
+        method = method_frame.method
+        futures: list[Future] = []
+
+        if method.multiple:
+            while self.unconfirmed:
+                delivery_tag = next(iter(self.unconfirmed))
+                if delivery_tag > method.delivery_tag:
+                    break
+                futures.append(self.unconfirmed.pop(delivery_tag))
+        elif method.delivery_tag in self.unconfirmed:
+            futures.append(self.unconfirmed.pop(method.delivery_tag))
+
+        for future in futures:
+            if isinstance(method, Basic.Ack):
+                future.set_result(True)
+            else:
+                future.set_exception(PublishNackedError("message was nacked"))
+
+        if futures and not self.drain_scheduled:
+            self._drain()
+
+    def _fail_unconfirmed(self, exception: Exception):
+        futures = list(self.unconfirmed.values())
+        self.unconfirmed.clear()
+
+        for future in futures:
+            future.set_exception(exception)
+
+    def _fail_queued(self, exception: Exception):
+        with self.queue_not_full:
+            futures = [future for *_, future in self.queue]
+            self.queue.clear()
+            self.queue_not_full.notify_all()
+
+        for future in futures:
+            future.set_exception(exception)
+
+    # Waits until the queue has room for a message, called with the queue
+    # lock held. Returns False if the message has to be dropped or the
+    # publisher stopped.
+    def _wait_for_room(self):
+        if len(self.queue) < self.max_queued:
+            return True
+        if self.overflow == OVERFLOW_DROP:
+            return False
+
+        self._schedule_drain()
+        started = monotonic()
+        deadline = None
+        if self.overflow == OVERFLOW_TIMEOUT:
+            deadline = started + self.enqueue_timeout
+
+        # Waits in slices, so a publisher that stopped without notifying
+        # does not block the caller forever.
+        while len(self.queue) >= self.max_queued and not self.is_stopped():
+            timeout = 1 if deadline is None else min(1, deadline - monotonic())
+            if timeout <= 0:
+                break
+            self.queue_not_full.wait(timeout)
+
+        waited = monotonic() - started
+        self.enqueue_waits += 1
+        self.enqueue_wait_s += waited
+        self.max_enqueue_wait_s = max(self.max_enqueue_wait_s, waited)
+        return len(self.queue) < self.max_queued
+
+    # Queues the messages in order and returns a future per message, see
+    # publish() for when a future resolves.
+    def enqueue(self, messages: list[Message]) -> list[Future]:
+        futures: list[Future] = []
+        dropped: list[Future] = []
+        stopped: list[Future] = []
+
+        with self.queue_not_full:
+            for message in messages:
+                key, payload = message[:2]
+                message_id = message[2] if len(message) > 2 else None
+                future = Future()
+                futures.append(future)
+
+                has_room = not self.is_stopped() and self._wait_for_room()
+
+                # The publisher may have stopped while the caller waited.
+                if self.is_stopped():
+                    stopped.append(future)
+                    continue
+
+                if not has_room:
+                    self.dropped += 1
+                    dropped.append(future)
+                    continue
+
+                self.queue.append((key, payload, message_id, future))
+                self.max_queue_depth = max(self.max_queue_depth, len(self.queue))
+
+            self._schedule_drain()
+
+        for future in dropped:
+            future.set_exception(PublishQueueFullError("publish queue is full"))
+        for future in stopped:
+            future.set_exception(ConnectionError("publisher stopped"))
+
+        return futures
+
+    # The returned future resolves once the message has been handed to the
+    # channel or, in confirm mode, once the broker confirmed it.
+    def publish(
+        self, key: str, payload: dict, message_id: str | None = None
+    ) -> Future:
+        return self.enqueue([(key, payload, message_id)])[0]
+
+    # Queues all the messages at once, so they are published in as few
+    # I/O loop wakeups as the batch size and the confirm window allow. The
+    # returned future resolves once every message has been published (or
+    # confirmed).
+    def publish_many(self, messages: list[Message]) -> Future:
+        return gather_futures(self.enqueue(messages))
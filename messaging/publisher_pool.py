@@ -0,0 +1,96 @@
+from concurrent.futures import Future
+from itertools import count
+from threading import Event
+from zlib import crc32
+from messaging.publisher import Message, Publisher, PublisherStats, gather_futures
+
+ROUND_ROBIN = "round_robin"
+ROUTING_KEY = "routing_key"
+
+
+# Spreads publishes over several Publishers, each with its own connection,
+# channel and I/O thread. With affinity="round_robin" messages go to the
+# publishers in turn, with affinity="routing_key" all the messages of a
+# routing key go to the same publisher and keep their order. Messages
+# published with an ordering_key are kept in order per ordering key
+# whatever the affinity. Takes the options of Publisher.
+class PublisherPool:
+    def __init__(
+        self,
+        ev_stopping: Event,
+        size: int = 4,
+        affinity: str = ROUND_ROBIN,
+        **options,
+    ):
+        if affinity not in (ROUND_ROBIN, ROUTING_KEY):
+            raise ValueError(f"unknown publisher affinity {affinity}")
+        if size < 1:
+            raise ValueError("a publisher pool needs at least one publisher")
+
+        self.affinity = affinity
+        self.publishers = [Publisher(ev_stopping, **options) for _ in range(size)]
+        self.counter = count()
+
+    def start(self):
+        for publisher in self.publishers:
+            publisher.start()
+
+    def join(self, timeout: float | None = None):
+        for publisher in self.publishers:
+            publisher.join(timeout)
+
+    def is_alive(self):
+        return any(publisher.is_alive() for publisher in self.publishers)
+
+    def get_publisher(self, key: str, ordering_key: str | None = None):
+        if ordering_key is None and self.affinity == ROUTING_KEY:
+            ordering_key = key
+
+        if ordering_key is None:
+            index = next(self.counter) % len(self.publishers)
+        else:
+            index = crc32(ordering_key.encode()) % len(self.publishers)
+
+        return self.publishers[index]
+
+    def publish(
+        self,
+        key: str,
+        payload: dict,
+        ordering_key: str | None = None,
+        message_id: str | None = None,
+    ) -> Future:
+        return self.get_publisher(key, ordering_key).publish(key, payload, message_id)
+
+    # Messages are queued on their publishers in one call per publisher.
+    # With an ordering_key the whole batch goes to one publisher.
+    def publish_many(
+        self, messages: list[Message], ordering_key: str | None = None
+    ) -> Future:
+        batches: dict[int, tuple[Publisher, list[Message]]] = {}
+
+        for message in messages:
+            publisher = self.get_publisher(message[0], ordering_key)
+            batches.setdefault(id(publisher), (publisher, []))[1].append(message)
+
+        futures: list[Future] = []
+        for publisher, batch in batches.values():
+            futures += publisher.enqueue(batch)
+        return gather_futures(futures)
+
+    def in_flight(self):
+        return sum(publisher.in_flight() for publisher in self.publishers)
+
+    def stats(self) -> PublisherStats:
+        stats = [publisher.stats() for publisher in self.publishers]
+        return PublisherStats(
+            queue_depth=sum(s["queue_depth"] for s in stats),
+            max_queue_depth=max(s["max_queue_depth"] for s in stats),
+            flushes=sum(s["flushes"] for s in stats),
+            flushed_messages=sum(s["flushed_messages"] for s in stats),
+            max_flush_size=max(s["max_flush_size"] for s in stats),
+            enqueue_waits=sum(s["enqueue_waits"] for s in stats),
+            enqueue_wait_s=sum(s["enqueue_wait_s"] for s in stats),
+            max_enqueue_wait_s=max(s["max_enqueue_wait_s"] for s in stats),
+            dropped=sum(s["dropped"] for s in stats),
+        )
@@ -1,43 +1,155 @@
+from contextvars import ContextVar
 from typing import Callable
 from threading import Event, Thread
 from pika.adapters.blocking_connection import BlockingConnection
-from pika.connection import ConnectionParameters
 from pika.exceptions import AMQPConnectionError
+from messaging.ack_batcher import AckBatcher
+from messaging.codec import decode_message
+from messaging.dedup import MessageDeduplicator
+from messaging.transport import RabbitMQTransport, Transport
+from messaging.worker_pool import ShardedWorkerPool
 
 
+current_message_id: ContextVar[str | None] = ContextVar(
+    "current_message_id", default=None
+)
+
+
+# Id of the message being processed, for callbacks that keep their own
+# record of processed messages.
+def get_message_id():
+    return current_message_id.get()
+
+
+def process_message(
+    callback: Callable[[any, str], None],
+    method_frame,
+    payload: any,
+    message_id: str | None = None,
+    deduplicator: MessageDeduplicator | None = None,
+):
+    if (
+        deduplicator is not None
+        and message_id
+        and deduplicator.is_duplicate(message_id)
+    ):
+        return
+
+    token = current_message_id.set(message_id)
+    try:
+        callback(payload, method_frame.routing_key)
+    except Exception as e:
+        print(
+            "failed to process a message with delivery tag %d"
+            % (method_frame.delivery_tag)
+        )
+        print("exception:", e)
+        return
+    finally:
+        current_message_id.reset(token)
+
+    if deduplicator is not None and message_id:
+        deduplicator.add(message_id)
+
+
+# Callbacks get the payload decoded with the codec of the message's
+# content type, and the routing key.
+# When workers is set, messages are processed on a pool of worker threads
+# sharded by shard_key(payload, routing_key): messages with the same key are
+# processed in order, the others in parallel. Acks are sent back on the
+# connection thread.
+# Acks are sent with multiple=True every ack_batch_size messages or every
+# ack_batch_interval seconds, whichever comes first. Keep prefetch_count
+# above ack_batch_size, otherwise the interval caps the throughput.
+# With a deduplicator, messages whose message id was processed before
+# are acked without calling the callback. Ids are checked by the worker
+# right before processing, so a redelivery queued behind its original
+# message on the same shard is dropped too.
 def run_subscription(
-    queue_name: str, callback: Callable[[bytes], None], ev_stopping: Event
+    queue_name: str,
+    callback: Callable[[any, str], None],
+    ev_stopping: Event,
+    workers: int = 0,
+    shard_key: Callable[[any, str], str] | None = None,
+    prefetch_count: int = 0,
+    prefetch_size: int = 0,
+    ack_batch_size: int = 1,
+    ack_batch_interval: float = 0,
+    transport: Transport | None = None,
+    deduplicator: MessageDeduplicator | None = None,
 ):
+    transport = transport or RabbitMQTransport()
+
     while True:
+        worker_pool: ShardedWorkerPool | None = None
         try:
-            connection = BlockingConnection(
-                ConnectionParameters(
-                    host="localhost", heartbeat=10, blocked_connection_timeout=10
-                )
-            )
+            connection = transport.connect()
             channel = connection.channel()
 
+            if prefetch_count or prefetch_size:
+                channel.basic_qos(
+                    prefetch_size=prefetch_size, prefetch_count=prefetch_count
+                )
+
+            ack_batcher = AckBatcher(channel, ack_batch_size, ack_batch_interval)
+
+            if workers:
+                worker_pool = ShardedWorkerPool(workers)
+
             for method_frame, properties, body in channel.consume(
-                queue=queue_name, inactivity_timeout=1
+                queue=queue_name,
+                inactivity_timeout=min(1, ack_batch_interval or 1),
             ):
                 if ev_stopping.is_set():
                     break
 
-                if method_frame == None:
-                    continue
-
-                try:
-                    callback(body, method_frame.routing_key)
-                    channel.basic_ack(method_frame.delivery_tag)
-                except Exception as e:
-                    print(
-                        "failed to process a message with delivery tag %d"
-                        % (method_frame.delivery_tag)
-                    )
-                    print("exception:", e)
-                    # @TODO: remove this line
-                    channel.basic_ack(method_frame.delivery_tag)
-                    continue
+                if method_frame != None:
+                    try:
+                        payload = decode_message(properties, body)
+                    except Exception as e:
+                        print(
+                            "failed to decode a message with delivery tag %d"
+                            % (method_frame.delivery_tag)
+                        )
+                        print("exception:", e)
+                        # Give another consumer, e.g. an upgraded one that
+                        # knows the codec, one chance before the message is
+                        # dropped or dead-lettered.
+                        ack_batcher.reject(
+                            method_frame.delivery_tag,
+                            requeue=not method_frame.redelivered,
+                        )
+                        continue
+
+                    message_id = properties.message_id if properties else None
+
+                    if worker_pool:
+                        submit_message(
+                            worker_pool,
+                            connection,
+                            ack_batcher,
+                            callback,
+                            shard_key,
+                            method_frame,
+                            payload,
+                            message_id,
+                            deduplicator,
+                        )
+                    else:
+                        process_message(
+                            callback, method_frame, payload, message_id, deduplicator
+                        )
+                        # @TODO: don't ack messages that failed to process.
+                        ack_batcher.ack(method_frame.delivery_tag)
+
+                ack_batcher.flush_if_due()
+
+            if worker_pool:
+                worker_pool.stop()
+                # Run the acks scheduled by the workers.
+                connection.process_data_events(time_limit=0)
+
+            ack_batcher.flush()
 
             if channel.is_open:
                 channel.close()
@@ -46,15 +158,51 @@ def run_subscription(
 
             break
         except AMQPConnectionError:
+            if worker_pool:
+                worker_pool.stop()
             print("disconnected from RabbitMQ, trying to reconnect...")
             continue
 
 
+def submit_message(
+    worker_pool: ShardedWorkerPool,
+    connection: BlockingConnection,
+    ack_batcher: AckBatcher,
+    callback: Callable[[any, str], None],
+    shard_key: Callable[[any, str], str] | None,
+    method_frame,
+    payload: any,
+    message_id: str | None = None,
+    deduplicator: MessageDeduplicator | None = None,
+):
+    key = ""
+    if shard_key:
+        try:
+            key = shard_key(payload, method_frame.routing_key)
+        except Exception as e:
+            print("failed to get a shard key, using the default worker")
+            print("exception:", e)
+    delivery_tag = method_frame.delivery_tag
+
+    def task():
+        process_message(callback, method_frame, payload, message_id, deduplicator)
+        # The channel is not thread safe, ack on the connection thread.
+        # If the connection is gone the message will be redelivered.
+        connection.add_callback_threadsafe(lambda: ack_batcher.ack(delivery_tag))
+
+    worker_pool.submit(key, task)
+
+
 def create_subscription_thread(
     queue_name: str,
-    callback: Callable[[bytes], None],
+    callback: Callable[[any, str], None],
     ev_stopping: Event,
+    **options,
 ):
-    thread = Thread(target=run_subscription, args=[queue_name, callback, ev_stopping])
+    thread = Thread(
+        target=run_subscription,
+        args=[queue_name, callback, ev_stopping],
+        kwargs=options,
+    )
     thread.start()
     return thread
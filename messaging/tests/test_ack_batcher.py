@@ -0,0 +1,68 @@
+import unittest
+from time import sleep
+from unittest.mock import Mock, call
+from messaging.ack_batcher import AckBatcher
+
+
+class TestAckBatcher(unittest.TestCase):
+    def setUp(self):
+        self.channel = Mock()
+
+    def test_acks_every_message_by_default(self):
+        ack_batcher = AckBatcher(self.channel)
+        ack_batcher.ack(1)
+        ack_batcher.ack(2)
+        self.assertEqual(
+            self.channel.basic_ack.call_args_list,
+            [call(1, multiple=True), call(2, multiple=True)],
+        )
+
+    def test_acks_in_batches(self):
+        ack_batcher = AckBatcher(self.channel, batch_size=3)
+        for delivery_tag in range(1, 8):
+            ack_batcher.ack(delivery_tag)
+        self.assertEqual(
+            self.channel.basic_ack.call_args_list,
+            [call(3, multiple=True), call(6, multiple=True)],
+        )
+
+        ack_batcher.flush()
+        self.channel.basic_ack.assert_called_with(7, multiple=True)
+
+    def test_acks_only_contiguous_deliveries(self):
+        ack_batcher = AckBatcher(self.channel, batch_size=2)
+        ack_batcher.ack(2)
+        ack_batcher.ack(3)
+        ack_batcher.flush()
+        self.channel.basic_ack.assert_not_called()
+
+        ack_batcher.ack(1)
+        self.channel.basic_ack.assert_called_once_with(3, multiple=True)
+
+    def test_rejected_deliveries_do_not_block_acks(self):
+        ack_batcher = AckBatcher(self.channel, batch_size=3)
+        ack_batcher.ack(1)
+        ack_batcher.reject(3)
+        self.channel.basic_nack.assert_called_once_with(3, requeue=True)
+        self.channel.basic_ack.assert_not_called()
+
+        ack_batcher.ack(2)
+        self.channel.basic_ack.assert_called_once_with(2, multiple=True)
+
+        ack_batcher.ack(4)
+        ack_batcher.flush()
+        self.channel.basic_ack.assert_called_with(4, multiple=True)
+
+    def test_flushes_after_interval(self):
+        ack_batcher = AckBatcher(self.channel, batch_size=10, batch_interval=0.01)
+        ack_batcher.ack(1)
+        ack_batcher.flush_if_due()
+        self.channel.basic_ack.assert_not_called()
+
+        sleep(0.02)
+        ack_batcher.flush_if_due()
+        self.channel.basic_ack.assert_called_once_with(1, multiple=True)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+import asyncio
+import unittest
+from unittest.mock import AsyncMock, Mock, patch
+from messaging.async_publisher import AsyncPublisher
+
+
+class TestAsyncPublisher(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.connection = Mock(is_open=True)
+        self.channel = Mock()
+        self.channel.confirm_delivery.side_effect = (
+            lambda ack_nack_callback, callback: callback(None)
+        )
+
+        connect = patch(
+            "messaging.async_publisher.connect_async",
+            AsyncMock(return_value=self.connection),
+        )
+        open_channel = patch(
+            "messaging.async_publisher.open_channel",
+            AsyncMock(return_value=self.channel),
+        )
+        for patcher in (connect, open_channel):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def close_connection(self):
+        on_close = self.connection.add_on_close_callback.call_args.args[0]
+        on_close(self.connection, "connection reset")
+
+    async def test_publishes_to_configured_exchange(self):
+        publisher = AsyncPublisher(exchange="other")
+        await publisher.connect()
+
+        await publisher.publish("key", {})
+
+        kwargs = self.channel.basic_publish.call_args.kwargs
+        self.assertEqual(kwargs["exchange"], "other")
+
+    async def test_connection_close_fails_unconfirmed(self):
+        publisher = AsyncPublisher(confirm=True)
+        await publisher.connect()
+
+        publishing = asyncio.create_task(publisher.publish("key", {}))
+        await asyncio.sleep(0)
+        self.assertEqual(len(publisher.unconfirmed), 1)
+
+        self.close_connection()
+
+        with self.assertRaises(ConnectionError):
+            await asyncio.wait_for(publishing, timeout=1)
+        self.assertEqual(publisher.unconfirmed, {})
+
+        with self.assertRaises(ConnectionError):
+            await publisher.publish("key", {})
+        self.channel.basic_publish.assert_called_once()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+from pika.spec import BasicProperties
+from messaging.codec import (
+    DEFAULT_CODEC,
+    JsonMessageCodec,
+    MsgpackMessageCodec,
+    decode_message,
+    get_message_codec,
+    get_message_properties,
+    msgpack,
+)
+
+PAYLOAD = {"name": "create_payment", "saga_id": "abcd", "payload": {"n": [1, 2.5]}}
+
+
+class TestMessageCodec(unittest.TestCase):
+    def test_json_round_trip(self):
+        codec = JsonMessageCodec()
+        body = codec.encode(PAYLOAD)
+        self.assertNotIn(b" ", body)
+        self.assertEqual(
+            decode_message(get_message_properties(codec), body), PAYLOAD
+        )
+
+    @unittest.skipIf(msgpack is None, "msgpack is not installed")
+    def test_msgpack_round_trip(self):
+        codec = MsgpackMessageCodec()
+        body = codec.encode(PAYLOAD)
+        self.assertLess(len(body), len(DEFAULT_CODEC.encode(PAYLOAD)))
+        self.assertEqual(
+            decode_message(get_message_properties(codec), body), PAYLOAD
+        )
+
+    @unittest.skipIf(msgpack is None, "msgpack is not installed")
+    def test_decodes_each_message_with_its_content_type(self):
+        json_codec = JsonMessageCodec()
+        msgpack_codec = MsgpackMessageCodec()
+        messages = [
+            (get_message_properties(codec), codec.encode(PAYLOAD))
+            for codec in [json_codec, msgpack_codec, json_codec]
+        ]
+        self.assertEqual(
+            [decode_message(properties, body) for properties, body in messages],
+            [PAYLOAD] * 3,
+        )
+
+    def test_decodes_messages_without_content_type_as_json(self):
+        body = b'{"saga_id": "abcd"}'
+        self.assertEqual(decode_message(None, body), {"saga_id": "abcd"})
+        self.assertEqual(
+            decode_message(BasicProperties(), body), {"saga_id": "abcd"}
+        )
+
+    def test_rejects_unknown_content_type(self):
+        with self.assertRaises(ValueError):
+            get_message_codec("text/plain")
+        with self.assertRaises(ValueError):
+            decode_message(BasicProperties(content_type="text/plain"), b"{}")
+
+
+if __name__ == "__main__":
+    unittest.main()
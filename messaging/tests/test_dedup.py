@@ -0,0 +1,37 @@
+import unittest
+from time import sleep
+from messaging.dedup import MessageDeduplicator
+
+
+class TestMessageDeduplicator(unittest.TestCase):
+    def test_detects_processed_messages(self):
+        deduplicator = MessageDeduplicator()
+        self.assertFalse(deduplicator.is_duplicate("a"))
+
+        deduplicator.add("a")
+
+        self.assertTrue(deduplicator.is_duplicate("a"))
+        self.assertFalse(deduplicator.is_duplicate("b"))
+        self.assertEqual(deduplicator.duplicates, 1)
+
+    def test_forgets_expired_ids(self):
+        deduplicator = MessageDeduplicator(ttl=0.01)
+        deduplicator.add("a")
+        sleep(0.02)
+
+        self.assertFalse(deduplicator.is_duplicate("a"))
+        deduplicator.add("b")
+        self.assertEqual(len(deduplicator), 1)
+
+    def test_keeps_at_most_max_size_ids(self):
+        deduplicator = MessageDeduplicator(max_size=2)
+        for message_id in ("a", "b", "c"):
+            deduplicator.add(message_id)
+
+        self.assertEqual(len(deduplicator), 2)
+        self.assertFalse(deduplicator.is_duplicate("a"))
+        self.assertTrue(deduplicator.is_duplicate("c"))
+
+
+if __name__ == "__main__":
+    unittest.main()
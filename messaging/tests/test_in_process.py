@@ -0,0 +1,269 @@
+import io
+import unittest
+from contextlib import redirect_stdout
+from pika.spec import BasicProperties
+from threading import Event, Lock, Thread
+from messaging.in_process import InProcessBroker, InProcessTransport, topic_matches
+from messaging.publisher import Publisher
+from messaging.dedup import MessageDeduplicator
+from messaging.subscriber import get_message_id, run_subscription
+from messaging.utils import create_default_exchange, initialize_queue
+
+
+def matches(pattern: str, key: str):
+    return topic_matches(pattern.split("."), key.split("."))
+
+
+class TestTopicMatches(unittest.TestCase):
+    def test_matches(self):
+        self.assertTrue(matches("a.b", "a.b"))
+        self.assertTrue(matches("a.*", "a.b"))
+        self.assertTrue(matches("a.#", "a"))
+        self.assertTrue(matches("a.#", "a.b.c"))
+        self.assertTrue(matches("#.c", "a.b.c"))
+        self.assertFalse(matches("a.*", "a"))
+        self.assertFalse(matches("a.*", "a.b.c"))
+        self.assertFalse(matches("a.b", "a.c"))
+
+
+class TestInProcessBroker(unittest.TestCase):
+    def setUp(self):
+        self.broker = InProcessBroker()
+        self.transport = InProcessTransport(self.broker)
+        connection = self.transport.connect()
+        channel = connection.channel()
+        create_default_exchange(channel)
+        initialize_queue("first", "saga.*", channel)
+        initialize_queue("second", "saga.command", channel)
+        connection.close()
+
+    def publish(self, key: str, body: bytes = b"{}"):
+        channel = self.transport.connect().channel()
+        channel.basic_publish(exchange="mini-booking", routing_key=key, body=body)
+
+    def test_routes_by_topic(self):
+        self.publish("saga.command")
+        self.publish("saga.response")
+        self.publish("other.command")
+
+        self.assertEqual(self.broker.message_count("first"), 2)
+        self.assertEqual(self.broker.message_count("second"), 1)
+
+    def test_redelivers_unacked_messages(self):
+        self.publish("saga.command", b"1")
+        self.publish("saga.command", b"2")
+        channel = self.transport.connect().channel()
+        deliveries = channel.consume("second", inactivity_timeout=0)
+
+        first, _, _ = next(deliveries)
+        next(deliveries)
+        channel.basic_ack(first.delivery_tag)
+        channel.close()
+
+        channel = self.transport.connect().channel()
+        method, _, body = next(channel.consume("second", inactivity_timeout=0))
+        self.assertEqual(body, b"2")
+        self.assertTrue(method.redelivered)
+
+    def test_respects_prefetch(self):
+        for _ in range(3):
+            self.publish("saga.command")
+        channel = self.transport.connect().channel()
+        channel.basic_qos(prefetch_count=2)
+        deliveries = channel.consume("second", inactivity_timeout=0)
+
+        self.assertIsNotNone(next(deliveries)[0])
+        self.assertIsNotNone(next(deliveries)[0])
+        self.assertIsNone(next(deliveries)[0])
+
+        channel.basic_ack(2, multiple=True)
+        self.assertEqual(next(deliveries)[0].delivery_tag, 3)
+
+    def test_durable_queues_survive_restart(self):
+        connection = self.transport.connect()
+        connection.channel().queue_declare("transient")
+        self.publish("saga.command")
+        channel = self.transport.connect().channel()
+        next(channel.consume("second", inactivity_timeout=0))
+
+        self.broker.restart()
+
+        self.assertEqual(set(self.broker.queues), {"first", "second"})
+        self.assertEqual(self.broker.message_count("second"), 1)
+
+
+class TestInProcessMessaging(unittest.TestCase):
+    def test_publisher_and_subscription(self):
+        transport = InProcessTransport()
+        connection = transport.connect()
+        channel = connection.channel()
+        create_default_exchange(channel)
+        initialize_queue("responses", "saga.response", channel)
+        connection.close()
+
+        ev_stopping = Event()
+        publisher = Publisher(ev_stopping, confirm=True, transport=transport)
+        publisher.start()
+
+        lock = Lock()
+        received: dict[str, list[int]] = {}
+        ev_received = Event()
+
+        def callback(message: dict, _key: str):
+            with lock:
+                received.setdefault(message["saga_id"], []).append(message["n"])
+                if sum(map(len, received.values())) == 40:
+                    ev_received.set()
+
+        subscription = Thread(
+            target=run_subscription,
+            args=["responses", callback, ev_stopping],
+            kwargs=dict(
+                workers=4,
+                shard_key=lambda message, _key: message["saga_id"],
+                prefetch_count=10,
+                ack_batch_size=5,
+                ack_batch_interval=0.01,
+                transport=transport,
+            ),
+        )
+        subscription.start()
+
+        future = publisher.publish_many(
+            [
+                ("saga.response", {"saga_id": saga_id, "n": n})
+                for n in range(10)
+                for saga_id in "abcd"
+            ]
+        )
+        self.assertEqual(future.result(timeout=5), 40)
+        self.assertTrue(ev_received.wait(5))
+
+        ev_stopping.set()
+        subscription.join(5)
+        publisher.join(5)
+
+        self.assertEqual(received, {saga_id: list(range(10)) for saga_id in "abcd"})
+        self.assertEqual(transport.broker.message_count("responses"), 0)
+        self.assertFalse(subscription.is_alive())
+
+    def test_drops_duplicate_messages(self):
+        transport = InProcessTransport()
+        channel = transport.connect().channel()
+        create_default_exchange(channel)
+        initialize_queue("responses", "saga.response", channel)
+        for message_id, n in [("a", 1), ("b", 2), ("a", 1), ("c", 3)]:
+            channel.basic_publish(
+                exchange="mini-booking",
+                routing_key="saga.response",
+                body=f'{{"n":{n}}}',
+                properties=BasicProperties(message_id=message_id),
+            )
+
+        ev_stopping = Event()
+        received = []
+        ev_received = Event()
+
+        def callback(message: dict, _key: str):
+            received.append((get_message_id(), message["n"]))
+            if message["n"] == 3:
+                ev_received.set()
+
+        deduplicator = MessageDeduplicator()
+        subscription = Thread(
+            target=run_subscription,
+            args=["responses", callback, ev_stopping],
+            kwargs=dict(
+                workers=2,
+                shard_key=lambda message, _key: str(message["n"]),
+                deduplicator=deduplicator,
+                transport=transport,
+            ),
+        )
+        subscription.start()
+        self.assertTrue(ev_received.wait(5))
+        ev_stopping.set()
+        subscription.join(5)
+
+        self.assertEqual(sorted(received), [("a", 1), ("b", 2), ("c", 3)])
+        self.assertEqual(deduplicator.duplicates, 1)
+        self.assertEqual(transport.broker.message_count("responses"), 0)
+
+    def test_subscription_survives_restart(self):
+        transport = InProcessTransport()
+        channel = transport.connect().channel()
+        create_default_exchange(channel)
+        initialize_queue("responses", "saga.response", channel)
+
+        ev_stopping = Event()
+        received = []
+        ev_received = Event()
+
+        def callback(message: dict, _key: str):
+            received.append(message["n"])
+            ev_received.set()
+
+        subscription = Thread(
+            target=run_subscription,
+            args=["responses", callback, ev_stopping],
+            kwargs=dict(transport=transport),
+        )
+        with redirect_stdout(io.StringIO()):
+            subscription.start()
+            for n in range(2):
+                ev_received.clear()
+                if n:
+                    transport.broker.restart()
+                channel = transport.connect().channel()
+                channel.basic_publish(
+                    exchange="mini-booking",
+                    routing_key="saga.response",
+                    body=f'{{"n":{n}}}',
+                )
+                self.assertTrue(ev_received.wait(5))
+            ev_stopping.set()
+            subscription.join(5)
+
+        self.assertEqual(received, [0, 1])
+        self.assertFalse(subscription.is_alive())
+
+    def test_rejects_messages_that_fail_to_decode(self):
+        transport = InProcessTransport()
+        channel = transport.connect().channel()
+        create_default_exchange(channel)
+        initialize_queue("responses", "saga.response", channel)
+        channel.basic_publish(
+            exchange="mini-booking",
+            routing_key="saga.response",
+            body=b"unknown",
+            properties=BasicProperties(content_type="text/plain"),
+        )
+        channel.basic_publish(
+            exchange="mini-booking", routing_key="saga.response", body=b'{"n":1}'
+        )
+
+        ev_stopping = Event()
+        received = []
+        ev_received = Event()
+
+        def callback(message: dict, _key: str):
+            received.append(message)
+            ev_received.set()
+
+        subscription = Thread(
+            target=run_subscription,
+            args=["responses", callback, ev_stopping],
+            kwargs=dict(transport=transport),
+        )
+        with redirect_stdout(io.StringIO()):
+            subscription.start()
+            self.assertTrue(ev_received.wait(5))
+            ev_stopping.set()
+            subscription.join(5)
+
+        self.assertEqual(received, [{"n": 1}])
+        self.assertEqual(transport.broker.message_count("responses"), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,212 @@
+import unittest
+from concurrent.futures import Future
+from threading import Event, Thread
+from unittest.mock import Mock, patch
+from pika.spec import Basic
+from messaging.publisher import Publisher, PublishNackedError, PublishQueueFullError
+
+
+def confirmation(method: Basic.Ack | Basic.Nack):
+    return Mock(method=method)
+
+
+class TestPublisher(unittest.TestCase):
+    def setUp(self):
+        patcher = patch("messaging.transport.BlockingConnection")
+        self.addCleanup(patcher.stop)
+        connection_class = patcher.start()
+        self.connection = connection_class.return_value
+        self.connection.add_callback_threadsafe.side_effect = lambda callback: (
+            callback()
+        )
+        self.channel = self.connection.channel.return_value
+
+    def test_publish_resolves_without_confirms(self):
+        publisher = Publisher(Event())
+
+        future = publisher.publish("key", {"a": 1})
+
+        self.assertTrue(future.result(timeout=0))
+        self.channel.basic_publish.assert_called_once()
+        kwargs = self.channel.basic_publish.call_args.kwargs
+        self.assertEqual(
+            (kwargs["exchange"], kwargs["routing_key"], kwargs["body"]),
+            ("mini-booking", "key", b'{"a":1}'),
+        )
+        self.assertEqual(kwargs["properties"].content_type, "application/json")
+
+    def test_stamps_message_ids(self):
+        publisher = Publisher(Event())
+
+        publisher.publish_many([("key", {}), ("key", {})])
+
+        message_ids = [
+            call.kwargs["properties"].message_id
+            for call in self.channel.basic_publish.call_args_list
+        ]
+        self.assertEqual(len(set(message_ids)), 2)
+        self.assertTrue(all(message_ids))
+
+    def test_keeps_given_message_ids(self):
+        publisher = Publisher(Event())
+
+        publisher.publish("key", {}, message_id="a")
+        publisher.publish_many([("key", {}, "b"), ("key", {})])
+
+        message_ids = [
+            call.kwargs["properties"].message_id
+            for call in self.channel.basic_publish.call_args_list
+        ]
+        self.assertEqual(message_ids[:2], ["a", "b"])
+        self.assertNotIn(message_ids[2], (None, "a", "b"))
+
+    def test_publish_resolves_on_ack(self):
+        publisher = Publisher(Event(), confirm=True)
+        self.channel._impl.confirm_delivery.assert_called_once()
+
+        first = publisher.publish("key", {})
+        second = publisher.publish("key", {})
+        self.assertFalse(first.done())
+        self.assertEqual(publisher.in_flight(), 2)
+
+        publisher._on_delivery_confirmation(confirmation(Basic.Ack(1)))
+        self.assertTrue(first.result(timeout=0))
+        self.assertFalse(second.done())
+
+        publisher._on_delivery_confirmation(confirmation(Basic.Nack(2)))
+        with self.assertRaises(PublishNackedError):
+            second.result(timeout=0)
+        self.assertEqual(publisher.in_flight(), 0)
+
+    def test_publish_many_resolves_on_multiple_ack(self):
+        publisher = Publisher(Event(), confirm=True)
+
+        future = publisher.publish_many([("key", {}), ("key", {}), ("key", {})])
+        publisher._on_delivery_confirmation(confirmation(Basic.Ack(2, multiple=True)))
+        self.assertFalse(future.done())
+        self.assertEqual(publisher.in_flight(), 1)
+
+        publisher._on_delivery_confirmation(confirmation(Basic.Ack(3)))
+        self.assertEqual(future.result(timeout=0), 3)
+        self.connection.add_callback_threadsafe.assert_called_once()
+
+    def test_enqueue_returns_a_future_per_message(self):
+        publisher = Publisher(Event(), confirm=True)
+
+        first, second = publisher.enqueue([("key", {}), ("key", {})])
+        publisher._on_delivery_confirmation(confirmation(Basic.Nack(1)))
+        publisher._on_delivery_confirmation(confirmation(Basic.Ack(2)))
+
+        with self.assertRaises(PublishNackedError):
+            first.result(timeout=0)
+        self.assertTrue(second.result(timeout=0))
+
+    def test_window_limits_unconfirmed_messages(self):
+        publisher = Publisher(Event(), confirm=True, max_in_flight=2)
+
+        future = publisher.publish_many([("key", {})] * 5)
+        self.assertEqual(publisher.in_flight(), 2)
+        self.assertEqual(publisher.queue_depth(), 3)
+
+        publisher._on_delivery_confirmation(confirmation(Basic.Ack(2, multiple=True)))
+        self.assertEqual(publisher.in_flight(), 2)
+        publisher._on_delivery_confirmation(confirmation(Basic.Ack(4, multiple=True)))
+        publisher._on_delivery_confirmation(confirmation(Basic.Ack(5)))
+
+        self.assertEqual(future.result(timeout=0), 5)
+        self.assertEqual(publisher.stats()["flushes"], 3)
+
+    def test_drains_queue_in_batches(self):
+        callbacks = []
+        self.connection.add_callback_threadsafe.side_effect = callbacks.append
+        publisher = Publisher(Event(), batch_size=2)
+
+        future = publisher.publish_many([("key", {})] * 5)
+        self.assertEqual(len(callbacks), 1)
+
+        while callbacks:
+            callbacks.pop(0)()
+
+        self.assertEqual(future.result(timeout=0), 5)
+        self.assertEqual(self.channel.basic_publish.call_count, 5)
+        stats = publisher.stats()
+        self.assertEqual((stats["flushes"], stats["max_flush_size"]), (3, 2))
+        self.assertEqual(stats["max_queue_depth"], 5)
+
+    def test_drops_messages_when_queue_is_full(self):
+        self.connection.add_callback_threadsafe.side_effect = lambda callback: None
+        publisher = Publisher(Event(), max_queued=2, overflow="drop")
+
+        futures = [publisher.publish("key", {}) for _ in range(3)]
+
+        self.assertFalse(futures[1].done())
+        with self.assertRaises(PublishQueueFullError):
+            futures[2].result(timeout=0)
+        self.assertEqual(publisher.stats()["dropped"], 1)
+        self.assertEqual(publisher.queue_depth(), 2)
+
+    def test_times_out_when_queue_stays_full(self):
+        self.connection.add_callback_threadsafe.side_effect = lambda callback: None
+        publisher = Publisher(
+            Event(), max_queued=1, overflow="timeout", enqueue_timeout=0.01
+        )
+
+        publisher.publish("key", {})
+        future = publisher.publish("key", {})
+
+        with self.assertRaises(PublishQueueFullError):
+            future.result(timeout=0)
+        stats = publisher.stats()
+        self.assertEqual(stats["enqueue_waits"], 1)
+        self.assertGreaterEqual(stats["max_enqueue_wait_s"], 0.01)
+
+    def test_blocks_until_queue_has_room(self):
+        callbacks = []
+        self.connection.add_callback_threadsafe.side_effect = callbacks.append
+        publisher = Publisher(Event(), max_queued=1)
+        publisher.publish("key", {})
+        futures = []
+
+        thread = Thread(target=lambda: futures.append(publisher.publish("key", {})))
+        thread.start()
+        thread.join(0.05)
+        self.assertTrue(thread.is_alive())
+
+        callbacks.pop(0)()
+        thread.join(5)
+        callbacks.pop(0)()
+
+        self.assertTrue(futures[0].result(timeout=0))
+        self.assertEqual(publisher.stats()["enqueue_waits"], 1)
+
+    def test_fails_pending_messages_when_io_loop_dies(self):
+        self.connection.add_callback_threadsafe.side_effect = lambda callback: None
+        self.connection.process_data_events.side_effect = ConnectionError("lost")
+        publisher = Publisher(Event(), confirm=True, max_queued=1)
+        publisher._drain()
+        queued = publisher.publish("key", {})
+        unconfirmed = Future()
+        publisher.unconfirmed[1] = unconfirmed
+        futures = []
+
+        blocked = Thread(target=lambda: futures.append(publisher.publish("key", {})))
+        blocked.start()
+        blocked.join(0.05)
+        self.assertTrue(blocked.is_alive())
+
+        with patch("threading.excepthook") as excepthook:
+            publisher.start()
+            publisher.join(5)
+        blocked.join(5)
+        self.assertIsInstance(excepthook.call_args.args[0].exc_value, ConnectionError)
+
+        for future in [queued, unconfirmed, futures[0]]:
+            with self.assertRaises(ConnectionError):
+                future.result(timeout=0)
+        with self.assertRaises(ConnectionError):
+            publisher.publish("key", {}).result(timeout=0)
+        self.assertEqual(publisher.stats()["dropped"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+import unittest
+from threading import Event
+from messaging.in_process import InProcessTransport
+from messaging.publisher_pool import PublisherPool
+from messaging.utils import create_default_exchange, initialize_queue
+
+
+class TestPublisherPool(unittest.TestCase):
+    def setUp(self):
+        self.transport = InProcessTransport()
+        channel = self.transport.connect().channel()
+        create_default_exchange(channel)
+        initialize_queue("first", "first", channel)
+        initialize_queue("second", "second", channel)
+        self.ev_stopping = Event()
+        self.addCleanup(self.ev_stopping.set)
+
+    def create_pool(self, **options):
+        pool = PublisherPool(
+            self.ev_stopping, size=3, transport=self.transport, confirm=True, **options
+        )
+        pool.start()
+        return pool
+
+    def consume(self, queue_name: str):
+        channel = self.transport.connect().channel()
+        bodies = []
+        for method, _, body in channel.consume(queue_name, inactivity_timeout=0):
+            if method is None:
+                break
+            bodies.append(body)
+        return bodies
+
+    def test_round_robin(self):
+        pool = self.create_pool()
+
+        self.assertEqual(pool.publish_many([("first", {})] * 6).result(timeout=5), 6)
+
+        for publisher in pool.publishers:
+            self.assertEqual(publisher.stats()["flushed_messages"], 2)
+
+    def test_routing_key_affinity_keeps_order(self):
+        pool = self.create_pool(affinity="routing_key")
+
+        futures = [
+            pool.publish(key, {"n": n}) for n in range(50) for key in ("first", "second")
+        ]
+        for future in futures:
+            future.result(timeout=5)
+
+        expected = [f'{{"n":{n}}}'.encode() for n in range(50)]
+        self.assertEqual(self.consume("first"), expected)
+        self.assertEqual(self.consume("second"), expected)
+        self.assertIs(pool.get_publisher("first"), pool.get_publisher("first"))
+
+    def test_ordering_key(self):
+        pool = self.create_pool()
+
+        for n in range(20):
+            pool.publish_many([("first", {"n": n})], ordering_key="saga")
+        pool.publish_many([("first", {"n": 20})], ordering_key="saga").result(5)
+
+        self.assertEqual(
+            self.consume("first"), [f'{{"n":{n}}}'.encode() for n in range(21)]
+        )
+        self.assertEqual(pool.stats()["flushed_messages"], 21)
+
+    def test_rejects_unknown_affinity(self):
+        with self.assertRaises(ValueError):
+            PublisherPool(self.ev_stopping, affinity="random", transport=self.transport)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+import unittest
+from threading import Event, Lock
+from messaging.worker_pool import ShardedWorkerPool
+
+
+class TestShardedWorkerPool(unittest.TestCase):
+    def test_keeps_order_per_shard(self):
+        worker_pool = ShardedWorkerPool(4)
+        lock = Lock()
+        results: dict[str, list[int]] = {}
+
+        def task(shard: str, i: int):
+            def run():
+                with lock:
+                    results.setdefault(shard, []).append(i)
+
+            return run
+
+        for i in range(100):
+            for shard in ("a", "b", "c", "d", "e"):
+                worker_pool.submit(shard, task(shard, i))
+        worker_pool.stop()
+
+        for shard in ("a", "b", "c", "d", "e"):
+            self.assertEqual(results[shard], list(range(100)))
+
+    def test_runs_shards_in_parallel(self):
+        worker_pool = ShardedWorkerPool(2)
+        shard_a, shard_b = "a", "b"
+        while worker_pool.get_worker_index(shard_b) == worker_pool.get_worker_index(
+            shard_a
+        ):
+            shard_b += "b"
+        ev_started = Event()
+        ev_released = Event()
+
+        def blocking_task():
+            ev_started.set()
+            ev_released.wait(5)
+
+        worker_pool.submit(shard_a, blocking_task)
+        ev_started.wait(5)
+        worker_pool.submit(shard_b, ev_released.set)
+        worker_pool.stop()
+
+        self.assertTrue(ev_released.is_set())
+
+    def test_survives_failing_tasks(self):
+        worker_pool = ShardedWorkerPool(1)
+        ev_done = Event()
+
+        def failing_task():
+            raise Exception("failed")
+
+        worker_pool.submit("a", failing_task)
+        worker_pool.submit("a", ev_done.set)
+        worker_pool.stop()
+
+        self.assertTrue(ev_done.is_set())
+
+
+if __name__ == "__main__":
+    unittest.main()
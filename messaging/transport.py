@@ -0,0 +1,44 @@
+from pika.adapters.blocking_connection import BlockingChannel, BlockingConnection
+from pika.connection import ConnectionParameters
+from messaging.utils import DEFAULT_EXCHANGE
+
+
+# Creates the connections Publisher and run_subscription work with.
+# Connections and channels follow the pika BlockingConnection API.
+class Transport:
+    exchange: str
+
+    def connect(self):
+        raise NotImplementedError()
+
+    # Enables publisher confirms on the channel, callback receives
+    # Basic.Ack/Basic.Nack method frames on the connection thread.
+    def enable_confirms(self, channel, callback):
+        raise NotImplementedError()
+
+
+class RabbitMQTransport(Transport):
+    def __init__(
+        self,
+        host: str = "localhost",
+        port: int = 5672,
+        exchange: str = DEFAULT_EXCHANGE,
+        heartbeat: int = 10,
+        blocked_connection_timeout: float = 10,
+    ):
+        self.exchange = exchange
+        self.parameters = ConnectionParameters(
+            host=host,
+            port=port,
+            heartbeat=heartbeat,
+            blocked_connection_timeout=blocked_connection_timeout,
+        )
+
+    def connect(self):
+        return BlockingConnection(self.parameters)
+
+    def enable_confirms(self, channel: BlockingChannel, callback):
+        # BlockingChannel.confirm_delivery would wait for every
+        # confirmation, so confirms are enabled on the underlying
+        # channel and processed by the I/O loop instead.
+        channel._impl.confirm_delivery(ack_nack_callback=callback)
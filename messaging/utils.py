@@ -1,16 +1,21 @@
 from pika.channel import Channel
 from pika.spec import ExchangeType
 
-def create_default_exchange(channel: Channel):
+DEFAULT_EXCHANGE = "mini-booking"
+
+
+def create_default_exchange(channel: Channel, exchange: str = DEFAULT_EXCHANGE):
     channel.exchange_declare(
-        exchange="mini-booking",
+        exchange=exchange,
         exchange_type=ExchangeType.topic
     )
 
-def initialize_queue(queue_name: str, key: str, channel: Channel):
+def initialize_queue(
+    queue_name: str, key: str, channel: Channel, exchange: str = DEFAULT_EXCHANGE
+):
     queue = channel.queue_declare(queue=queue_name, durable=True)
     channel.queue_bind(
-        exchange="mini-booking",
+        exchange=exchange,
         queue=queue.method.queue,
         routing_key=key,
     )
@@ -0,0 +1,46 @@
+from queue import Queue
+from threading import Thread
+from typing import Callable
+from zlib import crc32
+
+
+# Runs tasks on a fixed set of worker threads. Tasks with the same shard
+# key always go to the same worker, so they run in submission order while
+# tasks for other shards run in parallel.
+class ShardedWorkerPool:
+    def __init__(self, workers: int):
+        self.queues: list[Queue] = [Queue() for _ in range(workers)]
+        self.threads = [
+            Thread(target=self.__work, args=[queue], daemon=True)
+            for queue in self.queues
+        ]
+
+        for thread in self.threads:
+            thread.start()
+
+    def get_worker_index(self, shard_key: str):
+        return crc32(shard_key.encode()) % len(self.queues)
+
+    def submit(self, shard_key: str, task: Callable[[], None]):
+        self.queues[self.get_worker_index(shard_key)].put(task)
+
+    # Waits for the submitted tasks to finish and stops the workers.
+    def stop(self):
+        for queue in self.queues:
+            queue.put(None)
+
+        for thread in self.threads:
+            thread.join()
+
+    def __work(self, queue: Queue):
+        while True:
+            task = queue.get()
+
+            if task is None:
+                break
+
+            try:
+                task()
+            except Exception as e:
+                print("worker task failed")
+                print("exception:", e)
@@ -0,0 +1,52 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from orchestrated_saga.saga import Saga
+from orchestrated_saga.saga_dao import SagaDao
+
+
+# asyncio facade over SagaDao. psycopg2 is blocking, so every call runs on
+# a bounded executor sized to the connection pool. Each call is one
+# transaction on one pooled connection, the event loop never waits on it.
+class AsyncSagaDao:
+    def __init__(self, saga_dao: SagaDao, max_workers: int | None = None):
+        self.saga_dao = saga_dao
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers or saga_dao.pool.max_size,
+            thread_name_prefix="saga-dao",
+        )
+
+    def generate_id(self):
+        return self.saga_dao.generate_id()
+
+    async def get_one_by_id(self, id: str):
+        return await self.__run(self.saga_dao.get_one_by_id, id)
+
+    async def check_version(self, saga: Saga):
+        return await self.__run(self.saga_dao.check_version, saga)
+
+    # Saves the saga and its outbox messages in one transaction.
+    async def save(
+        self,
+        saga: Saga,
+        is_new: bool = False,
+        outbox_messages: list[tuple[str, dict]] | None = None,
+    ):
+        def save_in_transaction():
+            with self.saga_dao.transaction():
+                if is_new:
+                    self.saga_dao.create(saga)
+                else:
+                    self.saga_dao.update(saga)
+                if outbox_messages:
+                    self.saga_dao.add_outbox_messages(outbox_messages)
+            return saga
+
+        return await self.__run(save_in_transaction)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+    async def __run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(
+            self.executor, func, *args
+        )
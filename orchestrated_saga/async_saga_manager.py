@@ -0,0 +1,135 @@
+import asyncio
+import inspect
+from contextlib import asynccontextmanager
+from messaging.async_publisher import AsyncPublisher
+from orchestrated_saga.async_saga_dao import AsyncSagaDao
+from orchestrated_saga.command import Command
+from orchestrated_saga.command_response import CommandResponse
+from orchestrated_saga.outbox_relay import OutboxRelay
+from orchestrated_saga.payload_stats import PayloadStats
+from orchestrated_saga.saga import Saga, SagaAttributes
+from orchestrated_saga.saga_dao import SagaConflictError
+from orchestrated_saga.saga_manager import get_command_message
+
+
+async def run_callback(callback, saga: Saga):
+    result = callback(saga)
+    if inspect.isawaitable(result):
+        result = await result
+    return result
+
+
+# asyncio counterpart of SagaManager in unit of work mode. Sagas are the
+# same Saga/StepBuilder definitions, step callbacks may be plain functions
+# or coroutines. Responses for one saga are handled one at a time,
+# any number of sagas can be in flight on the event loop.
+class AsyncSagaManager:
+    def __init__(
+        self,
+        saga_dao: AsyncSagaDao,
+        publisher: AsyncPublisher,
+        outbox_relay: OutboxRelay | None = None,
+        payload_stats: PayloadStats | None = None,
+        conflict_retries: int = 3,
+    ):
+        self.saga_dao = saga_dao
+        self.publisher = publisher
+        self.outbox_relay = outbox_relay
+        self.payload_stats = payload_stats
+        # The per saga lock only covers this process, a saga changed by
+        # another instance is loaded and handled again.
+        self.conflict_retries = conflict_retries
+        self.saga_locks: dict[str, tuple[asyncio.Lock, int]] = {}
+
+    async def start_saga(self, saga_class: type[Saga], data: dict):
+        saga = saga_class(SagaAttributes(data=data, status="pending", current_step=0))
+        saga.set_id(self.saga_dao.generate_id())
+        await self.__run_saga(saga, is_new=True)
+        return saga
+
+    async def handle_saga_command_response(self, response: CommandResponse):
+        async with self.__lock_saga(response.saga_id):
+            for attempt in range(self.conflict_retries + 1):
+                saga = await self.saga_dao.get_one_by_id(response.saga_id)
+
+                if saga == None:
+                    raise Exception(f"saga {response.saga_id} not found")
+
+                try:
+                    # The reply may be awaited by a newer version of a
+                    # saga read from the cache.
+                    if not saga.is_awaited_command(response.name, response.member):
+                        await self.saga_dao.check_version(saga)
+                    saga.tick_command_response(
+                        response.ok, response.name, response.member
+                    )
+                    await self.__run_saga(saga, is_new=False)
+                    return
+                except SagaConflictError:
+                    if attempt == self.conflict_retries:
+                        raise
+
+    async def __run_current_step(self, saga: Saga) -> list[Command]:
+        # Parallel member callbacks must be plain functions.
+        if saga.is_parallel_step():
+            return saga.run_parallel_step()
+
+        is_compensation = saga.get_status() == "compensation"
+        step_def = saga.get_current_step_def()
+        callback = (
+            step_def.compensation_callback if is_compensation else step_def.callback
+        )
+
+        if saga.is_local_step():
+            await run_callback(callback, saga)
+            # Local steps change the data in place.
+            saga.mark_dirty("data")
+
+        if saga.is_participant_step():
+            command = await run_callback(callback, saga)
+            return [saga.prepare_command(step_def, command, is_compensation)]
+
+        return []
+
+    async def __run_saga(self, saga: Saga, is_new: bool):
+        commands: list[Command] = []
+
+        while saga.get_status() in ("pending", "compensation"):
+            commands += await self.__run_current_step(saga)
+            saga.tick()
+
+        messages = [get_command_message(command) for command in commands]
+        await self.saga_dao.save(
+            saga, is_new=is_new, outbox_messages=messages if self.outbox_relay else None
+        )
+
+        if not messages:
+            return
+
+        if self.payload_stats:
+            self.payload_stats.record(commands)
+
+        if self.outbox_relay:
+            self.outbox_relay.wake()
+        else:
+            await self.publisher.publish_many(
+                [
+                    (*message, command.message_id)
+                    for message, command in zip(messages, commands)
+                ]
+            )
+
+    @asynccontextmanager
+    async def __lock_saga(self, saga_id: str):
+        lock, users = self.saga_locks.get(saga_id, (asyncio.Lock(), 0))
+        self.saga_locks[saga_id] = (lock, users + 1)
+
+        try:
+            async with lock:
+                yield
+        finally:
+            lock, users = self.saga_locks[saga_id]
+            if users == 1:
+                del self.saga_locks[saga_id]
+            else:
+                self.saga_locks[saga_id] = (lock, users - 1)
@@ -1,5 +1,81 @@
+from uuid import UUID, uuid5
+from zlib import crc32
+
+COMMAND_MESSAGE_ID_NAMESPACE = UUID("aa56a095-494d-4861-b97c-b8082243264a")
+
+
+# Commands of the steps of a participant are routed to
+# <command_key>.command.<participant>. Commands of steps that do not
+# name their participant go to <command_key>.command.
+def get_command_routing_key(command_key: str, participant: str | None = None):
+    if participant is None:
+        return f"{command_key}.command"
+    return f"{command_key}.command.{participant}"
+
+
+# Commands of steps that do not name their participant wait in the
+# shared <command_key>_commands queue.
+def get_command_queue_name(command_key: str, participant: str | None = None):
+    if participant is None:
+        return f"{command_key}_commands"
+    return f"{participant}_{command_key}_commands"
+
+
+# Responses to the commands of a saga go to <command_key>.command_response,
+# or to <command_key>.command_response.<shard> when its responses are
+# spread over several queues.
+def get_response_routing_key(command_key: str, shard: int | None = None):
+    if shard is None:
+        return f"{command_key}.command_response"
+    return f"{command_key}.command_response.{shard}"
+
+
+def get_response_queue_name(command_key: str, shard: int | None = None):
+    if shard is None:
+        return f"{command_key}_command_responses"
+    return f"{command_key}_command_responses_{shard}"
+
+
+def get_response_shard(saga_id: str, shards: int):
+    return crc32(saga_id.encode()) % shards
+
+
+# The command a saga sends for a step always has the same message id, so
+# a command published twice is dropped by the participant's deduplicator.
+def get_command_message_id(
+    saga_id: str,
+    step: int,
+    name: str,
+    is_compensation: bool,
+    member: int | None = None,
+):
+    return uuid5(
+        COMMAND_MESSAGE_ID_NAMESPACE,
+        f"{saga_id}:{step}:{name}:{int(is_compensation)}:{member}",
+    ).hex
+
+
 class Command:
-    def __init__(self, name: str, saga_id: str, payload: dict):
+    def __init__(
+        self,
+        name: str,
+        saga_id: str,
+        payload: dict,
+        routing_key: str | None = None,
+        reply_to: str | None = None,
+        member: int | None = None,
+        message_id: str | None = None,
+    ):
         self.name = name
         self.saga_id = saga_id
         self.payload = payload
+        # Set by the saga from the step definition unless given.
+        self.routing_key = routing_key
+        # Routing key the participant sends its response to, set by the
+        # saga unless given.
+        self.reply_to = reply_to
+        # Index of the parallel step member the command was sent for,
+        # participants send it back with the response.
+        self.member = member
+        # Message id of the command, set by the saga unless given.
+        self.message_id = message_id
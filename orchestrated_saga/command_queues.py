@@ -0,0 +1,82 @@
+from pika.channel import Channel
+from messaging import initialize_queue
+from orchestrated_saga.command import (
+    get_command_queue_name,
+    get_command_routing_key,
+    get_response_queue_name,
+    get_response_routing_key,
+)
+from orchestrated_saga.saga import Saga
+from orchestrated_saga.step import ParallelStepDef, ParticipantStepDef
+
+
+def get_participant_step_defs(saga_class: type[Saga]):
+    for step_def in saga_class.step_defs:
+        members = (
+            step_def.members if isinstance(step_def, ParallelStepDef) else [step_def]
+        )
+        for member in members:
+            if isinstance(member, ParticipantStepDef):
+                yield member
+
+
+# Returns the named participants of a saga, and None last if some of its
+# participant steps do not name their participant.
+def get_saga_participants(saga_class: type[Saga], include_unnamed: bool = False):
+    participants: list[str | None] = []
+    has_unnamed = False
+
+    for step_def in get_participant_step_defs(saga_class):
+        if step_def.participant is None:
+            has_unnamed = True
+        elif step_def.participant not in participants:
+            participants.append(step_def.participant)
+
+    if include_unnamed and has_unnamed:
+        participants.append(None)
+
+    return participants
+
+
+# Declares the command queue of a participant, bound only to the
+# commands routed to it, or the shared command queue if participant is
+# None. Returns the queue name.
+def initialize_command_queue(
+    channel: Channel, command_key: str, participant: str | None = None
+):
+    queue_name = get_command_queue_name(command_key, participant)
+    initialize_queue(
+        queue_name, get_command_routing_key(command_key, participant), channel
+    )
+    return queue_name
+
+
+# Declares the command queues of all the participants of a saga, and
+# the shared command queue if steps do not name their participant, so
+# no command is routed to a key without a queue.
+def initialize_command_queues(channel: Channel, saga_class: type[Saga]):
+    return [
+        initialize_command_queue(channel, saga_class.command_key, participant)
+        for participant in get_saga_participants(saga_class, include_unnamed=True)
+    ]
+
+
+# Declares the response queues of a saga, one per shard, or the single
+# response queue if its responses are not sharded. Returns the queue
+# names by shard.
+def initialize_response_queues(channel: Channel, saga_class: type[Saga]):
+    shards = (
+        [None]
+        if saga_class.response_shards is None
+        else range(saga_class.response_shards)
+    )
+    queue_names: list[str] = []
+
+    for shard in shards:
+        queue_name = get_response_queue_name(saga_class.command_key, shard)
+        initialize_queue(
+            queue_name, get_response_routing_key(saga_class.command_key, shard), channel
+        )
+        queue_names.append(queue_name)
+
+    return queue_names
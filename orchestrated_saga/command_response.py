@@ -1,5 +1,17 @@
 class CommandResponse:
-    def __init__(self, name: str, saga_id: str, ok: bool):
+    def __init__(
+        self,
+        name: str,
+        saga_id: str,
+        ok: bool,
+        message_id: str | None = None,
+        member: int | None = None,
+    ):
         self.name = name
         self.saga_id = saga_id
         self.ok = ok
+        # Id of the message that carried the response, if known.
+        self.message_id = message_id
+        # Member of the parallel step the command was sent for, echoed
+        # from the command.
+        self.member = member
@@ -0,0 +1,194 @@
+from contextlib import contextmanager
+from threading import Condition
+from time import monotonic
+from typing import Callable, TypedDict
+from psycopg2.extensions import (
+    TRANSACTION_STATUS_IDLE,
+    TRANSACTION_STATUS_INERROR,
+    TRANSACTION_STATUS_INTRANS,
+)
+
+
+class ConnectionPoolTimeout(Exception):
+    pass
+
+
+class ConnectionPoolStats(TypedDict):
+    max_size: int
+    size: int
+    in_use: int
+    idle: int
+    saturation: float
+    checkouts: int
+    waits: int
+    timeouts: int
+    total_wait_time: float
+    max_wait_time: float
+    created: int
+    discarded: int
+
+
+# Bounded pool of psycopg2 connections that can be shared between threads.
+# A connection is validated before it is handed out if it has been idle
+# for longer than validate_after seconds, and broken connections are
+# closed and replaced instead of being returned to the pool.
+class ConnectionPool:
+    def __init__(
+        self,
+        connect: Callable[[], any],
+        max_size: int = 10,
+        timeout: float = 30,
+        validate_after: float = 30,
+    ):
+        self.connect = connect
+        self.max_size = max_size
+        self.timeout = timeout
+        self.validate_after = validate_after
+        self.condition = Condition()
+        self.idle: list[tuple[any, float]] = []
+        self.size = 0
+        self.checkouts = 0
+        self.waits = 0
+        self.timeouts = 0
+        self.total_wait_time = 0.0
+        self.max_wait_time = 0.0
+        self.created = 0
+        self.discarded = 0
+
+    @contextmanager
+    def connection(self):
+        connection = self.get_connection()
+        try:
+            yield connection
+        finally:
+            self.put_connection(connection)
+
+    def get_connection(self):
+        while True:
+            connection, last_used = self.__checkout()
+
+            if connection is None:
+                return self.__create_connection()
+
+            if self.__is_valid(connection, last_used):
+                return connection
+
+            self.__discard(connection)
+
+    def put_connection(self, connection: any):
+        if connection.closed:
+            self.__discard(connection)
+            return
+
+        try:
+            status = connection.get_transaction_status()
+            if status in (TRANSACTION_STATUS_INTRANS, TRANSACTION_STATUS_INERROR):
+                connection.rollback()
+            elif status != TRANSACTION_STATUS_IDLE:
+                self.__discard(connection)
+                return
+        except Exception:
+            self.__discard(connection)
+            return
+
+        with self.condition:
+            self.idle.append((connection, monotonic()))
+            self.condition.notify()
+
+    def stats(self) -> ConnectionPoolStats:
+        with self.condition:
+            in_use = self.size - len(self.idle)
+            return ConnectionPoolStats(
+                max_size=self.max_size,
+                size=self.size,
+                in_use=in_use,
+                idle=len(self.idle),
+                saturation=in_use / self.max_size,
+                checkouts=self.checkouts,
+                waits=self.waits,
+                timeouts=self.timeouts,
+                total_wait_time=self.total_wait_time,
+                max_wait_time=self.max_wait_time,
+                created=self.created,
+                discarded=self.discarded,
+            )
+
+    def close(self):
+        with self.condition:
+            idle = self.idle
+            self.idle = []
+            self.size -= len(idle)
+
+        for connection, _ in idle:
+            connection.close()
+
+    # Returns an idle connection, or (None, 0) when the caller
+    # is allowed to open a new one.
+    def __checkout(self):
+        started_at = monotonic()
+        deadline = started_at + self.timeout
+        waited = False
+
+        with self.condition:
+            while not self.idle and self.size >= self.max_size:
+                remaining = deadline - monotonic()
+                if remaining <= 0:
+                    self.timeouts += 1
+                    raise ConnectionPoolTimeout(
+                        f"no connection available after {self.timeout}s"
+                    )
+                waited = True
+                self.condition.wait(remaining)
+
+            wait_time = monotonic() - started_at
+            self.checkouts += 1
+            self.total_wait_time += wait_time
+            self.max_wait_time = max(self.max_wait_time, wait_time)
+            if waited:
+                self.waits += 1
+
+            if self.idle:
+                return self.idle.pop()
+
+            self.size += 1
+            return None, 0
+
+    def __create_connection(self):
+        try:
+            connection = self.connect()
+        except BaseException:
+            with self.condition:
+                self.size -= 1
+                self.condition.notify()
+            raise
+
+        with self.condition:
+            self.created += 1
+
+        return connection
+
+    def __is_valid(self, connection: any, last_used: float):
+        if connection.closed:
+            return False
+
+        if monotonic() - last_used < self.validate_after:
+            return True
+
+        try:
+            with connection.cursor() as curs:
+                curs.execute("SELECT 1")
+            connection.rollback()
+            return True
+        except Exception:
+            return False
+
+    def __discard(self, connection: any):
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+        with self.condition:
+            self.size -= 1
+            self.discarded += 1
+            self.condition.notify()
@@ -0,0 +1,4 @@
+-- Cached sagas are checked by the version of migration 9, the
+-- notifications are opt-in now, see optional/saga_update_notifications.sql.
+DROP TRIGGER IF EXISTS sagas_notify_update ON sagas;
+DROP FUNCTION IF EXISTS notify_saga_update();
@@ -0,0 +1,5 @@
+-- Command the saga waits for, replies to other commands are ignored.
+ALTER TABLE sagas ADD COLUMN awaited_command text;
+ALTER TABLE sagas ADD COLUMN awaited_compensation boolean NOT NULL DEFAULT false;
+ALTER TABLE sagas_archive ADD COLUMN awaited_command text;
+ALTER TABLE sagas_archive ADD COLUMN awaited_compensation boolean NOT NULL DEFAULT false;
@@ -0,0 +1,4 @@
+-- Response shard of the saga, so every instance only recovers and times
+-- out the sagas whose responses it handles. Null for unsharded sagas.
+ALTER TABLE sagas ADD COLUMN response_shard integer;
+ALTER TABLE sagas_archive ADD COLUMN response_shard integer;
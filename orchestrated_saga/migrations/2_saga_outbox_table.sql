@@ -0,0 +1,7 @@
+CREATE TABLE saga_outbox
+(
+    id bigserial,
+    routing_key character varying NOT NULL,
+    payload text NOT NULL,
+    PRIMARY KEY (id)
+);
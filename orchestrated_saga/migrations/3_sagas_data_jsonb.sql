@@ -0,0 +1,5 @@
+ALTER TABLE sagas
+    ALTER COLUMN data TYPE jsonb USING data::jsonb,
+    ALTER COLUMN data DROP NOT NULL,
+    ADD COLUMN data_codec character varying,
+    ADD COLUMN data_blob bytea;
@@ -0,0 +1,14 @@
+-- Only needed when several orchestrator instances use a SagaCache.
+CREATE FUNCTION notify_saga_update() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify(
+        'saga_updates',
+        current_setting('application_name') || ':' || replace(NEW.id::text, '-', '')
+    );
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER sagas_notify_update
+AFTER UPDATE ON sagas
+FOR EACH ROW EXECUTE FUNCTION notify_saga_update();
@@ -0,0 +1,7 @@
+ALTER TABLE sagas
+    ADD COLUMN created_at timestamptz NOT NULL DEFAULT now(),
+    ADD COLUMN updated_at timestamptz NOT NULL DEFAULT now();
+
+-- Only in-flight sagas are indexed, in the keyset order of get_stale_saga_ids.
+CREATE INDEX sagas_in_flight_updated_at ON sagas (updated_at, id)
+WHERE status NOT IN ('done', 'failed');
@@ -0,0 +1,12 @@
+CREATE TABLE sagas_archive
+(
+    LIKE sagas INCLUDING DEFAULTS,
+    archived_at timestamptz NOT NULL DEFAULT now(),
+    PRIMARY KEY (id)
+);
+
+CREATE INDEX sagas_archive_archived_at ON sagas_archive (archived_at);
+
+-- Finished sagas waiting to be archived, kept small by the archiver.
+CREATE INDEX sagas_finished_updated_at ON sagas (updated_at)
+WHERE status IN ('done', 'failed');
@@ -0,0 +1,2 @@
+ALTER TABLE sagas ADD COLUMN step_results jsonb;
+ALTER TABLE sagas_archive ADD COLUMN step_results jsonb;
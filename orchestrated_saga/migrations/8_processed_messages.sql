@@ -0,0 +1,10 @@
+-- Ids of the messages the orchestrator has processed, written in the
+-- transaction that processed them. Pruned by the archiver.
+CREATE TABLE processed_messages
+(
+    message_id character varying NOT NULL,
+    processed_at timestamptz NOT NULL DEFAULT now(),
+    PRIMARY KEY (message_id)
+);
+
+CREATE INDEX processed_messages_processed_at ON processed_messages (processed_at);
@@ -0,0 +1,3 @@
+-- Incremented by every update, updates compare and swap it.
+ALTER TABLE sagas ADD COLUMN version integer NOT NULL DEFAULT 0;
+ALTER TABLE sagas_archive ADD COLUMN version integer NOT NULL DEFAULT 0;
@@ -0,0 +1,17 @@
+-- Opt-in, not a migration: notifies every update of the sagas table for
+-- SagaCacheInvalidator. Every notification takes a global lock at
+-- commit, install it only if conflicts on stale cached sagas cost more.
+-- Drop it with DROP FUNCTION notify_saga_update() CASCADE.
+CREATE FUNCTION notify_saga_update() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify(
+        'saga_updates',
+        current_setting('application_name') || ':' || replace(NEW.id::text, '-', '')
+    );
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER sagas_notify_update
+AFTER UPDATE ON sagas
+FOR EACH ROW EXECUTE FUNCTION notify_saga_update();
@@ -0,0 +1,60 @@
+from threading import Event, Thread
+from messaging.publisher import Publisher
+from messaging.publisher_pool import PublisherPool
+from orchestrated_saga.saga_dao import SagaDao
+
+
+# Drains the saga outbox into the publisher. Rows are deleted only
+# after the publisher confirmed the whole batch, so every command
+# is delivered at least once. Message ids are derived from the row ids,
+# a batch published again after a failure is dropped by the participants'
+# deduplicators.
+class OutboxRelay(Thread):
+    def __init__(
+        self,
+        saga_dao: SagaDao,
+        publisher: Publisher | PublisherPool,
+        ev_stopping: Event,
+        batch_size: int = 500,
+        poll_interval: float = 1,
+        publish_timeout: float = 10,
+    ) -> None:
+        Thread.__init__(self, daemon=True)
+        self.saga_dao = saga_dao
+        self.publisher = publisher
+        self.ev_stopping = ev_stopping
+        self.ev_wake = Event()
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.publish_timeout = publish_timeout
+
+    def wake(self):
+        self.ev_wake.set()
+
+    def run(self):
+        while not self.ev_stopping.is_set():
+            self.ev_wake.clear()
+
+            try:
+                relayed = self.relay_batch()
+            except Exception as e:
+                print("failed to relay outbox messages")
+                print("exception:", e)
+                relayed = 0
+
+            if relayed < self.batch_size:
+                self.ev_wake.wait(self.poll_interval)
+
+    def relay_batch(self):
+        with self.saga_dao.transaction():
+            messages = self.saga_dao.get_outbox_messages(self.batch_size)
+
+            if not messages:
+                return 0
+
+            self.publisher.publish_many(
+                [(key, payload, f"outbox-{id}") for id, key, payload in messages]
+            ).result(timeout=self.publish_timeout)
+            self.saga_dao.delete_outbox_messages([id for id, _, _ in messages])
+
+        return len(messages)
@@ -0,0 +1,43 @@
+from threading import Lock
+from typing import TypedDict
+from messaging.codec import DEFAULT_CODEC, MessageCodec
+from orchestrated_saga.command import Command
+
+
+class PayloadSizeStats(TypedDict):
+    count: int
+    total_bytes: int
+    max_bytes: int
+
+
+# Sizes of the payloads of the commands sent, per command name, as
+# encoded by the publisher's codec. Encoding the payloads again costs
+# some time, so managers only record them when given a PayloadStats.
+class PayloadStats:
+    def __init__(self, codec: MessageCodec = DEFAULT_CODEC):
+        self.codec = codec
+        self.lock = Lock()
+        self.sizes: dict[str, list[int]] = {}
+
+    def record(self, commands: list[Command]):
+        sizes = [
+            (command.name, len(self.codec.encode(command.payload)))
+            for command in commands
+        ]
+
+        with self.lock:
+            for name, size in sizes:
+                # count, total bytes, max bytes
+                entry = self.sizes.setdefault(name, [0, 0, 0])
+                entry[0] += 1
+                entry[1] += size
+                entry[2] = max(entry[2], size)
+
+    def stats(self) -> dict[str, PayloadSizeStats]:
+        with self.lock:
+            return {
+                name: PayloadSizeStats(
+                    count=count, total_bytes=total_bytes, max_bytes=max_bytes
+                )
+                for name, (count, total_bytes, max_bytes) in self.sizes.items()
+            }
@@ -0,0 +1,32 @@
+from zlib import crc32
+
+
+def get_shard_owner(shard: int, instances: list[str]):
+    return max(instances, key=lambda instance: crc32(f"{instance}/{shard}".encode()))
+
+
+# Shards owned by an instance of the orchestrator. A shard goes to the
+# instance with the highest hash of instance name and shard (rendezvous
+# hashing), so every instance computes the same owners from the list of
+# instances, and an added instance only takes shards from the others.
+def get_owned_shards(instance: str, instances: list[str], shards: int):
+    if instance not in instances:
+        raise ValueError(f"{instance} is not one of the instances {instances}")
+
+    return [
+        shard for shard in range(shards) if get_shard_owner(shard, instances) == instance
+    ]
+
+
+# Shards that change owner when the instances change, as
+# {shard: (old owner, new owner)}.
+def get_shard_moves(shards: int, old_instances: list[str], new_instances: list[str]):
+    moves: dict[int, tuple[str, str]] = {}
+
+    for shard in range(shards):
+        old_owner = get_shard_owner(shard, old_instances)
+        new_owner = get_shard_owner(shard, new_instances)
+        if old_owner != new_owner:
+            moves[shard] = (old_owner, new_owner)
+
+    return moves
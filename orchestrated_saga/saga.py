@@ -1,139 +1,248 @@
-from typing import TypedDict
-from orchestrated_saga.step import LocalStepDef, ParticipantStepDef, StepDef
+from typing import NamedTuple, TypedDict
+from orchestrated_saga.command import (
+    Command,
+    get_command_message_id,
+    get_command_routing_key,
+    get_response_routing_key,
+    get_response_shard,
+)
+from orchestrated_saga.step import (
+    LocalStepDef,
+    ParallelStepDef,
+    ParticipantStepDef,
+    StepDef,
+)
+
+LOCAL_STEP = "local"
+PARTICIPANT_STEP = "participant"
+PARALLEL_STEP = "parallel"
+
+# States of the members of a parallel step.
+MEMBER_PENDING = "pending"
+MEMBER_OK = "ok"
+MEMBER_FAILED = "failed"
+MEMBER_COMPENSATING = "compensating"
+MEMBER_COMPENSATED = "compensated"
+
+
+def get_step_kind(step_def: StepDef):
+    if isinstance(step_def, LocalStepDef):
+        return LOCAL_STEP
+    if isinstance(step_def, ParticipantStepDef):
+        return PARTICIPANT_STEP
+    if isinstance(step_def, ParallelStepDef):
+        return PARALLEL_STEP
+    return None
+
+
+class Transition(NamedTuple):
+    status: str
+    step_delta: int = 0
 
 
-class SagaState:
-    def __init__(self, saga: "Saga"):
-        self.saga = saga
+# Placeholder compiled into the transition tables for the transitions of
+# parallel steps that depend on the states of their members. Saga makes
+# these transitions itself, sequential steps never see the placeholder.
+MEMBER_TRANSITION = Transition("parallel")
 
-    def set_state(self, state: type["SagaState"]):
-        self.saga.state = state(self.saga)
 
-    def set_status(self, status: str):
-        if self.saga.get_status() != status:
-            self.saga.set_status(status)
-            self.set_state(states[status])
+# States are stateless singletons that describe the transitions of a
+# status for a step of the given kind and position. They are only used
+# to compile the transition tables of saga classes. Parallel steps that
+# are compensated or wait for responses depend on the states of their
+# members, those transitions are made by Saga itself.
+class SagaState:
+    def tick(self, kind: str | None, is_first: bool, is_last: bool):
+        return None
 
+    def tick_command_response(self, ok: bool, is_first: bool, is_last: bool):
+        return None
 
-class Pending(SagaState):
-    def tick(self):
-        if self.saga.is_participant_step():
-            self.set_status("processing")
-        elif self.saga.is_last_step():
-            self.set_status("done")
-        elif self.saga.is_local_step():
-            self.saga.increment_step()
 
-    def tick_command_response(self, ok: bool):
-        pass
+class Pending(SagaState):
+    def tick(self, kind: str | None, is_first: bool, is_last: bool):
+        if kind == PARTICIPANT_STEP or kind == PARALLEL_STEP:
+            return Transition("processing")
+        elif is_last:
+            return Transition("done")
+        elif kind == LOCAL_STEP:
+            return Transition("pending", 1)
 
 
 class Processing(SagaState):
-    def tick(self):
-        if self.saga.is_last_step():
-            self.set_status("done")
+    def tick(self, kind: str | None, is_first: bool, is_last: bool):
+        if is_last:
+            return Transition("done")
         else:
-            self.saga.increment_step()
-            self.set_status("pending")
+            return Transition("pending", 1)
 
-    def tick_command_response(self, ok: bool):
+    def tick_command_response(self, ok: bool, is_first: bool, is_last: bool):
         if ok:
-            if self.saga.is_last_step():
-                self.set_status("done")
+            if is_last:
+                return Transition("done")
             else:
-                self.saga.increment_step()
-                self.set_status("pending")
+                return Transition("pending", 1)
         else:
-            if self.saga.is_first_step():
-                self.set_status("failed")
+            if is_first:
+                return Transition("failed")
             else:
-                self.saga.decrement_step()
-                self.set_status("compensation")
+                return Transition("compensation", -1)
 
 
 class Compensation(SagaState):
-    def tick(self):
-        if self.saga.is_local_step():
-            if self.saga.is_first_step():
-                self.set_status("failed")
+    def tick(self, kind: str | None, is_first: bool, is_last: bool):
+        if kind == LOCAL_STEP:
+            if is_first:
+                return Transition("failed")
             else:
-                self.saga.decrement_step()
-        elif self.saga.is_first_step():
-            self.set_status("failed")
+                return Transition("compensation", -1)
+        elif is_first:
+            return Transition("failed")
         else:
-            self.set_status("compensating")
-
-    def tick_command_response(self, ok: bool):
-        pass
+            return Transition("compensating")
 
 
 class Compensating(SagaState):
-    def tick(self):
-        pass
-
-    def tick_command_response(self, ok: bool):
+    def tick_command_response(self, ok: bool, is_first: bool, is_last: bool):
         if ok:
-            if self.saga.is_first_step():
-                self.set_status("done")
+            if is_first:
+                return Transition("done")
             else:
-                self.saga.decrement_step()
-                self.set_status("compensation")
-        elif self.saga.is_first_step():
-            self.set_status("failed")
+                return Transition("compensation", -1)
+        elif is_first:
+            return Transition("failed")
         else:
-            self.saga.decrement_step()
-            self.set_status("compensation")
+            return Transition("compensation", -1)
 
 
 class Failed(SagaState):
-    def tick(self):
-        pass
-
-    def tick_command_response(self, ok: bool):
-        pass
+    pass
 
 
 class Done(SagaState):
-    def tick(self):
-        pass
-
-    def tick_command_response(self, ok: bool):
-        pass
+    pass
 
 
 states: dict[str, SagaState] = {
-    "pending": Pending,
-    "processing": Processing,
-    "compensation": Compensation,
-    "compensating": Compensating,
-    "failed": Failed,
-    "done": Done,
+    "pending": Pending(),
+    "processing": Processing(),
+    "compensation": Compensation(),
+    "compensating": Compensating(),
+    "failed": Failed(),
+    "done": Done(),
 }
 
 
-class SagaAttributes(TypedDict):
+# Immutable plan of a saga class: the kind of every step and the
+# transition of every (status, step) pair, so a tick is a table lookup.
+class StepPlan:
+    def __init__(self, step_defs: list[StepDef]):
+        self.step_defs = tuple(step_defs)
+        self.kinds = tuple(get_step_kind(step_def) for step_def in step_defs)
+        self.timeouts = tuple(
+            getattr(step_def, "timeout", None) for step_def in step_defs
+        )
+        self.tick_transitions = {
+            status: tuple(
+                MEMBER_TRANSITION
+                if kind == PARALLEL_STEP and status == "compensation"
+                else state.tick(kind, *self.get_position(step))
+                for step, kind in enumerate(self.kinds)
+            )
+            for status, state in states.items()
+        }
+        self.response_transitions = {
+            (status, ok): tuple(
+                MEMBER_TRANSITION
+                if kind == PARALLEL_STEP and status in ("processing", "compensating")
+                else state.tick_command_response(ok, *self.get_position(step))
+                for step, kind in enumerate(self.kinds)
+            )
+            for status, state in states.items()
+            for ok in (True, False)
+        }
+
+    def get_position(self, step: int):
+        return step == 0, step == len(self.kinds) - 1
+
+    def get_kind(self, step: int):
+        return self.kinds[step] if 0 <= step < len(self.kinds) else None
+
+    def get_timeout(self, step: int):
+        return self.timeouts[step] if 0 <= step < len(self.timeouts) else None
+
+    def get_tick_transition(self, status: str, step: int) -> Transition | None:
+        transitions = self.tick_transitions[status]
+        if 0 <= step < len(transitions):
+            return transitions[step]
+        return states[status].tick(self.get_kind(step), *self.get_position(step))
+
+    def get_response_transition(
+        self, status: str, step: int, ok: bool
+    ) -> Transition | None:
+        transitions = self.response_transitions[(status, ok)]
+        if 0 <= step < len(transitions):
+            return transitions[step]
+        return states[status].tick_command_response(ok, *self.get_position(step))
+
+
+class SagaAttributes(TypedDict, total=False):
     id: str
     data: dict
     current_step: int
     status: str
+    # Progress of the current parallel step.
+    step_results: dict | None
+    # Command of the participant step the saga waits for, replies to
+    # other commands are late or duplicates.
+    awaited_command: str | None
+    awaited_compensation: bool
+    # Version of the saga row the saga was loaded from or saved to.
+    version: int
 
 
 class Saga:
     command_key: str
-    step_defs: list[StepDef]
+    # Number of response queues the responses of the sagas are spread
+    # over by saga id, a single queue if None.
+    response_shards: int | None = None
+    step_defs: list[StepDef] = []
+    step_plan = StepPlan([])
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.step_plan = StepPlan(cls.step_defs)
 
     def __init__(self, attributes: SagaAttributes):
         self.attributes = attributes
-        self.state = states[self.get_status()](self)
+        # Attributes changed since the saga was loaded or saved. Data
+        # changed in place must be marked with mark_dirty("data").
+        self.dirty_attributes: set[str] = set()
+
+    @property
+    def state(self):
+        return states[self.get_status()]
 
     def get_current_step_def(self):
         return self.step_defs[self.get_current_step()]
 
+    def get_current_step_kind(self):
+        return self.step_plan.get_kind(self.get_current_step())
+
+    # Timeout of the participant step the saga waits for, if any.
+    def get_step_timeout(self):
+        if self.get_status() not in ("processing", "compensating"):
+            return None
+        return self.step_plan.get_timeout(self.get_current_step())
+
     def is_local_step(self):
-        return isinstance(self.get_current_step_def(), LocalStepDef)
+        return self.get_current_step_kind() == LOCAL_STEP
 
     def is_participant_step(self):
-        return isinstance(self.get_current_step_def(), ParticipantStepDef)
+        return self.get_current_step_kind() == PARTICIPANT_STEP
+
+    def is_parallel_step(self):
+        return self.get_current_step_kind() == PARALLEL_STEP
 
     def increment_step(self):
         self.set_current_step(self.get_current_step() + 1)
@@ -148,10 +257,270 @@ class Saga:
         return self.get_current_step() == 0
 
     def tick(self):
-        self.state.tick()
+        attributes = self.attributes
+        transition = self.step_plan.get_tick_transition(
+            attributes["status"], attributes["current_step"]
+        )
+        if transition is MEMBER_TRANSITION:
+            transition = self.__get_parallel_compensation_transition()
+
+        self.apply_transition(transition)
+
+    # name is the name of the command responded to, replies to a command
+    # the saga does not wait for are ignored. Timed out steps have no
+    # response name. member is the index of the parallel step member the
+    # command was sent for.
+    def tick_command_response(
+        self, ok: bool, name: str | None = None, member: int | None = None
+    ):
+        if name is not None and not self.is_awaited_command(name, member):
+            return
+
+        attributes = self.attributes
+        transition = self.step_plan.get_response_transition(
+            attributes["status"], attributes["current_step"], ok
+        )
+        if transition is MEMBER_TRANSITION:
+            transition = self.__get_parallel_response_transition(ok, name, member)
+
+        self.apply_transition(transition)
+
+    def apply_transition(self, transition: Transition | None):
+        if transition is None:
+            return
+
+        status, step_delta = transition
+        if step_delta:
+            self.set_current_step(self.get_current_step() + step_delta)
+        if status != self.get_status():
+            self.set_status(status)
+
+    def get_response_shard(self):
+        if self.response_shards is None:
+            return None
+        return get_response_shard(self.get_id(), self.response_shards)
+
+    # Routing key of the response queue of the saga's shard.
+    def get_reply_to(self):
+        shard = self.get_response_shard()
+        if shard is None:
+            return get_response_routing_key(self.command_key)
+        return get_response_routing_key(self.command_key, shard)
+
+    # Routes a command returned by a step callback to the participant of
+    # the step, sets the routing key of the response and projects its
+    # payload to what the step declared. The command of a sequential step
+    # becomes the awaited command, the commands of parallel step members
+    # carry the index of their member. The message id is derived from the
+    # step and the command.
+    def prepare_command(
+        self,
+        step_def: ParticipantStepDef,
+        command: Command,
+        is_compensation=False,
+        member: int | None = None,
+    ):
+        if member is None:
+            self.set_awaited_command(command.name, is_compensation)
+        else:
+            command.member = member
+
+        if command.routing_key is None:
+            command.routing_key = get_command_routing_key(
+                self.command_key, step_def.participant
+            )
+        if command.reply_to is None:
+            command.reply_to = self.get_reply_to()
+        if command.message_id is None:
+            command.message_id = get_command_message_id(
+                self.get_id(),
+                self.get_current_step(),
+                command.name,
+                is_compensation,
+                member,
+            )
+
+        project = (
+            step_def.project_compensation_payload
+            if is_compensation
+            else step_def.project_payload
+        )
+        if project:
+            command.payload = project(command.payload)
+
+        return command
+
+    # Returns the commands of the current parallel step: the commands of
+    # all the members when the saga is pending, the compensations of the
+    # members that succeeded when it is in compensation. The step results
+    # keep the state and the awaited command of every member by index.
+    def run_parallel_step(self) -> list[Command]:
+        members = self.get_current_step_def().members
+        commands: list[Command] = []
+
+        if self.get_status() == "pending":
+            results = {
+                "members": [MEMBER_PENDING] * len(members),
+                "commands": [None] * len(members),
+            }
+            for index, member in enumerate(members):
+                commands.append(
+                    self.prepare_command(member, member.callback(self), member=index)
+                )
+                results["commands"][index] = commands[-1].name
+        else:
+            results = self.__copy_step_results()
+            for index, member in enumerate(members):
+                if results["members"][index] != MEMBER_OK:
+                    continue
+                if not member.compensation_callback:
+                    results["members"][index] = MEMBER_COMPENSATED
+                    continue
+                commands.append(
+                    self.prepare_command(
+                        member, member.compensation_callback(self), True, index
+                    )
+                )
+                results["members"][index] = MEMBER_COMPENSATING
+                results["commands"][index] = commands[-1].name
+
+        self.set_step_results(results)
+        return commands
+
+    # Commands of the members of the current parallel step whose
+    # responses are still awaited.
+    def get_parallel_waiting_commands(self) -> list[Command]:
+        members = self.get_current_step_def().members
+        results = self.__copy_step_results()
+        commands: list[Command] = []
+
+        for index, member in enumerate(members):
+            if results["members"][index] == MEMBER_PENDING:
+                commands.append(
+                    self.prepare_command(member, member.callback(self), member=index)
+                )
+            elif results["members"][index] == MEMBER_COMPENSATING:
+                commands.append(
+                    self.prepare_command(
+                        member, member.compensation_callback(self), True, index
+                    )
+                )
+
+        return commands
+
+    def __copy_step_results(self):
+        results = self.get_step_results()
+
+        if results is None:
+            # The saga came back from a later step, every member succeeded.
+            members = self.get_current_step_def().members
+            return {
+                "members": [MEMBER_OK] * len(members),
+                "commands": [None] * len(members),
+            }
+
+        return {
+            "members": list(results["members"]),
+            "commands": list(results["commands"]),
+        }
+
+    # Index of the member that waits for the command. Replies that do not
+    # carry the member are matched by name.
+    def __get_awaited_member(self, results: dict, name: str, member: int | None):
+        for index, command in enumerate(results["commands"]):
+            if (
+                command == name
+                and member in (None, index)
+                and results["members"][index] in (MEMBER_PENDING, MEMBER_COMPENSATING)
+            ):
+                return index
+        return None
+
+    def __is_parallel_step_waiting(self):
+        return any(
+            member in (MEMBER_PENDING, MEMBER_COMPENSATING)
+            for member in self.get_step_results()["members"]
+        )
+
+    def __leave_parallel_step(self):
+        self.set_step_results(None)
+        if self.is_first_step():
+            return Transition("failed")
+        return Transition("compensation", -1)
+
+    def __get_parallel_compensation_transition(self):
+        if self.__is_parallel_step_waiting():
+            return Transition("compensating")
+        return self.__leave_parallel_step()
+
+    def __get_parallel_response_transition(
+        self, ok: bool, name: str | None, member: int | None
+    ):
+        results = self.__copy_step_results()
+        index = self.__get_awaited_member(results, name, member)
+        is_processing = self.get_status() == "processing"
+
+        if index is None:
+            if name is not None:
+                # Response to an unknown command or a duplicate.
+                return None
+            # Timed out: compensate the members that succeeded so far, or
+            # stop waiting for the compensations.
+            if is_processing:
+                return Transition("compensation")
+            return self.__leave_parallel_step()
+
+        member = results["members"][index]
+
+        if member == MEMBER_PENDING:
+            results["members"][index] = MEMBER_OK if ok else MEMBER_FAILED
+            self.set_step_results(results)
+
+            if is_processing and ok:
+                if all(member == MEMBER_OK for member in results["members"]):
+                    self.set_step_results(None)
+                    return states["processing"].tick_command_response(
+                        True, *self.step_plan.get_position(self.get_current_step())
+                    )
+                return None
+
+            # The first failure fails the group. A success after it
+            # needs to be compensated.
+            if is_processing or ok:
+                return Transition("compensation")
+        elif member == MEMBER_COMPENSATING and not is_processing:
+            results["members"][index] = MEMBER_COMPENSATED
+            self.set_step_results(results)
+        else:
+            return None
 
-    def tick_command_response(self, ok: bool):
-        self.state.tick_command_response(ok)
+        if is_processing or self.__is_parallel_step_waiting():
+            return None
+        return self.__leave_parallel_step()
+
+    # The commands of parallel steps are awaited by their members, see
+    # run_parallel_step. Sagas saved before the awaited command was
+    # stored accept any reply.
+    def is_awaited_command(self, name: str, member: int | None = None):
+        if self.is_parallel_step():
+            results = self.__copy_step_results()
+            return self.__get_awaited_member(results, name, member) is not None
+
+        awaited_command = self.get_awaited_command()
+        if awaited_command is None:
+            return True
+        return name == awaited_command and self.get_awaited_compensation() == (
+            self.get_status() == "compensating"
+        )
+
+    def get_dirty_attributes(self):
+        return self.dirty_attributes
+
+    def mark_dirty(self, name: str):
+        self.dirty_attributes.add(name)
+
+    def mark_clean(self):
+        self.dirty_attributes = set()
 
     def get_id(self):
         try:
@@ -167,15 +536,48 @@ class Saga:
 
     def set_data(self, val: dict):
         self.attributes["data"] = val
+        self.dirty_attributes.add("data")
 
     def get_current_step(self):
         return self.attributes["current_step"]
 
     def set_current_step(self, val: int):
         self.attributes["current_step"] = val
+        self.dirty_attributes.add("current_step")
 
     def get_status(self):
         return self.attributes["status"]
 
+    def get_step_results(self):
+        return self.attributes.get("step_results")
+
+    def set_step_results(self, val: dict | None):
+        self.attributes["step_results"] = val
+        self.dirty_attributes.add("step_results")
+
     def set_status(self, val: str):
         self.attributes["status"] = val
+        self.dirty_attributes.add("status")
+
+    def get_version(self):
+        return self.attributes.get("version", 0)
+
+    # The version is maintained by the DAO, it is not a dirty attribute.
+    def set_version(self, val: int):
+        self.attributes["version"] = val
+
+    def get_awaited_command(self):
+        return self.attributes.get("awaited_command")
+
+    def get_awaited_compensation(self):
+        return self.attributes.get("awaited_compensation", False)
+
+    def set_awaited_command(self, name: str | None, is_compensation: bool):
+        if (name, is_compensation) == (
+            self.get_awaited_command(),
+            self.get_awaited_compensation(),
+        ):
+            return
+        self.attributes["awaited_command"] = name
+        self.attributes["awaited_compensation"] = is_compensation
+        self.dirty_attributes.add("awaited_command")
@@ -0,0 +1,79 @@
+from threading import Event, Thread
+from orchestrated_saga.saga_dao import SagaDao
+
+
+# Moves finished sagas from the sagas table to sagas_archive, so the
+# sagas table and its indexes only grow with the number of in-flight
+# sagas. Sagas are moved in batches of batch_size, one transaction per
+# batch, with a pause of batch_delay seconds between batches.
+# The ids of processed messages are deleted the same way once they are
+# older than processed_message_retention seconds.
+class SagaArchiver(Thread):
+    def __init__(
+        self,
+        saga_dao: SagaDao,
+        ev_stopping: Event,
+        archive_after: float = 3600,
+        interval: float = 60,
+        batch_size: int = 1000,
+        batch_delay: float = 0.1,
+        processed_message_retention: float = 86400,
+    ) -> None:
+        Thread.__init__(self, daemon=True)
+        self.saga_dao = saga_dao
+        self.ev_stopping = ev_stopping
+        self.archive_after = archive_after
+        self.interval = interval
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self.processed_message_retention = processed_message_retention
+        self.archived = 0
+
+    def run(self):
+        while not self.ev_stopping.is_set():
+            try:
+                self.archive()
+            except Exception as e:
+                print("failed to archive sagas")
+                print("exception:", e)
+
+            try:
+                self.delete_processed_messages()
+            except Exception as e:
+                print("failed to delete processed message ids")
+                print("exception:", e)
+
+            self.ev_stopping.wait(self.interval)
+
+    # Archives batches until there is nothing left to archive. Returns
+    # the number of archived sagas.
+    def archive(self):
+        archived = 0
+
+        while not self.ev_stopping.is_set():
+            moved = self.saga_dao.archive_sagas(self.archive_after, self.batch_size)
+            archived += moved
+
+            if moved < self.batch_size:
+                break
+
+            self.ev_stopping.wait(self.batch_delay)
+
+        self.archived += archived
+        return archived
+
+    def delete_processed_messages(self):
+        deleted = 0
+
+        while not self.ev_stopping.is_set():
+            count = self.saga_dao.delete_processed_messages(
+                self.processed_message_retention, self.batch_size
+            )
+            deleted += count
+
+            if count < self.batch_size:
+                break
+
+            self.ev_stopping.wait(self.batch_delay)
+
+        return deleted
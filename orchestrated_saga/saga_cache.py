@@ -0,0 +1,172 @@
+import select
+from collections import OrderedDict
+from threading import Event, Lock, Thread
+from typing import Callable, NamedTuple, TypedDict
+
+
+class CachedSaga(NamedTuple):
+    name: str
+    data: str | None
+    data_codec: str | None
+    data_blob: bytes | None
+    current_step: int
+    status: str
+    step_results: str | None = None
+    version: int = 0
+    awaited_command: str | None = None
+    awaited_compensation: bool = False
+
+
+class SagaCacheStats(TypedDict):
+    size: int
+    max_size: int
+    hits: int
+    misses: int
+    evictions: int
+    invalidations: int
+
+
+# Size bounded LRU cache of in-flight sagas, filled by SagaDao when
+# a write commits. Data is kept encoded, so callers always get
+# their own copy of it. An entry may be stale until the invalidation
+# of another instance's write arrives, but it carries the version it
+# was written with: SagaDao.update rejects a write based on a stale
+# entry with SagaConflictError and drops the entry, and the managers
+# handle the saga again from the database.
+class SagaCache:
+    def __init__(self, max_size: int = 10000):
+        self.max_size = max_size
+        self.lock = Lock()
+        self.entries: OrderedDict[str, CachedSaga] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, id: str):
+        with self.lock:
+            entry = self.entries.get(id)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(id)
+            self.hits += 1
+            return entry
+
+    def contains(self, id: str):
+        with self.lock:
+            return id in self.entries
+
+    def put(self, id: str, entry: CachedSaga):
+        with self.lock:
+            self.entries[id] = entry
+            self.entries.move_to_end(id)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    # Updates the step, status and awaited command of a cached saga whose
+    # data did not change. Returns False if the saga is not cached.
+    def update(
+        self,
+        id: str,
+        current_step: int,
+        status: str,
+        step_results: str | None = None,
+        version: int = 0,
+        awaited_command: str | None = None,
+        awaited_compensation: bool = False,
+    ):
+        with self.lock:
+            entry = self.entries.get(id)
+            if entry is None:
+                return False
+            self.entries[id] = entry._replace(
+                current_step=current_step,
+                status=status,
+                step_results=step_results,
+                version=version,
+                awaited_command=awaited_command,
+                awaited_compensation=awaited_compensation,
+            )
+            self.entries.move_to_end(id)
+            return True
+
+    def invalidate(self, id: str):
+        with self.lock:
+            if self.entries.pop(id, None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        with self.lock:
+            self.invalidations += len(self.entries)
+            self.entries.clear()
+
+    def stats(self) -> SagaCacheStats:
+        with self.lock:
+            return SagaCacheStats(
+                size=len(self.entries),
+                max_size=self.max_size,
+                hits=self.hits,
+                misses=self.misses,
+                evictions=self.evictions,
+                invalidations=self.invalidations,
+            )
+
+
+# Keeps the caches of several orchestrator instances close to the
+# database. The opt-in trigger of optional/saga_update_notifications.sql
+# notifies every update of the sagas table with the application_name of
+# the writing connection, the invalidator drops sagas written by other
+# instances. Notifications
+# arrive after the commit, correctness relies on the version check of
+# SagaDao.update, the invalidations only avoid conflicts. Pooled
+# connections of this instance must be opened with
+# application_name=instance_name.
+class SagaCacheInvalidator(Thread):
+    def __init__(
+        self,
+        cache: SagaCache,
+        connect: Callable[[], any],
+        instance_name: str,
+        ev_stopping: Event,
+    ):
+        Thread.__init__(self, daemon=True)
+        self.cache = cache
+        self.connect = connect
+        self.instance_name = instance_name
+        self.ev_stopping = ev_stopping
+
+    def run(self):
+        while not self.ev_stopping.is_set():
+            try:
+                self.listen()
+            except Exception as e:
+                print("saga cache invalidation failed, clearing the cache")
+                print("exception:", e)
+                self.ev_stopping.wait(1)
+            # Notifications may have been missed while disconnected.
+            self.cache.clear()
+
+    def listen(self):
+        connection = self.connect()
+        connection.autocommit = True
+
+        try:
+            with connection.cursor() as curs:
+                curs.execute("LISTEN saga_updates")
+
+            while not self.ev_stopping.is_set():
+                if select.select([connection], [], [], 1) == ([], [], []):
+                    continue
+
+                connection.poll()
+                while connection.notifies:
+                    self.handle_notification(connection.notifies.pop(0).payload)
+        finally:
+            connection.close()
+
+    def handle_notification(self, payload: str):
+        instance_name, _, id = payload.rpartition(":")
+        if instance_name != self.instance_name:
+            self.cache.invalidate(id)
@@ -1,86 +1,544 @@
 import json
+from contextlib import contextmanager
+from threading import local
 from uuid import uuid4
 from typing import Tuple
+from psycopg2.extras import Json, execute_values
+from orchestrated_saga.connection_pool import ConnectionPool
 from orchestrated_saga.saga import Saga, SagaAttributes
+from orchestrated_saga.saga_cache import CachedSaga, SagaCache
+from orchestrated_saga.saga_data_codec import SagaDataCodec, get_data_codec
+
+TERMINAL_STATUSES = {"done", "failed"}
+
+# Sagas without a response shard, like the ones created before migration
+# 12, are scanned by every instance.
+SHARDS_FILTER = "AND (response_shard IS NULL OR response_shard = ANY(%s))"
+
+
+# Raised by SagaDao.update when the saga was changed since it was read.
+class SagaConflictError(Exception):
+    def __init__(self, saga_id: str, version: int):
+        super().__init__(f"saga {saga_id} was changed after version {version}")
+        self.saga_id = saga_id
+        self.version = version
+
+
+# Ids read from the uuid column contain dashes, generated ids do not.
+def get_cache_key(id: str):
+    return id.replace("-", "")
 
 
 class SagaDao:
     def __init__(
         self,
-        connection: any,
+        pool: ConnectionPool,
         saga_classes: dict[str, type[Saga]],
+        data_codec: SagaDataCodec | None = None,
+        cache: SagaCache | None = None,
     ):
-        self.connection = connection
+        self.pool = pool
         self.saga_classes = saga_classes
+        self.transaction_state = local()
+        # Without a codec saga data is stored in the jsonb data column,
+        # with a codec it is stored in data_blob.
+        self.data_codec = data_codec
+        self.data_codecs: dict[str, SagaDataCodec] = {}
+        if data_codec:
+            self.data_codecs[data_codec.name] = data_codec
+        # Writes reach the cache only when their transaction commits.
+        self.cache = cache
 
     def get_saga_class(self, saga_name: str):
         if saga_name not in self.saga_classes:
             return Saga
         return self.saga_classes[saga_name]
 
+    def encode_data(self, data: dict):
+        if not self.data_codec:
+            # Encoded once for both the jsonb column and the cache.
+            encoded = json.dumps(data)
+            return Json(data, dumps=lambda _: encoded), None, None
+        return None, self.data_codec.name, self.data_codec.encode(data)
+
+    def encode_step_results(self, step_results: dict | None):
+        return None if step_results is None else Json(step_results)
+
+    # Reads data written with any codec. Rows without a codec keep the
+    # data in the data column, as jsonb or as text before migration 3.
+    def decode_data(self, data: any, codec_name: str | None, blob: bytes | None):
+        if codec_name:
+            if codec_name not in self.data_codecs:
+                self.data_codecs[codec_name] = get_data_codec(codec_name)
+            return self.data_codecs[codec_name].decode(blob)
+        if isinstance(data, (str, bytes)):
+            return json.loads(data)
+        return data
+
+    def generate_id(self):
+        return uuid4().hex
+
+    def in_transaction(self):
+        return getattr(self.transaction_state, "connection", None) is not None
+
+    # Groups several DAO calls into a single database transaction on one
+    # pooled connection. Nested transactions are flattened into the
+    # outermost one. Calls made outside of a transaction check out
+    # a connection and commit on their own.
+    @contextmanager
+    def transaction(self):
+        if self.in_transaction():
+            yield
+            return
+
+        with self.pool.connection() as connection:
+            self.transaction_state.connection = connection
+            self.transaction_state.cache_writes = {}
+            try:
+                yield
+                connection.commit()
+            except BaseException:
+                try:
+                    connection.rollback()
+                except Exception:
+                    pass
+                self.__discard_cache_writes()
+                raise
+            finally:
+                self.transaction_state.connection = None
+            self.__apply_cache_writes()
+
+    @contextmanager
+    def cursor(self):
+        with self.transaction():
+            with self.transaction_state.connection.cursor() as curs:
+                yield curs
+
     def save(self, saga: Saga):
         if not saga.get_id():
             return self.create(saga)
         return self.update(saga)
 
     def create(self, saga: Saga):
-        saga.set_id(uuid4().hex)
-        with self.connection.cursor() as curs:
+        if not saga.get_id():
+            saga.set_id(self.generate_id())
+        data_columns = self.encode_data(saga.get_data())
+        with self.cursor() as curs:
             curs.execute(
                 """
-                INSERT INTO sagas (id, name, data, current_step, status)
-                VALUES (%s, %s, %s, %s, %s)
+                INSERT INTO sagas (
+                    id, name, data, data_codec, data_blob, current_step, status,
+                    step_results, awaited_command, awaited_compensation,
+                    response_shard
+                )
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
                 """,
                 (
                     saga.get_id(),
                     saga.name,
-                    json.dumps(saga.get_data()),
+                    *data_columns,
                     saga.get_current_step(),
                     saga.get_status(),
+                    self.encode_step_results(saga.get_step_results()),
+                    saga.get_awaited_command(),
+                    saga.get_awaited_compensation(),
+                    saga.get_response_shard(),
                 ),
             )
-        self.connection.commit()
+            saga.set_version(0)
+            self.__add_cache_write(saga, data_columns)
+        saga.mark_clean()
         return saga
 
+    # Writes only the attributes changed since the saga was loaded
+    # or saved, and nothing at all when none changed. The row is only
+    # updated if its version is still the one the saga was read with,
+    # otherwise SagaConflictError is raised.
     def update(self, saga: Saga):
-        with self.connection.cursor() as curs:
+        dirty_attributes = saga.get_dirty_attributes()
+
+        if not dirty_attributes:
+            return saga
+
+        columns: list[str] = []
+        values: list = []
+        data_columns = None
+
+        if "data" in dirty_attributes:
+            data_columns = self.encode_data(saga.get_data())
+            columns += ["data = %s", "data_codec = %s", "data_blob = %s"]
+            values += data_columns
+        if "current_step" in dirty_attributes:
+            columns.append("current_step = %s")
+            values.append(saga.get_current_step())
+        if "status" in dirty_attributes:
+            columns.append("status = %s")
+            values.append(saga.get_status())
+        if "step_results" in dirty_attributes:
+            columns.append("step_results = %s")
+            values.append(self.encode_step_results(saga.get_step_results()))
+        if "awaited_command" in dirty_attributes:
+            columns += ["awaited_command = %s", "awaited_compensation = %s"]
+            values += [saga.get_awaited_command(), saga.get_awaited_compensation()]
+        columns += ["updated_at = now()", "version = version + 1"]
+
+        with self.cursor() as curs:
+            curs.execute(
+                f"UPDATE sagas SET {', '.join(columns)} "
+                + "WHERE id = %s AND version = %s",
+                (*values, saga.get_id(), saga.get_version()),
+            )
+
+            if curs.rowcount == 0:
+                # The saga may have been read from a stale cache entry.
+                if self.cache:
+                    self.cache.invalidate(get_cache_key(saga.get_id()))
+                raise SagaConflictError(saga.get_id(), saga.get_version())
+
+            saga.set_version(saga.get_version() + 1)
+            self.__add_cache_write(saga, data_columns)
+        saga.mark_clean()
+        return saga
+
+    # Raises SagaConflictError if a saga read from the cache was changed
+    # since, sagas read from the table are current.
+    def check_version(self, saga: Saga):
+        if not self.cache:
+            return
+
+        with self.cursor() as curs:
+            curs.execute("SELECT version FROM sagas WHERE id = %s", (saga.get_id(),))
+            record: Tuple = curs.fetchone()
+
+        if record != None and record[0] != saga.get_version():
+            self.cache.invalidate(get_cache_key(saga.get_id()))
+            raise SagaConflictError(saga.get_id(), saga.get_version())
+
+    # Marks an in-flight saga as handled without changing it.
+    def touch(self, saga: Saga):
+        with self.cursor() as curs:
+            curs.execute(
+                "UPDATE sagas SET updated_at = now() WHERE id = %s", (saga.get_id(),)
+            )
+
+    def get_one_by_id(self, id: str):
+        if self.cache:
+            cached = self.cache.get(get_cache_key(id))
+            if cached:
+                return self.get_saga_class(cached.name)(
+                    SagaAttributes(
+                        id=id,
+                        data=self.decode_data(
+                            cached.data, cached.data_codec, cached.data_blob
+                        ),
+                        current_step=cached.current_step,
+                        status=cached.status,
+                        step_results=None
+                        if cached.step_results is None
+                        else json.loads(cached.step_results),
+                        version=cached.version,
+                        awaited_command=cached.awaited_command,
+                        awaited_compensation=cached.awaited_compensation,
+                    )
+                )
+
+        # Finished sagas may have been moved to the archive. The archive
+        # is only read when the saga is not in the sagas table.
+        with self.cursor() as curs:
             curs.execute(
                 """
-                UPDATE sagas
-                SET name = %s, data = %s, current_step = %s, status = %s
+                SELECT id, name, data, data_codec, data_blob, current_step, status,
+                    step_results, version, awaited_command, awaited_compensation
+                FROM sagas
+                WHERE id = %s
+                UNION ALL
+                SELECT id, name, data, data_codec, data_blob, current_step, status,
+                    step_results, version, awaited_command, awaited_compensation
+                FROM sagas_archive
                 WHERE id = %s
+                LIMIT 1
+                """,
+                (id, id),
+            )
+            record: Tuple = curs.fetchone()
+
+            if record == None:
+                return None
+
+            return self.__create_saga(record)
+
+    # Pages through the in-flight sagas not updated for stale_after
+    # seconds, oldest first. A page is a list of (updated_at, id) keys,
+    # pass the last key of a page as after to get the next one.
+    def get_stale_saga_ids(
+        self,
+        stale_after: float,
+        limit: int,
+        after: tuple | None = None,
+        shards: list[int] | None = None,
+    ) -> list[tuple[any, str]]:
+        with self.cursor() as curs:
+            curs.execute(
+                f"""
+                SELECT updated_at, id
+                FROM sagas
+                WHERE status NOT IN ('done', 'failed')
+                    AND updated_at < now() - %s * interval '1 second'
+                    {SHARDS_FILTER if shards is not None else ""}
+                    {"AND (updated_at, id) > (%s, %s)" if after else ""}
+                ORDER BY updated_at, id
+                LIMIT %s
                 """,
                 (
-                    saga.name,
-                    json.dumps(saga.get_data()),
-                    saga.get_current_step(),
-                    saga.get_status(),
-                    saga.get_id(),
+                    stale_after,
+                    *(() if shards is None else (list(shards),)),
+                    *(after or ()),
+                    limit,
                 ),
             )
-        self.connection.commit()
-        return saga
+            return [(updated_at, str(id)) for updated_at, id in curs]
 
-    def get_one_by_id(self, id: str):
-        with self.connection.cursor() as curs:
+    # Pages through the sagas waiting for a participant's response, in
+    # the same keyset order as get_stale_saga_ids.
+    def get_waiting_sagas(
+        self,
+        limit: int,
+        after: tuple | None = None,
+        shards: list[int] | None = None,
+    ) -> list[tuple[any, str, str, int, str, str | None]]:
+        with self.cursor() as curs:
+            curs.execute(
+                f"""
+                SELECT updated_at, id, name, current_step, status, awaited_command
+                FROM sagas
+                WHERE status NOT IN ('done', 'failed')
+                    AND status IN ('processing', 'compensating')
+                    {SHARDS_FILTER if shards is not None else ""}
+                    {"AND (updated_at, id) > (%s, %s)" if after else ""}
+                ORDER BY updated_at, id
+                LIMIT %s
+                """,
+                (*(() if shards is None else (list(shards),)), *(after or ()), limit),
+            )
+            return [(row[0], str(row[1]), *row[2:]) for row in curs]
+
+    # Locks a saga for recovery if it is still in flight and stale. Sagas
+    # locked by another transaction are skipped, so None is returned.
+    def lock_stale_saga(self, id: str, stale_after: float):
+        with self.cursor() as curs:
             curs.execute(
                 """
-                SELECT id, name, data, current_step, status
+                SELECT id, name, data, data_codec, data_blob, current_step, status,
+                    step_results, version, awaited_command, awaited_compensation
                 FROM sagas
                 WHERE id = %s
+                    AND status NOT IN ('done', 'failed')
+                    AND updated_at < now() - %s * interval '1 second'
+                FOR UPDATE SKIP LOCKED
                 """,
-                (id,),
+                (id, stale_after),
             )
             record: Tuple = curs.fetchone()
 
             if record == None:
                 return None
 
-            return self.get_saga_class(record[1])(
-                SagaAttributes(
-                    id=record[0],
-                    data=json.loads(record[2]),
-                    current_step=record[3],
-                    status=record[4],
+            return self.__create_saga(record)
+
+    # Moves up to limit sagas finished more than archive_after seconds
+    # ago to the archive table. Returns the number of moved sagas.
+    def archive_sagas(self, archive_after: float, limit: int):
+        with self.cursor() as curs:
+            curs.execute(
+                """
+                WITH archived AS (
+                    DELETE FROM sagas
+                    WHERE id IN (
+                        SELECT id
+                        FROM sagas
+                        WHERE status IN ('done', 'failed')
+                            AND updated_at < now() - %s * interval '1 second'
+                        ORDER BY updated_at
+                        LIMIT %s
+                        FOR UPDATE SKIP LOCKED
+                    )
+                    RETURNING *
+                )
+                INSERT INTO sagas_archive (
+                    id, name, data, data_codec, data_blob, current_step, status,
+                    step_results, version, awaited_command, awaited_compensation,
+                    response_shard, created_at, updated_at
                 )
+                SELECT
+                    id, name, data, data_codec, data_blob, current_step, status,
+                    step_results, version, awaited_command, awaited_compensation,
+                    response_shard, created_at, updated_at
+                FROM archived
+                """,
+                (archive_after, limit),
             )
+            return curs.rowcount
+
+    def __create_saga(self, record: Tuple):
+        return self.get_saga_class(record[1])(
+            SagaAttributes(
+                id=record[0],
+                data=self.decode_data(record[2], record[3], record[4]),
+                current_step=record[5],
+                status=record[6],
+                step_results=record[7],
+                version=record[8],
+                awaited_command=record[9],
+                awaited_compensation=record[10],
+            )
+        )
+
+    # Remembers what a write stored so the cache can be updated once the
+    # transaction commits. data_columns is None when the data did not change.
+    def __add_cache_write(self, saga: Saga, data_columns: tuple | None):
+        if not self.cache:
+            return
+
+        key = get_cache_key(saga.get_id())
+        cache_writes = self.transaction_state.cache_writes
+        if data_columns is None and key in cache_writes:
+            data_columns = cache_writes[key][1]
+        step_results = saga.get_step_results()
+        cache_writes[key] = (
+            saga,
+            data_columns,
+            saga.name,
+            saga.get_current_step(),
+            saga.get_status(),
+            None if step_results is None else json.dumps(step_results),
+            saga.get_version(),
+            saga.get_awaited_command(),
+            saga.get_awaited_compensation(),
+        )
+
+    def __apply_cache_writes(self):
+        cache_writes = self.transaction_state.cache_writes
+        self.transaction_state.cache_writes = None
+        if not self.cache:
+            return
+
+        for key, write in cache_writes.items():
+            (
+                saga,
+                data_columns,
+                name,
+                current_step,
+                status,
+                step_results,
+                version,
+                awaited_command,
+                awaited_compensation,
+            ) = write
+            if status in TERMINAL_STATUSES:
+                self.cache.invalidate(key)
+                continue
+
+            if data_columns is None:
+                if self.cache.update(
+                    key,
+                    current_step,
+                    status,
+                    step_results,
+                    version,
+                    awaited_command,
+                    awaited_compensation,
+                ):
+                    continue
+                data_columns = self.encode_data(saga.get_data())
+
+            jsonb, data_codec, data_blob = data_columns
+            self.cache.put(
+                key,
+                CachedSaga(
+                    name=name,
+                    data=jsonb.dumps(jsonb.adapted) if jsonb else None,
+                    data_codec=data_codec,
+                    data_blob=data_blob,
+                    current_step=current_step,
+                    status=status,
+                    step_results=step_results,
+                    version=version,
+                    awaited_command=awaited_command,
+                    awaited_compensation=awaited_compensation,
+                ),
+            )
+
+    # The outcome of a failed commit is unknown, so the written
+    # sagas are dropped from the cache.
+    def __discard_cache_writes(self):
+        cache_writes = self.transaction_state.cache_writes
+        self.transaction_state.cache_writes = None
+        if not self.cache:
+            return
+
+        for key in cache_writes:
+            self.cache.invalidate(key)
+
+    # Records that a message was processed. Returns False if it already
+    # was. Run in the transaction that processes the message: a concurrent
+    # insert of the same id waits for that transaction to finish.
+    def add_processed_message(self, message_id: str):
+        with self.cursor() as curs:
+            curs.execute(
+                """
+                INSERT INTO processed_messages (message_id)
+                VALUES (%s)
+                ON CONFLICT DO NOTHING
+                """,
+                (message_id,),
+            )
+            return curs.rowcount == 1
+
+    # Deletes up to limit ids of messages processed more than
+    # older_than seconds ago. Returns the number of deleted ids.
+    def delete_processed_messages(self, older_than: float, limit: int):
+        with self.cursor() as curs:
+            curs.execute(
+                """
+                DELETE FROM processed_messages
+                WHERE message_id IN (
+                    SELECT message_id
+                    FROM processed_messages
+                    WHERE processed_at < now() - %s * interval '1 second'
+                    LIMIT %s
+                )
+                """,
+                (older_than, limit),
+            )
+            return curs.rowcount
+
+    def add_outbox_messages(self, messages: list[tuple[str, dict]]):
+        with self.cursor() as curs:
+            execute_values(
+                curs,
+                """
+                INSERT INTO saga_outbox (routing_key, payload)
+                VALUES %s
+                """,
+                [(key, json.dumps(payload)) for key, payload in messages],
+            )
+
+    # Locks the oldest outbox rows so that several relays
+    # can drain the outbox concurrently.
+    def get_outbox_messages(self, limit: int) -> list[tuple[int, str, dict]]:
+        with self.cursor() as curs:
+            curs.execute(
+                """
+                SELECT id, routing_key, payload
+                FROM saga_outbox
+                ORDER BY id
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+                """,
+                (limit,),
+            )
+            return [(id, key, json.loads(payload)) for id, key, payload in curs]
+
+    def delete_outbox_messages(self, ids: list[int]):
+        with self.cursor() as curs:
+            curs.execute("DELETE FROM saga_outbox WHERE id = ANY(%s)", (ids,))
@@ -0,0 +1,77 @@
+import json
+import zlib
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+# Encodes saga data for the data_blob column of the sagas table. The codec
+# name is stored next to the blob, so rows written with any codec can be
+# read back while codecs are being changed.
+class SagaDataCodec:
+    name: str
+
+    def encode(self, data: dict) -> bytes:
+        raise NotImplementedError()
+
+    def decode(self, encoded: bytes) -> dict:
+        raise NotImplementedError()
+
+
+class JsonCodec(SagaDataCodec):
+    name = "json"
+
+    def encode(self, data: dict) -> bytes:
+        return json.dumps(data, separators=(",", ":")).encode()
+
+    def decode(self, encoded: bytes) -> dict:
+        return json.loads(encoded)
+
+
+# Requires the optional msgpack package.
+class MsgpackCodec(SagaDataCodec):
+    name = "msgpack"
+
+    def __init__(self):
+        if msgpack is None:
+            raise ImportError("MsgpackCodec requires the msgpack package")
+
+    def encode(self, data: dict) -> bytes:
+        return msgpack.packb(data)
+
+    def decode(self, encoded: bytes) -> dict:
+        return msgpack.unpackb(encoded)
+
+
+# Compresses the output of another codec with zlib when it is at least
+# threshold bytes long. The first byte tells whether it is compressed.
+class CompressedCodec(SagaDataCodec):
+    def __init__(self, codec: SagaDataCodec, threshold: int = 1024, level: int = 6):
+        self.codec = codec
+        self.threshold = threshold
+        self.level = level
+        self.name = f"zlib+{codec.name}"
+
+    def encode(self, data: dict) -> bytes:
+        encoded = self.codec.encode(data)
+        if len(encoded) < self.threshold:
+            return b"\x00" + encoded
+        return b"\x01" + zlib.compress(encoded, self.level)
+
+    def decode(self, encoded: bytes) -> dict:
+        encoded = bytes(encoded)
+        if encoded[:1] == b"\x01":
+            return self.codec.decode(zlib.decompress(encoded[1:]))
+        return self.codec.decode(encoded[1:])
+
+
+def get_data_codec(name: str) -> SagaDataCodec:
+    if name.startswith("zlib+"):
+        return CompressedCodec(get_data_codec(name[len("zlib+") :]))
+    if name == JsonCodec.name:
+        return JsonCodec()
+    if name == MsgpackCodec.name:
+        return MsgpackCodec()
+    raise ValueError(f"unknown saga data codec {name}")
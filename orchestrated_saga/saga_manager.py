@@ -1,32 +1,177 @@
 from messaging.publisher import Publisher
+from messaging.publisher_pool import PublisherPool
 from orchestrated_saga.command import Command
 from orchestrated_saga.command_response import CommandResponse
+from orchestrated_saga.outbox_relay import OutboxRelay
+from orchestrated_saga.payload_stats import PayloadStats
 from orchestrated_saga.saga import Saga, SagaAttributes
-from orchestrated_saga.saga_dao import SagaDao
+from orchestrated_saga.saga_dao import SagaConflictError, SagaDao
+from orchestrated_saga.step_timeout_scheduler import StepTimeoutScheduler
+
+
+def get_command_message(command: Command):
+    message = {
+        "saga_id": command.saga_id,
+        "name": command.name,
+        "payload": command.payload,
+        "reply_to": command.reply_to,
+    }
+    if command.member is not None:
+        message["member"] = command.member
+    return command.routing_key, message
 
 
 class SagaManager:
-    def __init__(self, saga_dao: SagaDao, publisher: Publisher):
+    def __init__(
+        self,
+        saga_dao: SagaDao,
+        publisher: Publisher | PublisherPool,
+        unit_of_work: bool = False,
+        outbox_relay: OutboxRelay | None = None,
+        step_timeouts: StepTimeoutScheduler | None = None,
+        payload_stats: PayloadStats | None = None,
+        deduplicate: bool = False,
+        conflict_retries: int = 3,
+    ):
         self.saga_dao = saga_dao
         self.publisher = publisher
+        # In unit of work mode all the transitions of one run are saved
+        # in a single transaction, once the saga waits for a participant
+        # or finishes. Commands are published only after the commit.
+        self.unit_of_work = unit_of_work
+        # With an outbox relay commands are written to the outbox table
+        # in the same transaction as the saga and published by the relay.
+        self.outbox_relay = outbox_relay
+        # Without a scheduler step timeouts are ignored.
+        self.step_timeouts = step_timeouts
+        if step_timeouts is not None:
+            step_timeouts.set_timeout_handler(self.handle_step_timeout)
+        self.payload_stats = payload_stats
+        # Responses that carry a message id are recorded in the
+        # processed_messages table (migration 8) in the transaction that
+        # handles them, responses recorded before are dropped.
+        self.deduplicate = deduplicate
+        # When another instance or thread changed a saga while it was
+        # handled, the saga is loaded and handled again up to
+        # conflict_retries times before SagaConflictError is raised.
+        self.conflict_retries = conflict_retries
 
     def start_saga(self, saga_class: type[Saga], data: dict):
         saga = saga_class(SagaAttributes(data=data, status="pending", current_step=0))
+
+        if self.unit_of_work:
+            saga.set_id(self.saga_dao.generate_id())
+            self.__run_unit_of_work(lambda: saga, is_new=True)
+            return
+
         self.__run_saga(saga)
 
     def handle_saga_command_response(self, response: CommandResponse):
-        saga = self.saga_dao.get_one_by_id(response.saga_id)
+        if self.unit_of_work:
+
+            def load_saga():
+                if self.__is_processed(response):
+                    return None
+                saga = self.__get_saga(response.saga_id)
+                self.__tick_command_response(saga, response)
+                return saga
+
+            self.__run_unit_of_work(load_saga, is_new=False)
+            return
+
+        def save_response():
+            saga = self.__get_saga(response.saga_id)
+            self.__tick_command_response(saga, response)
 
+            with self.saga_dao.transaction():
+                if self.__is_processed(response):
+                    return None
+                return self.saga_dao.save(saga)
+
+        saga = self.__retry_on_conflict(save_response)
         if saga == None:
-            raise Exception(f"saga {response.saga_id} not found")
+            return
 
-        saga.tick_command_response(response.ok)
-        saga = self.saga_dao.save(saga)
+        self.__update_step_timeout(saga)
 
         if saga.get_status() in ("compensation", "pending"):
             self.__run_saga(saga)
 
-    def __run_current_step(self, saga: Saga):
+    # Re-drives a saga that has not made progress for stale_after seconds,
+    # e.g. because a participant reply was lost. A saga waiting for a
+    # participant gets its command sent again, a saga with local steps to
+    # run is run. Returns False if the saga is no longer stale or is
+    # being handled by another transaction.
+    def resume_saga(self, saga_id: str, stale_after: float):
+        commands: list[Command] = []
+
+        with self.saga_dao.transaction():
+            saga = self.saga_dao.lock_stale_saga(saga_id, stale_after)
+
+            if saga == None:
+                return False
+
+            if saga.get_status() in ("processing", "compensating"):
+                commands += self.__get_resent_commands(saga)
+                self.saga_dao.touch(saga)
+            else:
+                self.__run_steps(saga, commands)
+                self.saga_dao.update(saga)
+
+            self.__add_commands_to_outbox(commands)
+
+        self.__update_step_timeout(saga)
+        self.__publish_commands(commands)
+        return True
+
+    # Fails the step a saga waits for as if the participant responded
+    # with an error, unless the saga has moved on since the timer was set:
+    # to another step or status, or to another command of the same step.
+    # A response handled at the same time makes one of the two updates
+    # fail the version check, the loser reloads the saga and checks again.
+    def handle_step_timeout(
+        self,
+        saga_id: str,
+        current_step: int,
+        status: str,
+        awaited_command: str | None = None,
+    ):
+        def load_saga():
+            saga = self.__get_saga(saga_id)
+
+            if (
+                saga.get_current_step() != current_step
+                or saga.get_status() != status
+                or saga.get_awaited_command() != awaited_command
+            ):
+                return None
+
+            saga.tick_command_response(False)
+            return saga
+
+        self.__run_unit_of_work(load_saga, is_new=False)
+
+    # A reply the saga does not wait for is late or a duplicate, unless
+    # the saga was read from a stale cache entry.
+    def __tick_command_response(self, saga: Saga, response: CommandResponse):
+        if not saga.is_awaited_command(response.name, response.member):
+            self.saga_dao.check_version(saga)
+        saga.tick_command_response(response.ok, response.name, response.member)
+
+    def __is_processed(self, response: CommandResponse):
+        if not self.deduplicate or not response.message_id:
+            return False
+        return not self.saga_dao.add_processed_message(response.message_id)
+
+    def __get_saga(self, saga_id: str):
+        saga = self.saga_dao.get_one_by_id(saga_id)
+
+        if saga == None:
+            raise Exception(f"saga {saga_id} not found")
+
+        return saga
+
+    def __run_current_step(self, saga: Saga) -> list[Command]:
         is_compensation = saga.get_status() == "compensation"
         step_def = saga.get_current_step_def()
 
@@ -35,28 +180,122 @@ class SagaManager:
                 step_def.compensation_callback(saga)
             else:
                 step_def.callback(saga)
+            # Local steps change the data in place.
+            saga.mark_dirty("data")
 
         if saga.is_participant_step():
-            command: Command = (
-                step_def.compensation_callback(saga)
-                if is_compensation
-                else step_def.callback(saga)
+            callback = (
+                step_def.compensation_callback if is_compensation else step_def.callback
             )
+            return [saga.prepare_command(step_def, callback(saga), is_compensation)]
+
+        if saga.is_parallel_step():
+            return saga.run_parallel_step()
+
+        return []
 
-            # @TODO: fix the publish key.
+    def __get_participant_commands(self, saga: Saga) -> list[Command]:
+        step_def = saga.get_current_step_def()
+
+        if saga.is_parallel_step():
+            return saga.get_parallel_waiting_commands()
+
+        is_compensation = saga.get_status() == "compensating"
+        callback = (
+            step_def.compensation_callback if is_compensation else step_def.callback
+        )
+        return [saga.prepare_command(step_def, callback(saga), is_compensation)]
+
+    # Commands sent again get new message ids: the participant may have
+    # processed the first one, and only its reply was lost.
+    def __get_resent_commands(self, saga: Saga) -> list[Command]:
+        commands = self.__get_participant_commands(saga)
+        for command in commands:
+            command.message_id = None
+        return commands
+
+    def __run_steps(self, saga: Saga, commands: list[Command]):
+        while saga.get_status() in ("pending", "compensation"):
+            commands += self.__run_current_step(saga)
+            saga.tick()
+
+    def __update_step_timeout(self, saga: Saga):
+        if self.step_timeouts is not None:
+            self.step_timeouts.update(saga)
+
+    def __add_commands_to_outbox(self, commands: list[Command]):
+        if self.outbox_relay and commands:
+            self.saga_dao.add_outbox_messages(
+                [get_command_message(command) for command in commands]
+            )
+
+    def __publish_commands(self, commands: list[Command]):
+        if not commands:
+            return
+
+        if self.payload_stats:
+            self.payload_stats.record(commands)
+
+        if self.outbox_relay:
+            self.outbox_relay.wake()
+            return
+
+        for command in commands:
             self.publisher.publish(
-                "create_order_saga.command",
-                {
-                    "saga_id": command.saga_id,
-                    "name": command.name,
-                    "payload": command.payload,
-                },
+                *get_command_message(command), message_id=command.message_id
             )
 
     def __run_saga(self, saga: Saga):
-        self.__run_current_step(saga)
-        saga.tick()
-        saga = self.saga_dao.save(saga)
+        while True:
+            commands = self.__run_current_step(saga)
+            saga.tick()
 
-        if saga.get_status() in ("pending", "compensation"):
-            self.__run_saga(saga)
+            with self.saga_dao.transaction():
+                self.__add_commands_to_outbox(commands)
+                saga = self.saga_dao.save(saga)
+
+            self.__update_step_timeout(saga)
+            self.__publish_commands(commands)
+
+            if saga.get_status() not in ("pending", "compensation"):
+                break
+
+    # Calls fn again when it fails because the saga changed after fn
+    # loaded it. fn has to load the saga again.
+    def __retry_on_conflict(self, fn):
+        for attempt in range(self.conflict_retries + 1):
+            try:
+                return fn()
+            except SagaConflictError:
+                if attempt == self.conflict_retries:
+                    raise
+
+    def __run_unit_of_work(self, load_saga, is_new: bool):
+        commands: list[Command] = []
+
+        def run():
+            commands.clear()
+
+            with self.saga_dao.transaction():
+                saga = load_saga()
+
+                if saga == None:
+                    return None
+
+                self.__run_steps(saga, commands)
+
+                if is_new:
+                    self.saga_dao.create(saga)
+                else:
+                    self.saga_dao.update(saga)
+
+                self.__add_commands_to_outbox(commands)
+
+            return saga
+
+        saga = self.__retry_on_conflict(run)
+        if saga == None:
+            return
+
+        self.__update_step_timeout(saga)
+        self.__publish_commands(commands)
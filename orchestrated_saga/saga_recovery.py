@@ -0,0 +1,76 @@
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event, Thread
+from orchestrated_saga.saga_dao import SagaDao
+from orchestrated_saga.saga_manager import SagaManager
+
+
+# Periodically re-drives the in-flight sagas that have not been updated
+# for stale_after seconds. Stale sagas are paged through in batches of
+# batch_size, resumed by up to workers threads, with a pause of
+# batch_delay seconds between batches to bound the load on the database.
+# With shards only the sagas of those response shards are scanned.
+class SagaRecoveryWorker(Thread):
+    def __init__(
+        self,
+        saga_manager: SagaManager,
+        saga_dao: SagaDao,
+        ev_stopping: Event,
+        stale_after: float = 60,
+        scan_interval: float = 30,
+        batch_size: int = 100,
+        batch_delay: float = 0.1,
+        workers: int = 4,
+        shards: list[int] | None = None,
+    ) -> None:
+        Thread.__init__(self, daemon=True)
+        self.saga_manager = saga_manager
+        self.saga_dao = saga_dao
+        self.ev_stopping = ev_stopping
+        self.stale_after = stale_after
+        self.scan_interval = scan_interval
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self.workers = workers
+        self.shards = shards
+        self.resumed = 0
+
+    def run(self):
+        with ThreadPoolExecutor(self.workers) as executor:
+            while not self.ev_stopping.is_set():
+                try:
+                    self.scan(executor)
+                except Exception as e:
+                    print("failed to scan for stale sagas")
+                    print("exception:", e)
+
+                self.ev_stopping.wait(self.scan_interval)
+
+    # Resumes all the sagas that are stale when the scan starts. Returns
+    # the number of resumed sagas.
+    def scan(self, executor: ThreadPoolExecutor):
+        resumed = 0
+        after = None
+
+        while not self.ev_stopping.is_set():
+            keys = self.saga_dao.get_stale_saga_ids(
+                self.stale_after, self.batch_size, after, self.shards
+            )
+
+            resumed += sum(executor.map(self.resume_saga, [id for _, id in keys]))
+
+            if len(keys) < self.batch_size:
+                break
+
+            after = keys[-1]
+            self.ev_stopping.wait(self.batch_delay)
+
+        self.resumed += resumed
+        return resumed
+
+    def resume_saga(self, saga_id: str):
+        try:
+            return self.saga_manager.resume_saga(saga_id, self.stale_after)
+        except Exception as e:
+            print(f"failed to resume saga {saga_id}")
+            print("exception:", e)
+            return False
@@ -1,6 +1,32 @@
 from typing import Callable
 from orchestrated_saga.command import Command
 
+PayloadProjection = Callable[[dict], dict]
+
+
+# Compiles the payload declared by a participant step, field names of the
+# command payload or a projection function, into a projection function.
+# Invalid payloads raise ValueError when the saga class is defined.
+def get_payload_projection(
+    payload: str | tuple[str, ...] | PayloadProjection | None,
+) -> PayloadProjection | None:
+    if payload is None or callable(payload):
+        return payload
+
+    fields = (payload,) if isinstance(payload, str) else tuple(payload)
+    if not fields:
+        raise ValueError("a step payload needs at least one field")
+    for field in fields:
+        if not isinstance(field, str) or not field:
+            raise ValueError(f"invalid step payload field {field!r}")
+    if len(set(fields)) != len(fields):
+        raise ValueError("duplicate step payload fields")
+
+    def project(data: dict):
+        return {field: data[field] for field in fields}
+
+    return project
+
 
 class StepDef:
     pass
@@ -20,6 +46,33 @@ class ParticipantStepDef(StepDef):
         self,
         command_callback: Callable[[], Command],
         compensation_callback: Callable[[], Command],
+        timeout: float | None = None,
+        participant: str | None = None,
+        payload: str | tuple[str, ...] | PayloadProjection | None = None,
+        compensation_payload: str | tuple[str, ...] | PayloadProjection | None = None,
     ):
         self.callback = command_callback
         self.compensation_callback = compensation_callback
+        # Name of the app that handles the commands of the step.
+        self.participant = participant
+        # Seconds to wait for the participant's response before
+        # the step is failed.
+        self.timeout = timeout
+        # Only the projected payload is sent to the participant. The
+        # compensation command uses the command's projection by default.
+        self.project_payload = get_payload_projection(payload)
+        self.project_compensation_payload = (
+            get_payload_projection(compensation_payload) or self.project_payload
+        )
+
+
+# Group of participant steps whose commands are sent at once. The group
+# succeeds when every member succeeded. It fails on the first failure,
+# and then only the members that succeeded are compensated.
+class ParallelStepDef(StepDef):
+    def __init__(
+        self, members: list[ParticipantStepDef], timeout: float | None = None
+    ):
+        self.members = members
+        # Seconds to wait for the responses of all the members.
+        self.timeout = timeout
@@ -1,6 +1,11 @@
 from typing import Callable
 from orchestrated_saga.command import Command
-from orchestrated_saga.step import LocalStepDef, ParticipantStepDef
+from orchestrated_saga.step import (
+    LocalStepDef,
+    ParallelStepDef,
+    ParticipantStepDef,
+    PayloadProjection,
+)
 
 
 class StepBuilder:
@@ -8,6 +13,11 @@ class StepBuilder:
         self.commandCallback: Callable = None
         self.actionCallback: Callable = None
         self.compensationCallback: Callable = None
+        self.timeout: float | None = None
+        self.participant: str | None = None
+        self.parallelSteps: list[ParticipantStepDef] = []
+        self.payload: tuple[str, ...] | PayloadProjection | None = None
+        self.compensationPayload: tuple[str, ...] | PayloadProjection | None = None
 
     def withCommand(self, command: Command):
         self.commandCallback = command
@@ -21,8 +31,54 @@ class StepBuilder:
         self.compensationCallback = func
         return self
 
+    def withParticipant(self, participant: str):
+        self.participant = participant
+        return self
+
+    def withParallel(self, *step_defs: ParticipantStepDef):
+        for step_def in step_defs:
+            if not isinstance(step_def, ParticipantStepDef):
+                raise ValueError("only participant steps can run in parallel")
+        self.parallelSteps = list(step_defs)
+        return self
+
+    # Field names of the command payload, or a single projection function,
+    # sent to the participant instead of the whole payload.
+    def withPayload(self, *fields: str | PayloadProjection):
+        self.payload = get_step_payload(fields)
+        return self
+
+    def withCompensationPayload(self, *fields: str | PayloadProjection):
+        self.compensationPayload = get_step_payload(fields)
+        return self
+
+    def withTimeout(self, timeout: float):
+        self.timeout = timeout
+        return self
+
     def build(self):
+        if (self.parallelSteps or self.actionCallback) and (
+            self.payload or self.compensationPayload
+        ):
+            raise ValueError("only participant steps have a payload")
+
+        if self.parallelSteps:
+            return ParallelStepDef(self.parallelSteps, self.timeout)
+
         if self.actionCallback:
             return LocalStepDef(self.actionCallback, self.compensationCallback)
 
-        return ParticipantStepDef(self.commandCallback, self.compensationCallback)
+        return ParticipantStepDef(
+            self.commandCallback,
+            self.compensationCallback,
+            self.timeout,
+            self.participant,
+            self.payload,
+            self.compensationPayload,
+        )
+
+
+def get_step_payload(fields: tuple):
+    if len(fields) == 1 and callable(fields[0]):
+        return fields[0]
+    return fields
@@ -0,0 +1,111 @@
+from threading import Event, Lock, Thread
+from time import time
+from typing import Callable
+from orchestrated_saga.saga import Saga
+from orchestrated_saga.saga_dao import SagaDao
+from orchestrated_saga.timing_wheel import TimingWheel
+
+
+# Fails participant steps that have not been responded to within their
+# timeout. Every waiting saga has at most one timer, which remembers the
+# step, status and awaited command it was set for, so the timeout handler
+# can ignore timers of sagas that moved on.
+class StepTimeoutScheduler(Thread):
+    def __init__(self, ev_stopping: Event, tick: float = 0.1) -> None:
+        Thread.__init__(self, daemon=True)
+        self.ev_stopping = ev_stopping
+        self.tick = tick
+        self.lock = Lock()
+        self.wheel = TimingWheel(tick, time())
+        self.timeout_handler: Callable[[str, int, str, str | None], any] | None = (
+            None
+        )
+
+    def set_timeout_handler(
+        self, handler: Callable[[str, int, str, str | None], any]
+    ):
+        self.timeout_handler = handler
+
+    def __len__(self):
+        with self.lock:
+            return len(self.wheel)
+
+    def schedule(
+        self,
+        saga_id: str,
+        current_step: int,
+        status: str,
+        awaited_command: str | None,
+        deadline: float,
+    ):
+        with self.lock:
+            self.wheel.schedule(
+                saga_id, deadline, (current_step, status, awaited_command)
+            )
+
+    def cancel(self, saga_id: str):
+        with self.lock:
+            self.wheel.cancel(saga_id)
+
+    # Sets or cancels the timer of a saga after a change was committed.
+    def update(self, saga: Saga):
+        timeout = saga.get_step_timeout()
+
+        if timeout is None:
+            self.cancel(saga.get_id())
+            return
+
+        self.schedule(
+            saga.get_id(),
+            saga.get_current_step(),
+            saga.get_status(),
+            saga.get_awaited_command(),
+            time() + timeout,
+        )
+
+    # Restores the timers of the sagas waiting for participants, counting
+    # timeouts from the last update of every saga. With shards only the
+    # sagas of those response shards are restored. Returns the number of
+    # restored timers.
+    def load(
+        self,
+        saga_dao: SagaDao,
+        batch_size: int = 1000,
+        shards: list[int] | None = None,
+    ):
+        restored = 0
+        after = None
+
+        while True:
+            rows = saga_dao.get_waiting_sagas(batch_size, after, shards)
+
+            for updated_at, id, name, current_step, status, awaited_command in rows:
+                timeout = saga_dao.get_saga_class(name).step_plan.get_timeout(
+                    current_step
+                )
+                if timeout is not None:
+                    self.schedule(
+                        id,
+                        current_step,
+                        status,
+                        awaited_command,
+                        updated_at.timestamp() + timeout,
+                    )
+                    restored += 1
+
+            if len(rows) < batch_size:
+                return restored
+
+            after = rows[-1][:2]
+
+    def run(self):
+        while not self.ev_stopping.wait(self.tick):
+            with self.lock:
+                expired = self.wheel.advance(time())
+
+            for saga_id, timer in expired:
+                try:
+                    self.timeout_handler(saga_id, *timer)
+                except Exception as e:
+                    print(f"failed to time out saga {saga_id}")
+                    print("exception:", e)
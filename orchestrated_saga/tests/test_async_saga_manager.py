@@ -0,0 +1,144 @@
+import asyncio
+import unittest
+from unittest.mock import AsyncMock, Mock
+from orchestrated_saga.async_saga_manager import AsyncSagaManager
+from orchestrated_saga.command import Command, get_command_message_id
+from orchestrated_saga.command_response import CommandResponse
+from orchestrated_saga.saga import Saga, SagaAttributes
+from orchestrated_saga.saga_dao import SagaConflictError
+from orchestrated_saga.step_builder import StepBuilder
+
+
+async def step_one_action(saga: Saga):
+    saga.get_data()["created"] = True
+
+
+def step_one_compensation(saga: Saga):
+    saga.get_data()["created"] = False
+
+
+async def step_two_command(saga: Saga):
+    return Command("create_something", saga.get_id(), {})
+
+
+def step_two_compensation(saga: Saga):
+    return Command("cancel_something", saga.get_id(), {})
+
+
+class MockedSaga(Saga):
+    command_key = "mocked_saga"
+    step_defs = [
+        StepBuilder()
+        .withAction(step_one_action)
+        .withCompensation(step_one_compensation)
+        .build(),
+        StepBuilder()
+        .withCommand(step_two_command)
+        .withCompensation(step_two_compensation)
+        .build(),
+    ]
+    name = "MockedSaga"
+
+
+class TestAsyncSagaManager(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.mocked_saga_dao = AsyncMock()
+        self.mocked_saga_dao.generate_id = Mock(return_value="saga-id")
+        self.mocked_saga_dao.save.side_effect = lambda saga, **kwargs: saga
+        self.mocked_publisher = AsyncMock()
+        self.saga_manager = AsyncSagaManager(
+            self.mocked_saga_dao, self.mocked_publisher
+        )
+
+    async def test_start_saga(self):
+        saga = await self.saga_manager.start_saga(MockedSaga, {})
+
+        self.mocked_saga_dao.save.assert_awaited_once_with(
+            saga, is_new=True, outbox_messages=None
+        )
+        self.assertEqual(saga.get_data(), {"created": True})
+        self.assertEqual(saga.get_current_step(), 1)
+        self.assertEqual(saga.get_status(), "processing")
+        self.mocked_publisher.publish_many.assert_awaited_once_with(
+            [
+                (
+                    "mocked_saga.command",
+                    {
+                        "saga_id": "saga-id",
+                        "name": "create_something",
+                        "payload": {},
+                        "reply_to": "mocked_saga.command_response",
+                    },
+                    get_command_message_id("saga-id", 1, "create_something", False),
+                )
+            ]
+        )
+
+    async def run_command_response_test(self, success: bool):
+        saga = MockedSaga(
+            SagaAttributes(id="saga-id", data={}, current_step=1, status="processing")
+        )
+        self.mocked_saga_dao.get_one_by_id.return_value = saga
+
+        await self.saga_manager.handle_saga_command_response(
+            CommandResponse(MockedSaga.name, saga_id="saga-id", ok=success)
+        )
+
+        self.mocked_saga_dao.save.assert_awaited_once()
+        self.assertEqual(saga.get_current_step(), 1 if success else 0)
+        self.assertEqual(saga.get_status(), "done" if success else "failed")
+        self.assertEqual(saga.get_data(), {} if success else {"created": False})
+
+    async def test_success_flow(self):
+        await self.run_command_response_test(True)
+
+    async def test_failure_flow(self):
+        await self.run_command_response_test(False)
+
+    async def test_serializes_responses_of_one_saga(self):
+        active = []
+        overlapped = []
+
+        async def get_one_by_id(saga_id: str):
+            active.append(saga_id)
+            overlapped.append(len(active) > 1)
+            await asyncio.sleep(0.01)
+            active.remove(saga_id)
+            return MockedSaga(
+                SagaAttributes(id=saga_id, data={}, current_step=1, status="done")
+            )
+
+        self.mocked_saga_dao.get_one_by_id.side_effect = get_one_by_id
+
+        await asyncio.gather(
+            *(
+                self.saga_manager.handle_saga_command_response(
+                    CommandResponse(MockedSaga.name, saga_id="saga-id", ok=True)
+                )
+                for _ in range(3)
+            )
+        )
+
+        self.assertEqual(overlapped, [False, False, False])
+        self.assertEqual(self.saga_manager.saga_locks, {})
+
+    async def test_retries_response_on_conflict(self):
+        self.mocked_saga_dao.get_one_by_id.side_effect = lambda id: MockedSaga(
+            SagaAttributes(id=id, data={}, current_step=1, status="processing")
+        )
+        self.mocked_saga_dao.save.side_effect = [
+            SagaConflictError("saga-id", 0),
+            None,
+        ]
+
+        await self.saga_manager.handle_saga_command_response(
+            CommandResponse(MockedSaga.name, saga_id="saga-id", ok=True)
+        )
+
+        self.assertEqual(self.mocked_saga_dao.get_one_by_id.await_count, 2)
+        saga = self.mocked_saga_dao.save.await_args.args[0]
+        self.assertEqual(saga.get_status(), "done")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+import unittest
+from messaging import create_default_exchange
+from messaging.in_process import InProcessBroker, InProcessTransport
+from orchestrated_saga.command import Command
+from orchestrated_saga.command_queues import (
+    get_saga_participants,
+    initialize_command_queues,
+    initialize_response_queues,
+)
+from orchestrated_saga.saga import Saga
+from orchestrated_saga.step_builder import StepBuilder
+
+
+def command(saga: Saga):
+    return Command("command", saga.get_id(), {})
+
+
+class MockedSaga(Saga):
+    command_key = "mocked_saga"
+    step_defs = [
+        StepBuilder().withCommand(command).withParticipant("payments").build(),
+        StepBuilder()
+        .withParallel(
+            StepBuilder().withCommand(command).withParticipant("bookings").build(),
+            StepBuilder().withCommand(command).withParticipant("payments").build(),
+        )
+        .build(),
+    ]
+    name = "MockedSaga"
+
+
+class MockedShardedSaga(MockedSaga):
+    response_shards = 2
+
+
+class MockedUnnamedSaga(Saga):
+    command_key = "mocked_saga"
+    step_defs = [
+        StepBuilder().withCommand(command).build(),
+        StepBuilder().withCommand(command).withParticipant("payments").build(),
+    ]
+    name = "MockedUnnamedSaga"
+
+
+class TestCommandQueues(unittest.TestCase):
+    def test_collects_participants(self):
+        self.assertEqual(get_saga_participants(MockedSaga), ["payments", "bookings"])
+
+    def test_routes_commands_to_their_participant_only(self):
+        broker = InProcessBroker()
+        channel = InProcessTransport(broker).connect().channel()
+        create_default_exchange(channel)
+
+        queue_names = initialize_command_queues(channel, MockedSaga)
+        channel.basic_publish("mini-booking", "mocked_saga.command.bookings", b"{}")
+
+        self.assertEqual(
+            queue_names,
+            ["payments_mocked_saga_commands", "bookings_mocked_saga_commands"],
+        )
+        self.assertEqual(broker.message_count("payments_mocked_saga_commands"), 0)
+        self.assertEqual(broker.message_count("bookings_mocked_saga_commands"), 1)
+
+    def test_declares_shared_queue_for_steps_without_participant(self):
+        broker = InProcessBroker()
+        channel = InProcessTransport(broker).connect().channel()
+        create_default_exchange(channel)
+
+        queue_names = initialize_command_queues(channel, MockedUnnamedSaga)
+        channel.basic_publish("mini-booking", "mocked_saga.command", b"{}")
+
+        self.assertEqual(get_saga_participants(MockedUnnamedSaga), ["payments"])
+        self.assertEqual(
+            queue_names, ["payments_mocked_saga_commands", "mocked_saga_commands"]
+        )
+        self.assertEqual(broker.message_count("mocked_saga_commands"), 1)
+        self.assertEqual(broker.message_count("payments_mocked_saga_commands"), 0)
+
+    def test_declares_response_queues(self):
+        broker = InProcessBroker()
+        channel = InProcessTransport(broker).connect().channel()
+        create_default_exchange(channel)
+
+        self.assertEqual(
+            initialize_response_queues(channel, MockedSaga),
+            ["mocked_saga_command_responses"],
+        )
+        self.assertEqual(
+            initialize_response_queues(channel, MockedShardedSaga),
+            ["mocked_saga_command_responses_0", "mocked_saga_command_responses_1"],
+        )
+
+        channel.basic_publish("mini-booking", "mocked_saga.command_response.1", b"{}")
+        self.assertEqual(broker.message_count("mocked_saga_command_responses_0"), 0)
+        self.assertEqual(broker.message_count("mocked_saga_command_responses_1"), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
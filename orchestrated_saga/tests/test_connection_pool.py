@@ -0,0 +1,96 @@
+import unittest
+from threading import Timer
+from unittest.mock import MagicMock
+from psycopg2.extensions import (
+    TRANSACTION_STATUS_IDLE,
+    TRANSACTION_STATUS_INTRANS,
+    TRANSACTION_STATUS_UNKNOWN,
+)
+from orchestrated_saga.connection_pool import ConnectionPool, ConnectionPoolTimeout
+
+
+def mock_connection():
+    connection = MagicMock(closed=0)
+    connection.get_transaction_status.return_value = TRANSACTION_STATUS_IDLE
+    return connection
+
+
+class TestConnectionPool(unittest.TestCase):
+    def setUp(self):
+        self.connections = []
+
+        def connect():
+            connection = mock_connection()
+            self.connections.append(connection)
+            return connection
+
+        self.pool = ConnectionPool(connect, max_size=2, timeout=0.05)
+
+    def test_reuses_connections(self):
+        with self.pool.connection() as first:
+            pass
+        with self.pool.connection() as second:
+            pass
+
+        self.assertIs(first, second)
+        self.assertEqual(self.pool.stats()["created"], 1)
+        self.assertEqual(self.pool.stats()["checkouts"], 2)
+
+    def test_is_bounded(self):
+        first = self.pool.get_connection()
+        second = self.pool.get_connection()
+
+        self.assertEqual(self.pool.stats()["saturation"], 1)
+        with self.assertRaises(ConnectionPoolTimeout):
+            self.pool.get_connection()
+        self.assertEqual(self.pool.stats()["timeouts"], 1)
+
+        self.pool.put_connection(first)
+        self.pool.put_connection(second)
+        self.assertEqual(self.pool.stats()["in_use"], 0)
+
+    def test_waits_for_a_released_connection(self):
+        self.pool.timeout = 5
+        first = self.pool.get_connection()
+        self.pool.get_connection()
+        thread = Timer(0.05, lambda: self.pool.put_connection(first))
+
+        thread.start()
+        connection = self.pool.get_connection()
+        thread.join()
+
+        self.assertIs(connection, first)
+        self.assertEqual(self.pool.stats()["waits"], 1)
+        self.assertGreater(self.pool.stats()["total_wait_time"], 0)
+
+    def test_rolls_back_open_transaction_on_release(self):
+        with self.pool.connection() as connection:
+            connection.get_transaction_status.return_value = TRANSACTION_STATUS_INTRANS
+
+        connection.rollback.assert_called_once()
+        self.assertEqual(self.pool.stats()["idle"], 1)
+
+    def test_discards_broken_connections(self):
+        with self.pool.connection() as connection:
+            connection.get_transaction_status.return_value = TRANSACTION_STATUS_UNKNOWN
+        with self.pool.connection() as closed_connection:
+            closed_connection.closed = 1
+
+        self.assertEqual(self.pool.stats()["discarded"], 2)
+        self.assertEqual(self.pool.stats()["size"], 0)
+
+    def test_validates_idle_connections(self):
+        self.pool.validate_after = 0
+        with self.pool.connection() as connection:
+            pass
+        connection.cursor.side_effect = Exception("server closed the connection")
+
+        with self.pool.connection() as new_connection:
+            pass
+
+        self.assertIsNot(connection, new_connection)
+        self.assertEqual(self.pool.stats()["discarded"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+from concurrent.futures import Future
+from threading import Event
+from unittest.mock import MagicMock, Mock
+from orchestrated_saga.outbox_relay import OutboxRelay
+
+
+def resolved_future(result=None, exception: Exception | None = None):
+    future = Future()
+    if exception:
+        future.set_exception(exception)
+    else:
+        future.set_result(result)
+    return future
+
+
+class TestOutboxRelay(unittest.TestCase):
+    def setUp(self):
+        self.mocked_saga_dao = MagicMock()
+        self.mocked_saga_dao.get_outbox_messages.return_value = [
+            (1, "create_order_saga.command", {"name": "create_payment"}),
+            (2, "create_order_saga.command", {"name": "create_booking"}),
+        ]
+        self.mocked_publisher = Mock()
+        self.relay = OutboxRelay(
+            self.mocked_saga_dao, self.mocked_publisher, Event(), batch_size=10
+        )
+
+    def test_deletes_published_messages(self):
+        self.mocked_publisher.publish_many.return_value = resolved_future(2)
+
+        self.assertEqual(self.relay.relay_batch(), 2)
+
+        self.mocked_saga_dao.get_outbox_messages.assert_called_once_with(10)
+        self.mocked_publisher.publish_many.assert_called_once_with(
+            [
+                ("create_order_saga.command", {"name": "create_payment"}, "outbox-1"),
+                ("create_order_saga.command", {"name": "create_booking"}, "outbox-2"),
+            ]
+        )
+        self.mocked_saga_dao.delete_outbox_messages.assert_called_once_with([1, 2])
+
+    def test_keeps_messages_when_publish_fails(self):
+        self.mocked_publisher.publish_many.return_value = resolved_future(
+            exception=ConnectionError()
+        )
+
+        with self.assertRaises(ConnectionError):
+            self.relay.relay_batch()
+
+        self.mocked_saga_dao.delete_outbox_messages.assert_not_called()
+
+    def test_empty_outbox(self):
+        self.mocked_saga_dao.get_outbox_messages.return_value = []
+
+        self.assertEqual(self.relay.relay_batch(), 0)
+
+        self.mocked_publisher.publish_many.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,37 @@
+import unittest
+from orchestrated_saga.command import get_response_shard
+from orchestrated_saga.response_shards import get_owned_shards, get_shard_moves
+
+INSTANCES = ["orders-1", "orders-2", "orders-3"]
+
+
+class TestResponseShards(unittest.TestCase):
+    def test_spreads_sagas_over_shards(self):
+        shards = [get_response_shard(f"saga-{n}", 8) for n in range(1000)]
+        self.assertEqual(set(shards), set(range(8)))
+        self.assertEqual(get_response_shard("saga-1", 8), shards[1])
+
+    def test_instances_own_every_shard_once(self):
+        owned = [get_owned_shards(instance, INSTANCES, 32) for instance in INSTANCES]
+
+        self.assertEqual(sorted(sum(owned, [])), list(range(32)))
+        for shards in owned:
+            self.assertGreater(len(shards), 0)
+
+    def test_added_instance_only_takes_shards(self):
+        moves = get_shard_moves(32, INSTANCES, INSTANCES + ["orders-4"])
+
+        self.assertGreater(len(moves), 0)
+        for shard, (_, new_owner) in moves.items():
+            self.assertEqual(new_owner, "orders-4")
+        self.assertEqual(
+            sorted(moves), get_owned_shards("orders-4", INSTANCES + ["orders-4"], 32)
+        )
+
+    def test_rejects_unknown_instance(self):
+        with self.assertRaises(ValueError):
+            get_owned_shards("orders-4", INSTANCES, 8)
+
+
+if __name__ == "__main__":
+    unittest.main()
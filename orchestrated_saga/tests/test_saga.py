@@ -1,7 +1,22 @@
 import unittest
 
-from orchestrated_saga.saga import Saga, SagaAttributes
-from orchestrated_saga.step import LocalStepDef, ParticipantStepDef, StepDef
+from orchestrated_saga.saga import (
+    LOCAL_STEP,
+    MEMBER_TRANSITION,
+    PARTICIPANT_STEP,
+    Saga,
+    SagaAttributes,
+    Transition,
+    states,
+)
+from orchestrated_saga.command import Command, get_response_shard
+from orchestrated_saga.step import (
+    LocalStepDef,
+    ParallelStepDef,
+    ParticipantStepDef,
+    StepDef,
+)
+from orchestrated_saga.step_builder import StepBuilder
 
 
 def mock_participant_step_def():
@@ -14,6 +29,7 @@ def mock_local_step_def():
 
 def mock_saga(saga_step_defs: list[StepDef], saga_attributes: SagaAttributes = {}):
     class MockedSaga(Saga):
+        command_key = "mocked_saga"
         name = "MockedSaga"
         step_defs = saga_step_defs
 
@@ -157,5 +173,319 @@ class TestSaga(unittest.TestCase):
         self.assertEqual(saga.get_current_step(), 0)
 
 
+    def test_terminal_statuses_do_not_change(self):
+        for status in ("done", "failed"):
+            saga = mock_saga([mock_local_step_def()], {"status": status})
+            saga.tick()
+            saga.tick_command_response(False)
+            self.assertEqual(saga.get_status(), status)
+            self.assertEqual(saga.get_current_step(), 0)
+
+    def test_tracks_changed_attributes(self):
+        saga = mock_saga([mock_local_step_def(), mock_participant_step_def()])
+        saga.tick()
+        self.assertEqual(saga.get_dirty_attributes(), {"current_step"})
+        saga.tick()
+        self.assertEqual(saga.get_dirty_attributes(), {"current_step", "status"})
+
+        saga.mark_clean()
+        saga.mark_dirty("data")
+        self.assertEqual(saga.get_dirty_attributes(), {"data"})
+
+
+class TestStepPlan(unittest.TestCase):
+    def test_is_compiled_with_the_saga_class(self):
+        saga = mock_saga([mock_local_step_def(), mock_participant_step_def()])
+        step_plan = type(saga).step_plan
+
+        self.assertEqual(step_plan.kinds, (LOCAL_STEP, PARTICIPANT_STEP))
+        self.assertEqual(
+            step_plan.tick_transitions["pending"],
+            (Transition("pending", 1), Transition("processing")),
+        )
+        self.assertEqual(
+            step_plan.response_transitions[("processing", False)],
+            (Transition("failed"), Transition("compensation", -1)),
+        )
+
+    def test_compiles_member_transitions_of_parallel_steps_only(self):
+        saga = mock_saga(
+            [mock_participant_step_def(), ParallelStepDef([mock_member_step_def("a")])]
+        )
+        step_plan = type(saga).step_plan
+
+        self.assertEqual(
+            step_plan.tick_transitions["compensation"],
+            (Transition("failed"), MEMBER_TRANSITION),
+        )
+        self.assertEqual(
+            step_plan.response_transitions[("compensating", True)],
+            (Transition("done"), MEMBER_TRANSITION),
+        )
+        self.assertEqual(
+            step_plan.tick_transitions["pending"][1], Transition("processing")
+        )
+
+    def test_step_timeouts(self):
+        saga = mock_saga(
+            [
+                mock_local_step_def(),
+                ParticipantStepDef(lambda: None, lambda: None, timeout=5),
+            ]
+        )
+        self.assertEqual(type(saga).step_plan.timeouts, (None, 5))
+        self.assertIsNone(saga.get_step_timeout())
+
+        saga.tick()
+        saga.tick()
+        self.assertEqual(saga.get_status(), "processing")
+        self.assertEqual(saga.get_step_timeout(), 5)
+
+    def test_states_are_shared(self):
+        first = mock_saga([mock_participant_step_def()])
+        second = mock_saga([mock_participant_step_def()])
+        first.tick()
+        second.tick()
+        self.assertIs(first.state, states["processing"])
+        self.assertIs(first.state, second.state)
+
+
+def mock_member_step_def(name: str, compensated: bool = True):
+    return ParticipantStepDef(
+        lambda saga: Command(name, saga.get_id(), {}),
+        (lambda saga: Command(f"cancel_{name}", saga.get_id(), {}))
+        if compensated
+        else None,
+    )
+
+
+def mock_parallel_saga(saga_attributes: SagaAttributes = {}):
+    return mock_saga(
+        [
+            mock_local_step_def(),
+            ParallelStepDef(
+                [
+                    mock_member_step_def("a"),
+                    mock_member_step_def("b"),
+                    mock_member_step_def("c", compensated=False),
+                ]
+            ),
+            mock_local_step_def(),
+        ],
+        {"current_step": 1, **saga_attributes},
+    )
+
+
+def command_names(commands: list[Command]):
+    return [command.name for command in commands]
+
+
+class TestParallelStep(unittest.TestCase):
+    def test_waits_for_all_members(self):
+        saga = mock_parallel_saga()
+        self.assertEqual(command_names(saga.run_parallel_step()), ["a", "b", "c"])
+        saga.tick()
+        self.assertEqual(saga.get_status(), "processing")
+
+        saga.tick_command_response(True, "b")
+        saga.tick_command_response(True, "a")
+        self.assertEqual(saga.get_status(), "processing")
+
+        saga.tick_command_response(True, "c")
+        self.assertEqual(saga.get_status(), "pending")
+        self.assertEqual(saga.get_current_step(), 2)
+        self.assertIsNone(saga.get_step_results())
+
+    def test_compensates_members_that_succeeded(self):
+        saga = mock_parallel_saga()
+        saga.run_parallel_step()
+        saga.tick()
+
+        saga.tick_command_response(True, "a")
+        saga.tick_command_response(False, "b")
+        self.assertEqual(saga.get_status(), "compensation")
+        self.assertEqual(command_names(saga.run_parallel_step()), ["cancel_a"])
+        saga.tick()
+        self.assertEqual(saga.get_status(), "compensating")
+
+        # A late success is compensated too, c has no compensation.
+        saga.tick_command_response(True, "c")
+        self.assertEqual(saga.get_status(), "compensation")
+        self.assertEqual(saga.run_parallel_step(), [])
+        saga.tick()
+        self.assertEqual(saga.get_status(), "compensating")
+
+        saga.tick_command_response(True, "cancel_a")
+        self.assertEqual(saga.get_status(), "compensation")
+        self.assertEqual(saga.get_current_step(), 0)
+        self.assertIsNone(saga.get_step_results())
+
+    def test_ignores_unknown_and_duplicate_responses(self):
+        saga = mock_parallel_saga()
+        saga.run_parallel_step()
+        saga.tick()
+        saga.tick_command_response(True, "a")
+        saga.mark_clean()
+
+        saga.tick_command_response(False, "a")
+        saga.tick_command_response(False, "unknown")
+
+        self.assertEqual(saga.get_status(), "processing")
+        self.assertEqual(saga.get_dirty_attributes(), set())
+
+    def test_timeout_fails_the_group(self):
+        saga = mock_parallel_saga()
+        saga.run_parallel_step()
+        saga.tick()
+        saga.tick_command_response(True, "a")
+
+        saga.tick_command_response(False)
+
+        self.assertEqual(saga.get_status(), "compensation")
+        self.assertEqual(command_names(saga.run_parallel_step()), ["cancel_a"])
+
+    def test_members_with_the_same_command(self):
+        saga = mock_saga(
+            [
+                mock_local_step_def(),
+                ParallelStepDef([mock_member_step_def("a"), mock_member_step_def("a")]),
+            ],
+            {"current_step": 1},
+        )
+        commands = saga.run_parallel_step()
+        self.assertEqual([command.member for command in commands], [0, 1])
+        self.assertEqual(len({command.message_id for command in commands}), 2)
+        saga.tick()
+
+        saga.tick_command_response(True, "a", 0)
+        saga.tick_command_response(True, "a", 0)
+        self.assertEqual(saga.get_status(), "processing")
+
+        saga.tick_command_response(False, "a", 1)
+        self.assertEqual(saga.get_status(), "compensation")
+        self.assertEqual([command.member for command in saga.run_parallel_step()], [0])
+        saga.tick()
+
+        # A late reply to the command of the member is not its compensation.
+        saga.tick_command_response(True, "a", 0)
+        self.assertEqual(saga.get_status(), "compensating")
+        saga.tick_command_response(True, "cancel_a", 0)
+        self.assertEqual(saga.get_status(), "compensation")
+        self.assertEqual(saga.get_current_step(), 0)
+
+    def test_routes_member_commands(self):
+        saga = mock_saga(
+            [
+                ParallelStepDef(
+                    [
+                        ParticipantStepDef(
+                            lambda saga: Command("a", saga.get_id(), {}),
+                            None,
+                            participant="payments",
+                        ),
+                        mock_member_step_def("b"),
+                    ]
+                )
+            ]
+        )
+
+        self.assertEqual(
+            [command.routing_key for command in saga.run_parallel_step()],
+            ["mocked_saga.command.payments", "mocked_saga.command"],
+        )
+
+    def test_commands_reply_to_the_saga_shard(self):
+        saga = mock_parallel_saga({"id": "saga-id"})
+        self.assertEqual(
+            [command.reply_to for command in saga.run_parallel_step()],
+            ["mocked_saga.command_response"] * 3,
+        )
+
+        saga = mock_parallel_saga({"id": "saga-id"})
+        saga.response_shards = 4
+        self.assertEqual(
+            [command.reply_to for command in saga.run_parallel_step()],
+            [f"mocked_saga.command_response.{get_response_shard('saga-id', 4)}"] * 3,
+        )
+
+    def test_compensates_all_members_from_later_step(self):
+        saga = mock_parallel_saga({"status": "compensation"})
+        self.assertEqual(
+            command_names(saga.run_parallel_step()), ["cancel_a", "cancel_b"]
+        )
+        saga.tick()
+        self.assertEqual(saga.get_status(), "compensating")
+        self.assertEqual(
+            command_names(saga.get_parallel_waiting_commands()),
+            ["cancel_a", "cancel_b"],
+        )
+
+
+def payload_command(saga: Saga):
+    return Command("create", saga.get_id(), saga.get_data())
+
+
+class TestStepPayload(unittest.TestCase):
+    def test_projects_command_payloads(self):
+        step_def = (
+            StepBuilder()
+            .withCommand(payload_command)
+            .withCompensation(payload_command)
+            .withPayload("id", "color")
+            .withCompensationPayload("id")
+            .build()
+        )
+        saga = mock_saga([step_def], {"data": {"id": 1, "color": "RED", "x": 2}})
+
+        command = saga.prepare_command(step_def, payload_command(saga))
+        self.assertEqual(command.payload, {"id": 1, "color": "RED"})
+        compensation = saga.prepare_command(step_def, payload_command(saga), True)
+        self.assertEqual(compensation.payload, {"id": 1})
+        # The saga data itself is left alone.
+        self.assertEqual(saga.get_data(), {"id": 1, "color": "RED", "x": 2})
+
+    def test_projection_function(self):
+        step_def = (
+            StepBuilder()
+            .withCommand(payload_command)
+            .withPayload(lambda data: {"order": data["id"]})
+            .build()
+        )
+        saga = mock_saga([step_def], {"data": {"id": 1, "color": "RED"}})
+
+        for is_compensation in (False, True):
+            command = saga.prepare_command(
+                step_def, payload_command(saga), is_compensation
+            )
+            self.assertEqual(command.payload, {"order": 1})
+
+    def test_sends_whole_payload_by_default(self):
+        step_def = StepBuilder().withCommand(payload_command).build()
+        saga = mock_saga([step_def], {"data": {"id": 1, "color": "RED"}})
+
+        command = saga.prepare_command(step_def, payload_command(saga))
+        self.assertEqual(command.payload, {"id": 1, "color": "RED"})
+
+    def test_rejects_invalid_payloads(self):
+        invalid_builders = [
+            lambda: StepBuilder().withCommand(payload_command).withPayload(),
+            lambda: StepBuilder().withCommand(payload_command).withPayload("id", 1),
+            lambda: StepBuilder().withCommand(payload_command).withPayload("id", "id"),
+            lambda: StepBuilder()
+            .withCommand(payload_command)
+            .withPayload(lambda data: data, "id"),
+            lambda: StepBuilder()
+            .withAction(lambda saga: None)
+            .withPayload("id"),
+            lambda: StepBuilder()
+            .withParallel(StepBuilder().withCommand(payload_command).build())
+            .withPayload("id"),
+        ]
+
+        for build in invalid_builders:
+            with self.assertRaises(ValueError):
+                build().build()
+
+
 if __name__ == "__main__":
     unittest.main()
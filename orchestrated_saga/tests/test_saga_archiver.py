@@ -0,0 +1,37 @@
+import unittest
+from threading import Event
+from unittest.mock import Mock
+from orchestrated_saga.saga_archiver import SagaArchiver
+
+
+class TestSagaArchiver(unittest.TestCase):
+    def test_archives_until_nothing_is_left(self):
+        mocked_saga_dao = Mock()
+        mocked_saga_dao.archive_sagas.side_effect = [10, 10, 3]
+        archiver = SagaArchiver(
+            mocked_saga_dao, Event(), archive_after=60, batch_size=10, batch_delay=0
+        )
+
+        self.assertEqual(archiver.archive(), 23)
+
+        self.assertEqual(mocked_saga_dao.archive_sagas.call_count, 3)
+        mocked_saga_dao.archive_sagas.assert_called_with(60, 10)
+        self.assertEqual(archiver.archived, 23)
+
+    def test_deletes_old_processed_message_ids(self):
+        mocked_saga_dao = Mock()
+        mocked_saga_dao.delete_processed_messages.side_effect = [10, 2]
+        archiver = SagaArchiver(
+            mocked_saga_dao,
+            Event(),
+            batch_size=10,
+            batch_delay=0,
+            processed_message_retention=3600,
+        )
+
+        self.assertEqual(archiver.delete_processed_messages(), 12)
+        mocked_saga_dao.delete_processed_messages.assert_called_with(3600, 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
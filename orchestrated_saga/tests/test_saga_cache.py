@@ -0,0 +1,49 @@
+import unittest
+from threading import Event
+from orchestrated_saga.saga_cache import CachedSaga, SagaCache, SagaCacheInvalidator
+
+
+def cached_saga(current_step=0, status="pending"):
+    return CachedSaga("MockedSaga", "{}", None, None, current_step, status)
+
+
+class TestSagaCache(unittest.TestCase):
+    def test_evicts_least_recently_used(self):
+        cache = SagaCache(max_size=2)
+        cache.put("a", cached_saga())
+        cache.put("b", cached_saga())
+        cache.get("a")
+        cache.put("c", cached_saga())
+
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+        self.assertIsNotNone(cache.get("c"))
+        stats = cache.stats()
+        self.assertEqual(
+            (stats["size"], stats["hits"], stats["misses"], stats["evictions"]),
+            (2, 3, 1, 1),
+        )
+
+    def test_updates_step_and_status(self):
+        cache = SagaCache()
+        self.assertFalse(cache.update("a", 1, "processing"))
+        cache.put("a", cached_saga())
+        self.assertTrue(cache.update("a", 1, "processing"))
+        self.assertEqual(cache.get("a"), cached_saga(1, "processing"))
+
+    def test_invalidates_sagas_of_other_instances(self):
+        cache = SagaCache()
+        cache.put("a", cached_saga())
+        cache.put("b", cached_saga())
+        invalidator = SagaCacheInvalidator(cache, None, "orders-1", Event())
+
+        invalidator.handle_notification("orders-1:a")
+        invalidator.handle_notification("orders-2:b")
+
+        self.assertTrue(cache.contains("a"))
+        self.assertFalse(cache.contains("b"))
+        self.assertEqual(cache.stats()["invalidations"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
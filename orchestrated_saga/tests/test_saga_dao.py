@@ -0,0 +1,288 @@
+import unittest
+from unittest.mock import MagicMock, Mock, PropertyMock
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+from orchestrated_saga.connection_pool import ConnectionPool
+from orchestrated_saga.saga import Saga, SagaAttributes
+from orchestrated_saga.saga_cache import SagaCache
+from orchestrated_saga.saga_dao import SagaConflictError, SagaDao
+from orchestrated_saga.command import Command
+from orchestrated_saga.command_response import CommandResponse
+from orchestrated_saga.saga_data_codec import CompressedCodec, JsonCodec
+from orchestrated_saga.saga_manager import SagaManager
+from orchestrated_saga.step_builder import StepBuilder
+
+
+class MockedSaga(Saga):
+    name = "MockedSaga"
+    step_defs = []
+
+
+def mock_saga():
+    return MockedSaga(SagaAttributes(data={}, current_step=0, status="pending"))
+
+
+def create_payment(saga: Saga):
+    return Command("create_payment", saga.get_id(), {})
+
+
+def mark_paid(saga: Saga):
+    saga.get_data()["paid"] = True
+
+
+def create_booking(saga: Saga):
+    return Command("create_booking", saga.get_id(), {})
+
+
+class InPlaceSaga(Saga):
+    command_key = "in_place_saga"
+    step_defs = [
+        StepBuilder().withCommand(create_payment).build(),
+        StepBuilder().withAction(mark_paid).build(),
+        StepBuilder().withCommand(create_booking).build(),
+    ]
+    name = "InPlaceSaga"
+
+
+class TestSagaDao(unittest.TestCase):
+    def setUp(self):
+        self.connection = MagicMock(closed=0)
+        self.connection.get_transaction_status.return_value = TRANSACTION_STATUS_IDLE
+        self.pool = ConnectionPool(lambda: self.connection, max_size=1)
+        self.saga_dao = SagaDao(self.pool, {"MockedSaga": MockedSaga})
+
+    def test_commits_every_write(self):
+        saga = self.saga_dao.save(mock_saga())
+        saga.set_status("processing")
+        self.saga_dao.save(saga)
+        self.assertEqual(self.connection.commit.call_count, 2)
+
+    def test_transaction_commits_once(self):
+        with self.saga_dao.transaction():
+            saga = self.saga_dao.save(mock_saga())
+            with self.saga_dao.transaction():
+                self.saga_dao.save(saga)
+            self.connection.commit.assert_not_called()
+
+        self.connection.commit.assert_called_once()
+        self.connection.rollback.assert_not_called()
+
+    def test_transaction_rolls_back_on_error(self):
+        with self.assertRaises(ValueError):
+            with self.saga_dao.transaction():
+                self.saga_dao.save(mock_saga())
+                raise ValueError()
+
+        self.connection.commit.assert_not_called()
+        self.connection.rollback.assert_called_once()
+        self.assertFalse(self.saga_dao.in_transaction())
+
+    def test_returns_connection_to_pool(self):
+        self.saga_dao.save(mock_saga())
+        with self.saga_dao.transaction():
+            self.assertEqual(self.pool.stats()["in_use"], 1)
+            self.saga_dao.save(mock_saga())
+        stats = self.pool.stats()
+        self.assertEqual(stats["in_use"], 0)
+        self.assertEqual(stats["created"], 1)
+
+
+    def test_reads_data_of_any_codec(self):
+        codec = CompressedCodec(JsonCodec(), threshold=0)
+        data = {"id": "abcd"}
+
+        self.assertEqual(self.saga_dao.decode_data('{"id": "abcd"}', None, None), data)
+        self.assertEqual(self.saga_dao.decode_data(data, None, None), data)
+        self.assertEqual(
+            self.saga_dao.decode_data(None, codec.name, codec.encode(data)), data
+        )
+
+    def test_writes_data_with_codec(self):
+        data = {"id": "abcd"}
+        jsonb, codec_name, blob = self.saga_dao.encode_data(data)
+        self.assertEqual((jsonb.adapted, codec_name, blob), (data, None, None))
+
+        self.saga_dao.data_codec = JsonCodec()
+        self.assertEqual(
+            self.saga_dao.encode_data(data), (None, "json", b'{"id":"abcd"}')
+        )
+
+
+    def get_executed_statements(self):
+        curs = self.connection.cursor.return_value.__enter__.return_value
+        return [" ".join(call.args[0].split()) for call in curs.execute.call_args_list]
+
+    def test_updates_only_changed_attributes(self):
+        saga = self.saga_dao.save(mock_saga())
+        saga.set_status("processing")
+        self.saga_dao.save(saga)
+        saga.set_current_step(1)
+        saga.set_data({"id": "abcd"})
+        self.saga_dao.save(saga)
+
+        statements = self.get_executed_statements()
+        self.assertEqual(
+            statements[1:],
+            [
+                "UPDATE sagas SET status = %s, updated_at = now(), "
+                + "version = version + 1 WHERE id = %s AND version = %s",
+                "UPDATE sagas SET data = %s, data_codec = %s, data_blob = %s, "
+                + "current_step = %s, updated_at = now(), "
+                + "version = version + 1 WHERE id = %s AND version = %s",
+            ],
+        )
+        self.assertEqual(saga.get_dirty_attributes(), set())
+        self.assertEqual(saga.get_version(), 2)
+
+    def test_rejects_update_of_changed_saga(self):
+        saga = self.saga_dao.save(mock_saga())
+        curs = self.connection.cursor.return_value.__enter__.return_value
+        curs.rowcount = 0
+        saga.set_status("processing")
+
+        with self.assertRaises(SagaConflictError):
+            self.saga_dao.save(saga)
+
+        self.assertEqual(curs.execute.call_args.args[1][-2:], (saga.get_id(), 0))
+        self.assertEqual(saga.get_version(), 0)
+        self.connection.rollback.assert_called_once()
+
+    def test_updates_data_marked_dirty(self):
+        saga = self.saga_dao.save(mock_saga())
+        saga.get_data()["id"] = "abcd"
+        saga.mark_dirty("data")
+        saga.set_status("processing")
+        self.saga_dao.save(saga)
+        self.saga_dao.save(saga)
+
+        self.assertEqual(
+            self.get_executed_statements()[1:],
+            [
+                "UPDATE sagas SET data = %s, data_codec = %s, data_blob = %s, "
+                + "status = %s, updated_at = now(), "
+                + "version = version + 1 WHERE id = %s AND version = %s",
+            ],
+        )
+
+    def test_skips_update_without_changes(self):
+        saga = MockedSaga(
+            SagaAttributes(id="saga-id", data={}, current_step=0, status="done")
+        )
+        saga.tick()
+        self.saga_dao.save(saga)
+
+        self.assertEqual(self.get_executed_statements(), [])
+
+
+class TestSagaDaoCache(unittest.TestCase):
+    def setUp(self):
+        self.connection = MagicMock(closed=0)
+        self.connection.get_transaction_status.return_value = TRANSACTION_STATUS_IDLE
+        self.curs = self.connection.cursor.return_value.__enter__.return_value
+        self.curs.fetchone.return_value = None
+        self.cache = SagaCache()
+        self.saga_dao = SagaDao(
+            ConnectionPool(lambda: self.connection, max_size=1),
+            {"MockedSaga": MockedSaga},
+            cache=self.cache,
+        )
+
+    def test_reads_written_sagas_from_cache(self):
+        saga = mock_saga()
+        saga.set_data({"id": "abcd"})
+        self.saga_dao.save(saga)
+        saga.set_status("processing")
+        self.saga_dao.save(saga)
+        saga.get_data()["id"] = "changed in place"
+
+        cached = self.saga_dao.get_one_by_id(saga.get_id())
+
+        self.curs.fetchone.assert_not_called()
+        self.assertIsInstance(cached, MockedSaga)
+        self.assertEqual(cached.get_data(), {"id": "abcd"})
+        self.assertEqual(cached.get_status(), "processing")
+        self.assertEqual(self.cache.stats()["hits"], 1)
+
+    def test_saves_data_changed_in_place_by_local_step(self):
+        saga_dao = SagaDao(
+            self.saga_dao.pool, {"InPlaceSaga": InPlaceSaga}, cache=self.cache
+        )
+        saga_manager = SagaManager(saga_dao, Mock(), unit_of_work=True)
+        saga_manager.start_saga(InPlaceSaga, {"id": "abcd"})
+        saga_id = next(iter(self.cache.entries))
+
+        saga_manager.handle_saga_command_response(
+            CommandResponse("create_payment", saga_id, True)
+        )
+
+        saga = saga_dao.get_one_by_id(saga_id)
+        self.curs.fetchone.assert_not_called()
+        self.assertEqual(saga.get_current_step(), 2)
+        self.assertEqual(saga.get_data(), {"id": "abcd", "paid": True})
+
+    def test_handles_response_again_when_cached_saga_is_stale(self):
+        saga_dao = SagaDao(
+            self.saga_dao.pool, {"InPlaceSaga": InPlaceSaga}, cache=self.cache
+        )
+        saga_manager = SagaManager(saga_dao, Mock(), unit_of_work=True)
+        saga_manager.start_saga(InPlaceSaga, {"id": "abcd"})
+        saga_id = next(iter(self.cache.entries))
+        # Another instance handled the payment, its invalidation has not
+        # arrived yet.
+        # The cached saga still waits for the payment, the version check
+        # finds it stale before the reply is dropped.
+        self.curs.fetchone.side_effect = [
+            (1,),
+            (
+                saga_id, "InPlaceSaga", {"id": "abcd", "paid": True}, None, None,
+                2, "processing", None, 1, "create_booking", False,
+            ),
+        ]
+        type(self.curs).rowcount = PropertyMock(return_value=1)
+
+        saga_manager.handle_saga_command_response(
+            CommandResponse("create_booking", saga_id, True)
+        )
+
+        self.assertEqual(self.curs.fetchone.call_count, 2)
+        values = self.curs.execute.call_args.args[1]
+        self.assertEqual((values[0], *values[-2:]), ("done", saga_id, 1))
+        self.assertEqual(self.cache.stats()["size"], 0)
+
+    def test_evicts_finished_sagas(self):
+        saga = self.saga_dao.save(mock_saga())
+        self.assertEqual(self.cache.stats()["size"], 1)
+        saga.set_status("done")
+        self.saga_dao.save(saga)
+
+        self.assertIsNone(self.saga_dao.get_one_by_id(saga.get_id()))
+        self.curs.fetchone.assert_called_once()
+
+    def test_writes_reach_cache_on_commit_only(self):
+        saga = self.saga_dao.save(mock_saga())
+
+        with self.assertRaises(ValueError):
+            with self.saga_dao.transaction():
+                saga.set_status("processing")
+                self.saga_dao.save(saga)
+                self.assertEqual(
+                    self.saga_dao.get_one_by_id(saga.get_id()).get_status(), "pending"
+                )
+                raise ValueError()
+
+        self.assertEqual(self.cache.stats()["size"], 0)
+
+    def test_conflict_invalidates_cached_saga(self):
+        saga = self.saga_dao.save(mock_saga())
+        self.curs.rowcount = 0
+        saga.set_status("processing")
+
+        with self.assertRaises(SagaConflictError):
+            self.saga_dao.save(saga)
+
+        self.assertEqual(self.cache.stats()["size"], 0)
+        self.assertIsNone(self.saga_dao.get_one_by_id(saga.get_id()))
+        self.curs.fetchone.assert_called_once()
+
+
+if __name__ == "__main__":
+    unittest.main()
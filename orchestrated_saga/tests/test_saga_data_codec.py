@@ -0,0 +1,47 @@
+import unittest
+from orchestrated_saga.saga_data_codec import (
+    CompressedCodec,
+    JsonCodec,
+    MsgpackCodec,
+    get_data_codec,
+    msgpack,
+)
+
+DATA = {"id": "abcd", "color": "RED", "items": [1, 2.5, None, True], "nested": {}}
+
+
+class TestSagaDataCodec(unittest.TestCase):
+    def test_json(self):
+        codec = JsonCodec()
+        self.assertEqual(codec.decode(codec.encode(DATA)), DATA)
+
+    @unittest.skipIf(msgpack is None, "msgpack is not installed")
+    def test_msgpack(self):
+        codec = MsgpackCodec()
+        encoded = codec.encode(DATA)
+        self.assertLess(len(encoded), len(JsonCodec().encode(DATA)))
+        self.assertEqual(codec.decode(encoded), DATA)
+
+    def test_compresses_above_threshold(self):
+        codec = CompressedCodec(JsonCodec(), threshold=100)
+        small = codec.encode(DATA)
+        large_data = {"text": "x" * 1000}
+        large = codec.encode(large_data)
+
+        self.assertEqual(small[:1], b"\x00")
+        self.assertEqual(large[:1], b"\x01")
+        self.assertLess(len(large), 100)
+        self.assertEqual(codec.decode(small), DATA)
+        self.assertEqual(codec.decode(memoryview(large)), large_data)
+
+    def test_get_data_codec(self):
+        self.assertIsInstance(get_data_codec("json"), JsonCodec)
+        codec = get_data_codec("zlib+json")
+        self.assertIsInstance(codec, CompressedCodec)
+        self.assertEqual(codec.name, "zlib+json")
+        with self.assertRaises(ValueError):
+            get_data_codec("unknown")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,11 +1,14 @@
 from typing import TypedDict
 import unittest
-from unittest.mock import Mock
-from orchestrated_saga.command import Command
+from unittest.mock import MagicMock, Mock
+from orchestrated_saga.command import Command, get_command_message_id
 from orchestrated_saga.command_response import CommandResponse
+from orchestrated_saga.payload_stats import PayloadStats
 from orchestrated_saga.saga import Saga, SagaAttributes
+from orchestrated_saga.saga_dao import SagaConflictError
 from orchestrated_saga.saga_manager import SagaManager
 from orchestrated_saga.step_builder import StepBuilder
+from orchestrated_saga.step_timeout_scheduler import StepTimeoutScheduler
 
 
 def step_one_action(saga: Saga):
@@ -39,10 +42,43 @@ class MockedSaga(Saga):
     name = "MockedSaga"
 
 
+class MockedParallelSaga(Saga):
+    command_key = "mocked_saga"
+    step_defs = [
+        StepBuilder()
+        .withParallel(
+            StepBuilder().withCommand(step_two_command).build(),
+            StepBuilder()
+            .withCommand(lambda saga: Command("create_other", saga.get_id(), {}))
+            .build(),
+        )
+        .build(),
+    ]
+    name = "MockedParallelSaga"
+
+
+class MockedTwoCommandSaga(Saga):
+    command_key = "mocked_saga"
+    step_defs = [
+        StepBuilder()
+        .withAction(step_one_action)
+        .withCompensation(step_one_compensation)
+        .build(),
+        StepBuilder()
+        .withCommand(step_two_command)
+        .withCompensation(step_two_compensation)
+        .build(),
+        StepBuilder()
+        .withCommand(lambda saga: Command("create_other", saga.get_id(), {}))
+        .build(),
+    ]
+    name = "MockedTwoCommandSaga"
+
+
 class TestSagaManager(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
-        cls.mocked_saga_dao = Mock()
+        cls.mocked_saga_dao = MagicMock()
         cls.mocked_publisher = Mock()
 
     def setUp(self):
@@ -65,7 +101,7 @@ class TestSagaManager(unittest.TestCase):
 
         self.mocked_saga_dao.get_one_by_id.side_effect = lambda _: actual_saga
         command_response = CommandResponse(
-            MockedSaga.name, saga_id=actual_saga.get_id(), ok=success
+            "create_something", saga_id=actual_saga.get_id(), ok=success
         )
         saga_manager.handle_saga_command_response(command_response)
         actual_saga = self.mocked_saga_dao.save.call_args.args[0]
@@ -79,5 +115,389 @@ class TestSagaManager(unittest.TestCase):
         self.run_saga_test(False)
 
 
+class TestSagaManagerUnitOfWork(unittest.TestCase):
+    def setUp(self):
+        self.events = []
+        self.mocked_saga_dao = MagicMock()
+        self.mocked_saga_dao.generate_id.return_value = "saga-id"
+        self.mocked_saga_dao.transaction.return_value.__exit__.side_effect = (
+            lambda *args: self.events.append("commit")
+        )
+        self.mocked_publisher = Mock()
+        self.mocked_publisher.publish.side_effect = (
+            lambda *args, **kwargs: self.events.append("publish")
+        )
+        self.saga_manager = SagaManager(
+            self.mocked_saga_dao, self.mocked_publisher, unit_of_work=True
+        )
+
+    def test_start_saga_saves_once(self):
+        self.saga_manager.start_saga(MockedSaga, {})
+
+        self.mocked_saga_dao.save.assert_not_called()
+        self.mocked_saga_dao.update.assert_not_called()
+        self.mocked_saga_dao.create.assert_called_once()
+        actual_saga = self.mocked_saga_dao.create.call_args.args[0]
+        self.assertEqual(actual_saga.get_id(), "saga-id")
+        self.assertEqual(actual_saga.get_current_step(), 1)
+        self.assertEqual(actual_saga.get_status(), "processing")
+        self.assertEqual(self.events, ["commit", "publish"])
+        self.assertEqual(
+            self.mocked_publisher.publish.call_args.kwargs["message_id"],
+            get_command_message_id("saga-id", 1, "create_something", False),
+        )
+
+    def run_command_response_test(self, success: bool):
+        saga = MockedSaga(
+            SagaAttributes(id="saga-id", data={}, current_step=1, status="processing")
+        )
+        self.mocked_saga_dao.get_one_by_id.return_value = saga
+
+        self.saga_manager.handle_saga_command_response(
+            CommandResponse(MockedSaga.name, saga_id="saga-id", ok=success)
+        )
+
+        self.mocked_saga_dao.update.assert_called_once_with(saga)
+        self.assertEqual(saga.get_current_step(), 1 if success else 0)
+        self.assertEqual(saga.get_status(), "done" if success else "failed")
+        self.assertEqual(self.events, ["commit"])
+
+    def test_success_flow(self):
+        self.run_command_response_test(True)
+
+    def test_failure_flow(self):
+        self.run_command_response_test(False)
+
+    def test_drops_processed_responses(self):
+        saga_manager = SagaManager(
+            self.mocked_saga_dao,
+            self.mocked_publisher,
+            unit_of_work=True,
+            deduplicate=True,
+        )
+        saga = MockedSaga(
+            SagaAttributes(id="saga-id", data={}, current_step=1, status="processing")
+        )
+        self.mocked_saga_dao.get_one_by_id.return_value = saga
+        self.mocked_saga_dao.add_processed_message.side_effect = [True, False]
+        response = CommandResponse(
+            "create_something", saga_id="saga-id", ok=True, message_id="message-id"
+        )
+
+        saga_manager.handle_saga_command_response(response)
+        saga_manager.handle_saga_command_response(response)
+
+        self.mocked_saga_dao.add_processed_message.assert_called_with("message-id")
+        self.mocked_saga_dao.update.assert_called_once_with(saga)
+        self.assertEqual(saga.get_status(), "done")
+
+    def test_retries_response_on_conflict(self):
+        sagas = []
+
+        def load_saga(id):
+            sagas.append(
+                MockedSaga(
+                    SagaAttributes(
+                        id=id, data={}, current_step=1, status="processing"
+                    )
+                )
+            )
+            return sagas[-1]
+
+        self.mocked_saga_dao.get_one_by_id.side_effect = load_saga
+        self.mocked_saga_dao.update.side_effect = [
+            SagaConflictError("saga-id", 0),
+            None,
+        ]
+
+        self.saga_manager.handle_saga_command_response(
+            CommandResponse(MockedSaga.name, saga_id="saga-id", ok=True)
+        )
+
+        self.assertEqual(len(sagas), 2)
+        self.mocked_saga_dao.update.assert_called_with(sagas[1])
+        self.assertEqual(sagas[1].get_status(), "done")
+
+    def test_gives_up_after_conflict_retries(self):
+        saga_manager = SagaManager(
+            self.mocked_saga_dao,
+            self.mocked_publisher,
+            unit_of_work=True,
+            conflict_retries=1,
+        )
+        self.mocked_saga_dao.get_one_by_id.side_effect = lambda id: MockedSaga(
+            SagaAttributes(id=id, data={}, current_step=1, status="processing")
+        )
+        self.mocked_saga_dao.update.side_effect = SagaConflictError("saga-id", 0)
+
+        with self.assertRaises(SagaConflictError):
+            saga_manager.handle_saga_command_response(
+                CommandResponse(MockedSaga.name, saga_id="saga-id", ok=True)
+            )
+
+        self.assertEqual(self.mocked_saga_dao.update.call_count, 2)
+
+    def test_commands_are_not_published_on_failure(self):
+        self.mocked_saga_dao.create.side_effect = Exception("database is down")
+        self.mocked_saga_dao.transaction.return_value.__exit__.side_effect = None
+        self.mocked_saga_dao.transaction.return_value.__exit__.return_value = False
+
+        with self.assertRaises(Exception):
+            self.saga_manager.start_saga(MockedSaga, {})
+
+        self.mocked_publisher.publish.assert_not_called()
+
+    def test_commands_are_written_to_outbox(self):
+        mocked_outbox_relay = Mock()
+        mocked_outbox_relay.wake.side_effect = lambda: self.events.append("wake")
+        self.mocked_saga_dao.add_outbox_messages.side_effect = (
+            lambda messages: self.events.append("outbox")
+        )
+        saga_manager = SagaManager(
+            self.mocked_saga_dao,
+            self.mocked_publisher,
+            unit_of_work=True,
+            outbox_relay=mocked_outbox_relay,
+        )
+
+        saga_manager.start_saga(MockedSaga, {})
+
+        self.mocked_publisher.publish.assert_not_called()
+        messages = self.mocked_saga_dao.add_outbox_messages.call_args.args[0]
+        self.assertEqual(
+            messages,
+            [
+                (
+                    "mocked_saga.command",
+                    {
+                        "saga_id": "saga-id",
+                        "name": "create_something",
+                        "payload": {},
+                        "reply_to": "mocked_saga.command_response",
+                    },
+                )
+            ],
+        )
+        self.assertEqual(self.events, ["outbox", "commit", "wake"])
+
+    def test_parallel_step_sends_all_commands(self):
+        self.saga_manager.start_saga(MockedParallelSaga, {})
+
+        self.assertEqual(
+            [call.args[1]["name"] for call in self.mocked_publisher.publish.mock_calls],
+            ["create_something", "create_other"],
+        )
+        self.assertEqual(self.events, ["commit", "publish", "publish"])
+
+        saga = self.mocked_saga_dao.create.call_args.args[0]
+        self.mocked_saga_dao.get_one_by_id.return_value = saga
+        self.saga_manager.handle_saga_command_response(
+            CommandResponse("create_other", saga_id="saga-id", ok=True)
+        )
+        self.assertEqual(saga.get_status(), "processing")
+        self.saga_manager.handle_saga_command_response(
+            CommandResponse("create_something", saga_id="saga-id", ok=True)
+        )
+        self.assertEqual(saga.get_status(), "done")
+
+    def test_records_payload_sizes(self):
+        payload_stats = PayloadStats()
+        saga_manager = SagaManager(
+            self.mocked_saga_dao,
+            self.mocked_publisher,
+            unit_of_work=True,
+            payload_stats=payload_stats,
+        )
+
+        saga_manager.start_saga(MockedParallelSaga, {})
+        saga_manager.start_saga(MockedParallelSaga, {})
+
+        self.assertEqual(
+            payload_stats.stats(),
+            {
+                "create_something": {"count": 2, "total_bytes": 4, "max_bytes": 2},
+                "create_other": {"count": 2, "total_bytes": 4, "max_bytes": 2},
+            },
+        )
+
+    def test_resume_resends_participant_command(self):
+        saga = MockedSaga(
+            SagaAttributes(id="saga-id", data={}, current_step=1, status="compensating")
+        )
+        self.mocked_saga_dao.lock_stale_saga.return_value = saga
+
+        self.assertTrue(self.saga_manager.resume_saga("saga-id", 60))
+
+        self.mocked_saga_dao.lock_stale_saga.assert_called_once_with("saga-id", 60)
+        self.mocked_saga_dao.touch.assert_called_once_with(saga)
+        self.mocked_saga_dao.update.assert_not_called()
+        self.assertEqual(
+            self.mocked_publisher.publish.call_args.args[1]["name"], "cancel_something"
+        )
+        # The participant may have processed the first command.
+        self.assertIsNone(self.mocked_publisher.publish.call_args.kwargs["message_id"])
+        self.assertEqual(self.events, ["commit", "publish"])
+
+    def test_resume_runs_pending_saga(self):
+        saga = MockedSaga(
+            SagaAttributes(id="saga-id", data={}, current_step=0, status="pending")
+        )
+        self.mocked_saga_dao.lock_stale_saga.return_value = saga
+
+        self.assertTrue(self.saga_manager.resume_saga("saga-id", 60))
+
+        self.mocked_saga_dao.update.assert_called_once_with(saga)
+        self.assertEqual(saga.get_status(), "processing")
+        self.assertEqual(self.events, ["commit", "publish"])
+
+    def test_step_timeout_fails_waiting_step(self):
+        saga = MockedSaga(
+            SagaAttributes(
+                id="saga-id",
+                data={},
+                current_step=1,
+                status="processing",
+                awaited_command="create_something",
+            )
+        )
+        self.mocked_saga_dao.get_one_by_id.return_value = saga
+
+        self.saga_manager.handle_step_timeout(
+            "saga-id", 0, "processing", "create_something"
+        )
+        self.saga_manager.handle_step_timeout("saga-id", 1, "processing", "other")
+        self.mocked_saga_dao.update.assert_not_called()
+
+        self.saga_manager.handle_step_timeout(
+            "saga-id", 1, "processing", "create_something"
+        )
+        self.mocked_saga_dao.update.assert_called_once_with(saga)
+        self.assertEqual(saga.get_current_step(), 0)
+        self.assertEqual(saga.get_status(), "failed")
+
+    def test_sets_timeout_handler_of_empty_scheduler(self):
+        step_timeouts = StepTimeoutScheduler(Mock())
+        SagaManager(
+            self.mocked_saga_dao, self.mocked_publisher, step_timeouts=step_timeouts
+        )
+
+        self.assertIsNotNone(step_timeouts.timeout_handler)
+
+    # Keeps the saga in a row with a version. run_between_load_and_update
+    # runs once, after the next saga load and before its update.
+    def store_saga(
+        self,
+        attributes: SagaAttributes,
+        run_between_load_and_update,
+        saga_class: type[Saga] = MockedSaga,
+    ):
+        row = dict(attributes, version=0)
+        pending = [run_between_load_and_update]
+
+        def load(id):
+            return saga_class(SagaAttributes(row))
+
+        def update(saga: Saga):
+            if pending:
+                pending.pop()()
+            if not saga.get_dirty_attributes():
+                return
+            if saga.get_version() != row["version"]:
+                raise SagaConflictError(saga.get_id(), saga.get_version())
+            row.update(saga.attributes, version=row["version"] + 1)
+            saga.set_version(row["version"])
+
+        self.mocked_saga_dao.get_one_by_id.side_effect = load
+        self.mocked_saga_dao.update.side_effect = update
+        return row
+
+    def test_step_timeout_loses_to_concurrent_response(self):
+        row = self.store_saga(
+            SagaAttributes(id="saga-id", data={}, current_step=1, status="processing"),
+            lambda: self.saga_manager.handle_saga_command_response(
+                CommandResponse("create_something", saga_id="saga-id", ok=True)
+            ),
+        )
+
+        self.saga_manager.handle_step_timeout("saga-id", 1, "processing")
+
+        self.assertEqual((row["status"], row["version"]), ("done", 1))
+        self.assertEqual(self.mocked_saga_dao.get_one_by_id.call_count, 3)
+
+    def test_response_loses_to_concurrent_step_timeout(self):
+        row = self.store_saga(
+            SagaAttributes(id="saga-id", data={}, current_step=1, status="processing"),
+            lambda: self.saga_manager.handle_step_timeout("saga-id", 1, "processing"),
+        )
+
+        self.saga_manager.handle_saga_command_response(
+            CommandResponse("create_something", saga_id="saga-id", ok=True)
+        )
+
+        self.assertEqual((row["status"], row["version"]), ("failed", 1))
+        self.assertEqual(self.mocked_saga_dao.get_one_by_id.call_count, 3)
+
+    def test_ignores_duplicate_reply_after_resume(self):
+        row = self.store_saga(
+            SagaAttributes(
+                id="saga-id",
+                data={},
+                current_step=1,
+                status="processing",
+                awaited_command="create_something",
+            ),
+            lambda: None,
+            MockedTwoCommandSaga,
+        )
+        self.mocked_saga_dao.lock_stale_saga.side_effect = (
+            lambda saga_id, _: self.mocked_saga_dao.get_one_by_id(saga_id)
+        )
+        self.saga_manager.resume_saga("saga-id", 60)
+
+        # Both the original command and the resent one are answered.
+        for _ in range(2):
+            self.saga_manager.handle_saga_command_response(
+                CommandResponse("create_something", saga_id="saga-id", ok=True)
+            )
+
+        self.assertEqual(
+            (row["current_step"], row["status"], row["awaited_command"]),
+            (2, "processing", "create_other"),
+        )
+        self.assertEqual(row["version"], 1)
+
+    def test_ignores_late_reply_after_step_timeout(self):
+        row = self.store_saga(
+            SagaAttributes(
+                id="saga-id",
+                data={},
+                current_step=2,
+                status="processing",
+                awaited_command="create_other",
+            ),
+            lambda: None,
+            MockedTwoCommandSaga,
+        )
+
+        self.saga_manager.handle_step_timeout(
+            "saga-id", 2, "processing", "create_other"
+        )
+        self.saga_manager.handle_saga_command_response(
+            CommandResponse("create_other", saga_id="saga-id", ok=True)
+        )
+
+        self.assertEqual(
+            (row["current_step"], row["status"], row["awaited_command"]),
+            (1, "compensating", "cancel_something"),
+        )
+
+    def test_resume_skips_saga_that_is_not_stale(self):
+        self.mocked_saga_dao.lock_stale_saga.return_value = None
+
+        self.assertFalse(self.saga_manager.resume_saga("saga-id", 60))
+
+        self.mocked_publisher.publish.assert_not_called()
+
+
 if __name__ == "__main__":
     unittest.main()
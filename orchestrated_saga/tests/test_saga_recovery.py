@@ -0,0 +1,54 @@
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event
+from unittest.mock import Mock
+from orchestrated_saga.saga_recovery import SagaRecoveryWorker
+
+
+class TestSagaRecoveryWorker(unittest.TestCase):
+    def setUp(self):
+        self.mocked_saga_dao = Mock()
+        self.mocked_saga_manager = Mock()
+        self.worker = SagaRecoveryWorker(
+            self.mocked_saga_manager,
+            self.mocked_saga_dao,
+            Event(),
+            stale_after=60,
+            batch_size=2,
+            batch_delay=0,
+        )
+        self.executor = ThreadPoolExecutor(2)
+        self.addCleanup(self.executor.shutdown)
+
+    def test_pages_through_stale_sagas(self):
+        pages = [[(1, "a"), (2, "b")], [(3, "c")]]
+        self.mocked_saga_dao.get_stale_saga_ids.side_effect = pages
+        self.mocked_saga_manager.resume_saga.side_effect = lambda id, _: id != "b"
+
+        self.assertEqual(self.worker.scan(self.executor), 2)
+
+        self.assertEqual(
+            [call.args for call in self.mocked_saga_dao.get_stale_saga_ids.mock_calls],
+            [(60, 2, None, None), (60, 2, (2, "b"), None)],
+        )
+        self.assertEqual(self.worker.resumed, 2)
+
+    def test_scans_owned_shards(self):
+        self.worker.shards = [0, 2]
+        self.mocked_saga_dao.get_stale_saga_ids.return_value = []
+
+        self.assertEqual(self.worker.scan(self.executor), 0)
+
+        self.mocked_saga_dao.get_stale_saga_ids.assert_called_once_with(
+            60, 2, None, [0, 2]
+        )
+
+    def test_continues_after_failed_resume(self):
+        self.mocked_saga_dao.get_stale_saga_ids.return_value = [(1, "a")]
+        self.mocked_saga_manager.resume_saga.side_effect = ValueError()
+
+        self.assertEqual(self.worker.scan(self.executor), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+import unittest
+from datetime import datetime, timezone
+from threading import Event
+from unittest.mock import Mock
+from orchestrated_saga.saga import Saga, SagaAttributes
+from orchestrated_saga.step import ParticipantStepDef
+from orchestrated_saga.step_timeout_scheduler import StepTimeoutScheduler
+
+
+class MockedSaga(Saga):
+    name = "MockedSaga"
+    step_defs = [ParticipantStepDef(lambda: None, lambda: None, timeout=5)]
+
+
+class TestStepTimeoutScheduler(unittest.TestCase):
+    def setUp(self):
+        self.scheduler = StepTimeoutScheduler(Event())
+
+    def test_sets_timer_of_waiting_saga(self):
+        saga = MockedSaga(
+            SagaAttributes(id="saga-id", data={}, current_step=0, status="processing")
+        )
+        self.scheduler.update(saga)
+        self.assertEqual(len(self.scheduler), 1)
+
+        saga.set_status("done")
+        self.scheduler.update(saga)
+        self.assertEqual(len(self.scheduler), 0)
+
+    def test_loads_timers_of_waiting_sagas(self):
+        updated_at = datetime.now(timezone.utc)
+        mocked_saga_dao = Mock()
+        mocked_saga_dao.get_saga_class.return_value = MockedSaga
+        mocked_saga_dao.get_waiting_sagas.side_effect = [
+            [
+                (updated_at, "a", "MockedSaga", 0, "processing", "create"),
+                (updated_at, "b", "MockedSaga", 1, "processing", "create"),
+            ],
+            [(updated_at, "c", "MockedSaga", 0, "compensating", "cancel")],
+        ]
+
+        self.assertEqual(
+            self.scheduler.load(mocked_saga_dao, batch_size=2, shards=[1]), 2
+        )
+
+        self.assertEqual(
+            mocked_saga_dao.get_waiting_sagas.call_args.args,
+            (2, (updated_at, "b"), [1]),
+        )
+        self.assertEqual(
+            sorted(self.scheduler.wheel.advance(updated_at.timestamp() + 5.1)),
+            [
+                ("a", (0, "processing", "create")),
+                ("c", (0, "compensating", "cancel")),
+            ],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
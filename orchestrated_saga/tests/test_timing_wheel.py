@@ -0,0 +1,51 @@
+import unittest
+from random import Random
+from orchestrated_saga.timing_wheel import TimingWheel
+
+
+class TestTimingWheel(unittest.TestCase):
+    def test_expires_timers_at_their_deadline(self):
+        wheel = TimingWheel(tick=1, now=0)
+        wheel.schedule("a", 3, "value")
+        wheel.schedule("b", 1000)
+
+        self.assertEqual(wheel.advance(2), [])
+        self.assertEqual(wheel.advance(3), [("a", "value")])
+        self.assertEqual(wheel.advance(999), [])
+        self.assertEqual(wheel.advance(1000), [("b", None)])
+        self.assertEqual(len(wheel), 0)
+
+    def test_cancel_and_reschedule(self):
+        wheel = TimingWheel(tick=1, now=0)
+        wheel.schedule("a", 5)
+        wheel.schedule("b", 5)
+        wheel.cancel("a")
+        wheel.schedule("b", 10)
+
+        self.assertEqual(wheel.advance(9), [])
+        self.assertEqual(wheel.advance(10), [("b", None)])
+
+    def test_past_deadlines_expire_on_next_tick(self):
+        wheel = TimingWheel(tick=0.5, now=100)
+        wheel.schedule("a", 50)
+
+        self.assertEqual(wheel.advance(100.5), [("a", None)])
+
+    def test_cascades_timers_across_levels(self):
+        random = Random(1)
+        # 64 ticks of range, so most timers overflow the top level.
+        wheel = TimingWheel(tick=1, now=0, slot_bits=2, levels=3)
+        deadlines = {key: random.randint(1, 500) for key in range(1000)}
+        for key, deadline in deadlines.items():
+            wheel.schedule(key, deadline)
+
+        expired_at = {}
+        for now in range(1, 501):
+            for key, _ in wheel.advance(now):
+                expired_at[key] = now
+
+        self.assertEqual(expired_at, deadlines)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+from math import ceil
+
+
+# Hierarchical timing wheel: levels of 2 ** slot_bits slots each, a slot
+# of level n spans 2 ** (slot_bits * n) ticks. Timers are kept in the
+# slot of the lowest level that will be reached before their deadline
+# and moved down a level when that slot comes up, so scheduling and
+# cancelling are O(1) whatever the number of timers. Timers are keyed,
+# scheduling a key again replaces its timer.
+class TimingWheel:
+    def __init__(
+        self, tick: float, now: float, slot_bits: int = 8, levels: int = 4
+    ) -> None:
+        self.tick = tick
+        self.slot_bits = slot_bits
+        self.slot_mask = (1 << slot_bits) - 1
+        self.levels = levels
+        self.wheels: list[list[dict]] = [
+            [{} for _ in range(1 << slot_bits)] for _ in range(levels)
+        ]
+        self.timers: dict[any, dict] = {}
+        self.current_tick = int(now / tick)
+
+    def __len__(self):
+        return len(self.timers)
+
+    def schedule(self, key: any, deadline: float, value: any = None):
+        self.cancel(key)
+        deadline_tick = max(ceil(deadline / self.tick), self.current_tick + 1)
+        self.__place(key, deadline_tick, value)
+
+    def cancel(self, key: any):
+        slot = self.timers.pop(key, None)
+        if slot is not None:
+            del slot[key]
+
+    # Moves the wheel to now and returns the (key, value)
+    # pairs of the timers that expired.
+    def advance(self, now: float) -> list[tuple[any, any]]:
+        target_tick = int(now / self.tick)
+        expired: list[tuple[any, any]] = []
+
+        while self.current_tick < target_tick:
+            if not self.timers:
+                self.current_tick = target_tick
+                break
+
+            self.current_tick += 1
+            self.__cascade(expired)
+            expired += self.__pop_slot(0, self.current_tick & self.slot_mask)
+
+        return expired
+
+    def __place(self, key: any, deadline_tick: int, value: any):
+        level = 0
+        while level < self.levels - 1 and (
+            deadline_tick >> (self.slot_bits * (level + 1))
+            != self.current_tick >> (self.slot_bits * (level + 1))
+        ):
+            level += 1
+
+        index = (deadline_tick >> (self.slot_bits * level)) & self.slot_mask
+        slot = self.wheels[level][index]
+        slot[key] = (deadline_tick, value)
+        self.timers[key] = slot
+
+    # Moves the timers of the higher level slots that came up down
+    # the wheel, starting from the highest level.
+    def __cascade(self, expired: list[tuple[any, any]]):
+        for level in range(self.levels - 1, 0, -1):
+            if self.current_tick & ((1 << (self.slot_bits * level)) - 1):
+                continue
+
+            index = (self.current_tick >> (self.slot_bits * level)) & self.slot_mask
+            for key, (deadline_tick, value) in self.__pop_slot(level, index):
+                if deadline_tick <= self.current_tick:
+                    expired.append((key, value))
+                else:
+                    self.__place(key, deadline_tick, value)
+
+    def __pop_slot(self, level: int, index: int):
+        slot = self.wheels[level][index]
+        if not slot:
+            return []
+
+        self.wheels[level][index] = {}
+        for key in slot:
+            del self.timers[key]
+
+        if level == 0:
+            return [(key, value) for key, (_, value) in slot.items()]
+        return list(slot.items())
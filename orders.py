@@ -1,4 +1,3 @@
-import json
 import signal
 from threading import Event
 from colorama import init as init_colorama
@@ -21,9 +20,8 @@ def print_order(order: Order):
 
 
 def create_booking_created_handler(publisher: Publisher, orders: dict[str, Order]):
-    def booking_created_handler(body: bytes, _):
+    def booking_created_handler(booking: dict, _):
         # complete order
-        booking = json.loads(body)
         if not booking["order_id"] in orders:
             return
         order = orders[booking["order_id"]]
@@ -34,9 +32,8 @@ def create_booking_created_handler(publisher: Publisher, orders: dict[str, Order
 
 
 def create_booking_failed_handler(publisher: Publisher, orders: dict[str, Order]):
-    def booking_failed_handler(body: bytes, _):
+    def booking_failed_handler(booking: dict, _):
         # fail order
-        booking = json.loads(body)
         if not booking["order_id"] in orders:
             return
         order = orders[booking["order_id"]]
@@ -47,9 +44,8 @@ def create_booking_failed_handler(publisher: Publisher, orders: dict[str, Order]
 
 
 def create_payment_failed_handler(publisher: Publisher, orders: dict[str, Order]):
-    def payment_failed_handler(body: bytes, _):
+    def payment_failed_handler(payment: dict, _):
         # fail order
-        payment = json.loads(body)
         if not payment["order_id"] in orders:
             return
         order = orders[payment["order_id"]]
@@ -1,4 +1,4 @@
-import json
+import argparse
 import signal
 from threading import Event
 from colorama import init as init_colorama
@@ -6,14 +6,26 @@ from pika.adapters.blocking_connection import BlockingConnection
 from pika.connection import ConnectionParameters
 import psycopg2
 from initialize_messaging import initialize_messaging
-from messaging import Publisher
-from messaging.subscriber import create_subscription_thread
-from orchestrated_saga.command import Command
+from messaging import PublisherPool
+from messaging.dedup import MessageDeduplicator
+from messaging.subscriber import create_subscription_thread, get_message_id
+from orchestrated_saga.command import Command, get_response_queue_name
+from orchestrated_saga.command_queues import (
+    initialize_command_queues,
+    initialize_response_queues,
+)
 from orchestrated_saga.command_response import CommandResponse
+from orchestrated_saga.connection_pool import ConnectionPool
+from orchestrated_saga.outbox_relay import OutboxRelay
+from orchestrated_saga.response_shards import get_owned_shards
 from orchestrated_saga.saga import Saga
+from orchestrated_saga.saga_archiver import SagaArchiver
+from orchestrated_saga.saga_cache import SagaCache, SagaCacheInvalidator
 from orchestrated_saga.saga_dao import SagaDao
 from orchestrated_saga.saga_manager import SagaManager
+from orchestrated_saga.saga_recovery import SagaRecoveryWorker
 from orchestrated_saga.step_builder import StepBuilder
+from orchestrated_saga.step_timeout_scheduler import StepTimeoutScheduler
 from utils import generate_id, get_random_color, colored, ShutdownException
 
 
@@ -31,11 +43,18 @@ def print_order(order: Order):
     print("Order", colored(str(order.id), order.color), "-", order.status)
 
 
+def get_command_response_saga_id(response_body: dict, _key: str):
+    return response_body["saga_id"]
+
+
 def create_command_response_handler(saga_manager: SagaManager):
-    def command_response_handler(body: bytes, _key: str):
-        response_body = json.loads(body)
+    def command_response_handler(response_body: dict, _key: str):
         response = CommandResponse(
-            response_body["name"], response_body["saga_id"], response_body["ok"]
+            response_body["name"],
+            response_body["saga_id"],
+            response_body["ok"],
+            message_id=get_message_id(),
+            member=response_body.get("member"),
         )
         saga_manager.handle_saga_command_response(response)
 
@@ -57,6 +76,11 @@ class CreateBookingCommand(Command):
         super().__init__("create_booking", saga_id, data)
 
 
+class CancelBookingCommand(Command):
+    def __init__(self, saga_id: str, data: dict):
+        super().__init__("cancel_booking", saga_id, data)
+
+
 def create_order(saga: Saga):
     order = Order(saga.get_data()["id"], "pending", saga.get_data()["color"])
     orders[order.id] = order
@@ -87,15 +111,34 @@ def create_booking(saga: Saga):
     return CreateBookingCommand(saga.get_id(), saga.get_data())
 
 
+def cancel_booking(saga: Saga):
+    return CancelBookingCommand(saga.get_id(), saga.get_data())
+
+
 class CreateOrderSaga(Saga):
-    command_key = "orders"
+    command_key = "create_order_saga"
+    response_shards = 4
     step_defs = [
         StepBuilder().withAction(create_order).withCompensation(cancel_order).build(),
         StepBuilder()
-        .withCommand(create_payment)
-        .withCompensation(cancel_payment)
+        .withParallel(
+            StepBuilder()
+            .withCommand(create_payment)
+            .withCompensation(cancel_payment)
+            .withParticipant("payments")
+            .withPayload("id", "color")
+            .withCompensationPayload("id")
+            .build(),
+            StepBuilder()
+            .withCommand(create_booking)
+            .withCompensation(cancel_booking)
+            .withParticipant("bookings")
+            .withPayload("id", "color")
+            .withCompensationPayload("id")
+            .build(),
+        )
+        .withTimeout(30)
         .build(),
-        StepBuilder().withCommand(create_booking).build(),
         StepBuilder().withAction(complete_order).build(),
     ]
     name = "CreateOrderSaga"
@@ -104,35 +147,108 @@ class CreateOrderSaga(Saga):
 def main():
     init_colorama(autoreset=True)
 
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument(
+        "--instance", default="orders", help="name of this orchestrator instance"
+    )
+    arg_parser.add_argument(
+        "--instances",
+        default="orders",
+        help="comma separated names of all the orchestrator instances",
+    )
+    arg_parser.add_argument(
+        "--cache-invalidation",
+        action="store_true",
+        help="drop sagas updated by other instances from the saga cache, "
+        + "needs optional/saga_update_notifications.sql",
+    )
+    args = arg_parser.parse_args()
+
+    # The instances split the response shards among themselves.
+    shards = get_owned_shards(
+        args.instance, args.instances.split(","), CreateOrderSaga.response_shards
+    )
+    print(colored(f"[x] Handling response shards {shards}", "GREEN"))
+
     connection = BlockingConnection(ConnectionParameters(host="localhost"))
     channel = connection.channel()
     initialize_messaging(channel)
+    initialize_command_queues(channel, CreateOrderSaga)
+    initialize_response_queues(channel, CreateOrderSaga)
     channel.close()
     connection.close()
 
     ev_stopping = Event()
 
-    publisher = Publisher(ev_stopping)
+    # Commands of a participant keep their order on one connection.
+    publisher = PublisherPool(ev_stopping, size=2, affinity="routing_key", confirm=True)
     publisher.start()
 
-    connection = psycopg2.connect(
-        "host=localhost port=5432 dbname=saga user=postgres password=postgres"
+    dsn = "host=localhost port=5432 dbname=saga user=postgres password=postgres"
+    saga_classes = {
+        "CreateOrderSaga": CreateOrderSaga,
+    }
+    # The instance name tags the writes of this instance for the
+    # optional invalidation of the saga caches of other instances.
+    instance_name = f"orders-{generate_id()}"
+    pool = ConnectionPool(
+        lambda: psycopg2.connect(dsn, application_name=instance_name), max_size=10
     )
-    saga_dao = SagaDao(
-        connection,
-        {
-            "CreateOrderSaga": CreateOrderSaga,
-        },
+    saga_cache = SagaCache()
+    saga_dao = SagaDao(pool, saga_classes, cache=saga_cache)
+
+    # Without invalidation a saga cached while another instance changed
+    # it fails the version check on save and is handled again.
+    saga_cache_invalidator = None
+    if args.cache_invalidation:
+        saga_cache_invalidator = SagaCacheInvalidator(
+            saga_cache, lambda: psycopg2.connect(dsn), instance_name, ev_stopping
+        )
+        saga_cache_invalidator.start()
+
+    outbox_relay = OutboxRelay(saga_dao, publisher, ev_stopping)
+    outbox_relay.start()
+
+    step_timeouts = StepTimeoutScheduler(ev_stopping)
+
+    saga_manager = SagaManager(
+        saga_dao,
+        publisher,
+        unit_of_work=True,
+        outbox_relay=outbox_relay,
+        step_timeouts=step_timeouts,
+        deduplicate=True,
     )
-    saga_manager = SagaManager(saga_dao, publisher)
 
-    command_response_handler = create_command_response_handler(saga_manager)
+    # Sagas of other shards are timed out and recovered by their owners.
+    step_timeouts.load(saga_dao, shards=shards)
+    step_timeouts.start()
 
-    command_response_thread = create_subscription_thread(
-        queue_name="create_order_saga_command_responses",
-        callback=command_response_handler,
-        ev_stopping=ev_stopping,
+    saga_recovery_worker = SagaRecoveryWorker(
+        saga_manager, saga_dao, ev_stopping, shards=shards
     )
+    saga_recovery_worker.start()
+
+    saga_archiver = SagaArchiver(saga_dao, ev_stopping)
+    saga_archiver.start()
+
+    command_response_handler = create_command_response_handler(saga_manager)
+
+    deduplicator = MessageDeduplicator()
+    command_response_threads = [
+        create_subscription_thread(
+            queue_name=get_response_queue_name(CreateOrderSaga.command_key, shard),
+            callback=command_response_handler,
+            ev_stopping=ev_stopping,
+            workers=2,
+            shard_key=get_command_response_saga_id,
+            prefetch_count=100,
+            ack_batch_size=20,
+            ack_batch_interval=0.05,
+            deduplicator=deduplicator,
+        )
+        for shard in shards
+    ]
 
     def quit():
         print("Exiting...")
@@ -162,8 +278,17 @@ def main():
     except ShutdownException:
         pass
 
+    outbox_relay.join()
+    if saga_cache_invalidator is not None:
+        saga_cache_invalidator.join()
+    saga_recovery_worker.join()
+    saga_archiver.join()
+    step_timeouts.join()
     publisher.join()
-    command_response_thread.join()
+    for command_response_thread in command_response_threads:
+        command_response_thread.join()
+    pool.close()
 
 
-main()
+if __name__ == "__main__":
+    main()
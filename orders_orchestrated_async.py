@@ -0,0 +1,96 @@
+import asyncio
+from colorama import init as init_colorama
+from pika.adapters.blocking_connection import BlockingConnection
+from pika.connection import ConnectionParameters
+import psycopg2
+from initialize_messaging import initialize_messaging
+from messaging.async_publisher import AsyncPublisher
+from messaging.async_subscriber import run_async_subscription
+from orchestrated_saga.async_saga_dao import AsyncSagaDao
+from orchestrated_saga.async_saga_manager import AsyncSagaManager
+from orchestrated_saga.command_queues import (
+    initialize_command_queues,
+    initialize_response_queues,
+)
+from orchestrated_saga.command_response import CommandResponse
+from orchestrated_saga.connection_pool import ConnectionPool
+from orchestrated_saga.saga_dao import SagaDao
+from orders_orchestrated import CreateOrderSaga
+from utils import generate_id, get_random_color
+
+
+def create_command_response_handler(saga_manager: AsyncSagaManager):
+    async def command_response_handler(response_body: dict, _key: str):
+        response = CommandResponse(
+            response_body["name"],
+            response_body["saga_id"],
+            response_body["ok"],
+            member=response_body.get("member"),
+        )
+        await saga_manager.handle_saga_command_response(response)
+
+    return command_response_handler
+
+
+async def main():
+    init_colorama(autoreset=True)
+
+    connection = BlockingConnection(ConnectionParameters(host="localhost"))
+    channel = connection.channel()
+    initialize_messaging(channel)
+    initialize_command_queues(channel, CreateOrderSaga)
+    response_queues = initialize_response_queues(channel, CreateOrderSaga)
+    channel.close()
+    connection.close()
+
+    ev_stopping = asyncio.Event()
+
+    publisher = AsyncPublisher(confirm=True)
+    await publisher.connect()
+
+    dsn = "host=localhost port=5432 dbname=saga user=postgres password=postgres"
+    pool = ConnectionPool(lambda: psycopg2.connect(dsn), max_size=10)
+    saga_dao = AsyncSagaDao(SagaDao(pool, {"CreateOrderSaga": CreateOrderSaga}))
+    saga_manager = AsyncSagaManager(saga_dao, publisher)
+
+    # A single instance consumes the responses of all the shards.
+    subscriptions = [
+        asyncio.create_task(
+            run_async_subscription(
+                queue_name,
+                create_command_response_handler(saga_manager),
+                ev_stopping,
+            )
+        )
+        for queue_name in response_queues
+    ]
+
+    loop = asyncio.get_running_loop()
+
+    try:
+        while True:
+            command = await loop.run_in_executor(None, input)
+
+            if command not in {"", "create", "exit"}:
+                print('Enter "create" or "exit" or just hit ENTER')
+                continue
+
+            if command == "exit":
+                break
+
+            await saga_manager.start_saga(
+                CreateOrderSaga, {"id": generate_id(), "color": get_random_color()}
+            )
+    except (KeyboardInterrupt, EOFError):
+        pass
+
+    print("Exiting...")
+    ev_stopping.set()
+    await asyncio.gather(*subscriptions)
+    await publisher.close()
+    saga_dao.close()
+    pool.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,5 +1,4 @@
 import argparse
-import json
 import signal
 from threading import Event
 from colorama import init as init_colorama
@@ -32,9 +31,8 @@ def print_payment(payment: Payment):
 def create_order_created_handler(
     publisher: Publisher, payments: dict[str, Payment], ev_should_fail: Event
 ):
-    def order_created_handler(body: bytes, _):
+    def order_created_handler(order: dict, _):
         # create payment
-        order = json.loads(body)
         payment = Payment(generate_id(), order["id"], "pending", order["color"])
         payments[payment.id] = payment
 
@@ -64,9 +62,8 @@ def create_order_created_handler(
 
 
 def create_booking_failed_handler(publisher: Publisher, payments: dict[str, Payment]):
-    def booking_failed_handler(body: bytes, _):
+    def booking_failed_handler(booking: dict, _):
         # cancel payment
-        booking = json.loads(body)
         if not booking["payment_id"] in payments:
             return
         payment = payments[booking["payment_id"]]
@@ -1,13 +1,13 @@
 import argparse
-import json
 import signal
 from threading import Event
 from colorama import init as init_colorama
 from pika.adapters.blocking_connection import BlockingConnection
 from pika.connection import ConnectionParameters
 from initialize_messaging import initialize_messaging
-from messaging import Publisher, create_subscription_thread
+from messaging import MessageDeduplicator, Publisher, create_subscription_thread
 from orchestrated_saga.command import Command
+from orchestrated_saga.command_queues import initialize_command_queue
 from orchestrated_saga.command_response import CommandResponse
 from utils import colored, generate_id
 
@@ -37,7 +37,9 @@ def handle_create_payment_command(
     publisher: Publisher,
     payments: dict[str, Payment],
 ):
-    response = CommandResponse(command.name, command.saga_id, False)
+    response = CommandResponse(
+        command.name, command.saga_id, False, member=command.member
+    )
     payment: Payment | None = None
 
     if not should_fail:
@@ -51,8 +53,13 @@ def handle_create_payment_command(
         response.ok = True
 
     publisher.publish(
-        "create_order_saga.command_response",
-        {"saga_id": response.saga_id, "name": response.name, "ok": response.ok},
+        command.reply_to,
+        {
+            "saga_id": response.saga_id,
+            "name": response.name,
+            "ok": response.ok,
+            "member": response.member,
+        },
     )
 
     if payment:
@@ -75,11 +82,19 @@ def handle_cancel_payment_command(
     payment = next(x for x in payments.values() if x.order_id == command.payload["id"])
     payment.status = "canceled"
     response = CommandResponse(
-        command.name, command.saga_id, False if should_fail else True
+        command.name,
+        command.saga_id,
+        False if should_fail else True,
+        member=command.member,
     )
     publisher.publish(
-        "create_order_saga.command_response",
-        {"saga_id": response.saga_id, "name": response.name, "ok": response.ok},
+        command.reply_to,
+        {
+            "saga_id": response.saga_id,
+            "name": response.name,
+            "ok": response.ok,
+            "member": response.member,
+        },
     )
     print_payment(payment)
 
@@ -87,11 +102,14 @@ def handle_cancel_payment_command(
 def create_create_order_saga_handler(
     publisher: Publisher, payments: dict[str, Payment], ev_should_fail: Event
 ):
-    def create_order_saga_handler(body: bytes, _key: str):
+    def create_order_saga_handler(command_body: dict, _key: str):
         should_fail = ev_should_fail.is_set()
-        command_body = json.loads(body)
         command = Command(
-            command_body["name"], command_body["saga_id"], command_body["payload"]
+            command_body["name"],
+            command_body["saga_id"],
+            command_body["payload"],
+            reply_to=command_body["reply_to"],
+            member=command_body.get("member"),
         )
 
         if command.name == "create_payment":
@@ -125,6 +143,7 @@ def main():
     connection = BlockingConnection(ConnectionParameters(host="localhost"))
     channel = connection.channel()
     initialize_messaging(channel)
+    queue_name = initialize_command_queue(channel, "create_order_saga", "payments")
     channel.close()
     connection.close()
 
@@ -139,9 +158,10 @@ def main():
     )
 
     create_order_saga_handler_thread = create_subscription_thread(
-        queue_name="payments_create_order_saga_commands",
+        queue_name=queue_name,
         callback=create_order_saga_handler,
         ev_stopping=ev_stopping,
+        deduplicator=MessageDeduplicator(),
     )
 
     def exit_signal_handler(signum, frame):
@@ -154,4 +174,5 @@ def main():
     publisher.join()
 
 
-main()
+if __name__ == "__main__":
+    main()